@@ -0,0 +1,94 @@
+'''
+time the clustering graph mode on synthetic listings
+
+usage (from the repo root):
+    python benchmarks/bench_clustering.py --listings 50000
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing.ml_models import run_KMeans, cached_KMeans
+
+
+def make_listings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # a few neighbourhoods around a city center, prices depend on the neighbourhood
+    centers = rng.normal([40.7128, -74.0060], 0.05, size=(12, 2))
+    neighbourhood = rng.integers(0, len(centers), n)
+    coords = centers[neighbourhood] + rng.normal(0, 0.01, size=(n, 2))
+    price = rng.lognormal(13.5, 0.4, n) * (1 + neighbourhood / 12)
+    lats, lngs, price = coords[:, 0].tolist(), coords[:, 1].tolist(), price.round(-3).tolist()
+    urls = ['https://www.zillow.com/homedetails/{}_zpid/'.format(i) for i in range(n)]
+    # the db returns nulls for listings without coordinates
+    for i in range(0, n, 97):
+        lats[i] = None
+    return lats, lngs, price, urls
+
+
+'''
+the clustering as it was before, kept here as the baseline
+'''
+def legacy_KMeans(lats, lngs, price, urls):
+    from sklearn.cluster import KMeans
+    transpose = np.array([lats, lngs, price, urls]).T
+    filtered = []
+    for i in range(len(transpose)):
+        is_not_null = True
+        for j in range(len(transpose[0])):
+            if transpose[i][j] is None:
+                is_not_null = False
+                break
+        if is_not_null:
+            filtered.append(transpose[i])
+    [lats, lngs, price, urls] = np.array(filtered).T.tolist()
+    coords = np.array([lats, lngs]).T
+    best_k = int(np.sqrt(len(price)/2))
+    kmeans = KMeans(n_clusters=best_k, max_iter=1000, init='k-means++').fit(coords, sample_weight=price)
+    labels = kmeans.labels_
+    label_prices = dict()
+    for i in range(best_k):
+        group = []
+        for j, label in enumerate(labels):
+            if label == i:
+                group.append(price[j])
+        label_prices[i] = statistics.median(group)
+    return [label_prices[label] for label in labels]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listings', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy', action='store_true', help='also time the old clustering (slow)')
+    args = parser.parse_args()
+
+    lats, lngs, price, urls = make_listings(args.listings)
+    cold = [timed(run_KMeans, lats, lngs, price, urls)[0] for _ in range(args.repeat)]
+    _, result = timed(run_KMeans, lats, lngs, price, urls)
+    warm = [timed(run_KMeans, lats, lngs, price, urls, init_centers=result['centers'])[0] for _ in range(args.repeat)]
+
+    cached_KMeans('bench', 'bench', lats, lngs, price, urls)
+    cached = [timed(cached_KMeans, 'bench', 'bench', lats, lngs, price, urls)[0] for _ in range(args.repeat)]
+
+    print('listings: {}, clusters: {}'.format(args.listings, len(result['centers'])))
+    print('cold start (k-means++): median {:.0f} ms'.format(statistics.median(cold) * 1000))
+    print('warm start (cached centroids): median {:.0f} ms'.format(statistics.median(warm) * 1000))
+    print('cached result: median {:.2f} ms'.format(statistics.median(cached) * 1000))
+    if args.legacy:
+        legacy, _ = timed(legacy_KMeans, lats, lngs, price, urls)
+        print('legacy KMeans: {:.0f} ms'.format(legacy * 1000))
+
+
+if __name__ == '__main__':
+    main()
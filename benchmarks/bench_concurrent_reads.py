@@ -0,0 +1,134 @@
+'''
+read latency of the map query while a new month is ingested in another process
+compares the old connection handling (a new connection per request, rollback journal)
+with the pooled read-only connections on a WAL database
+
+usage (from the repo root):
+    python benchmarks/bench_concurrent_reads.py --rows 200000 --readers 4
+'''
+import argparse
+import glob
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from housing import app
+from housing.db import get_db, close_read_connections
+from housing.ingest import write_housing
+from housing.query_builder import housing_query
+
+
+SQL_DIR = os.path.join(ROOT, 'housing', 'sql')
+CITIES = ['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ']
+READ_MONTH = '2022-11'
+WRITE_MONTH = '2022-12'
+
+WRITER = '''
+import random, sqlite3, sys, time
+sys.path.insert(0, {root!r})
+from housing.ingest import write_housing
+db = sqlite3.connect(sys.argv[1], timeout=30)
+db.execute('PRAGMA journal_mode = {journal_mode}')
+rng = random.Random(1)
+rows = [('{month}', None, rng.randint(150, 3000) * 1000, rng.randint(500, 5000), rng.choice([1, 2, 3]), rng.choice([1, 2, 3, 4]), 30,
+         'https://www.zillow.com/homedetails/{{}}_zpid/'.format(i), 40 + rng.random(), -74 - rng.random(), rng.randint(1, 3))
+        for i in range({rows})]
+start = time.perf_counter()
+with db:
+    write_housing(db, rows)
+print(time.perf_counter() - start)
+'''
+
+
+def make_db(path, rows, journal_mode):
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+    for file in [os.path.join(SQL_DIR, 'schema.sql'), os.path.join(SQL_DIR, 'initial_data.sql')] + sorted(glob.glob(os.path.join(SQL_DIR, 'migrations', '*.sql'))):
+        with open(file) as f:
+            db.executescript(f.read())
+    rng = random.Random(0)
+    with db:
+        write_housing(db, [(READ_MONTH, None, rng.randint(150, 3000) * 1000, rng.randint(500, 5000), rng.choice([1, 2, 3]), rng.choice([1, 2, 3, 4]), 30,
+                           'https://www.zillow.com/homedetails/{}_zpid/'.format(i), 40 + rng.random(), -74 - rng.random(), rng.randint(1, 3))
+                          for i in range(rows)])
+    db.close()
+
+
+'''
+the map query of one request, through a new connection like the old get_db or through the pooled one
+'''
+def read_once(path, pooled):
+    sql, params = housing_query(['price', 'zillow_url', 'house_lat', 'house_lng'], CITIES, READ_MONTH)
+    if pooled:
+        with app.app_context():
+            return len(get_db().execute(sql, params).fetchall())
+    db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db.row_factory = sqlite3.Row
+    try:
+        return len(db.execute(sql, params).fetchall())
+    finally:
+        db.close()
+
+
+def reader(path, pooled, stop, latencies, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            read_once(path, pooled)
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            errors.append(time.perf_counter() - start)
+    if pooled:
+        close_read_connections()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def run(tmp, name, journal_mode, pooled, args):
+    path = os.path.join(tmp, name + '.sqlite')
+    make_db(path, args.base_rows, journal_mode)
+    app.config['DATABASE'] = path
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=reader, args=(path, pooled, stop, latencies, errors)) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1)
+    idle = list(latencies)
+    latencies.clear()
+    writer = subprocess.run([sys.executable, '-c', WRITER.format(root=ROOT, journal_mode=journal_mode, month=WRITE_MONTH, rows=args.rows), path],
+                            capture_output=True, text=True, check=True)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print('{:<34s} idle p50 {:6.1f}ms | during ingest p50 {:6.1f}ms p99 {:7.1f}ms max {:7.1f}ms, {:4d} reads, {} errors, ingest {:.2f}s'.format(
+        name, statistics.median(idle) * 1000, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+        max(latencies, default=float('nan')) * 1000, len(latencies), len(errors), float(writer.stdout)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-rows', type=int, default=20000, help='listings of the month the readers query')
+    parser.add_argument('--rows', type=int, default=200000, help='listings of the month being ingested')
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    app.config['CHECK_QUERY_PLANS'] = False
+    with tempfile.TemporaryDirectory() as tmp:
+        run(tmp, 'new connection, rollback journal', 'delete', False, args)
+        run(tmp, 'pooled read-only, WAL', 'wal', True, args)
+
+
+if __name__ == '__main__':
+    main()
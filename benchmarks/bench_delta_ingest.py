@@ -0,0 +1,106 @@
+'''
+database size and ingest time per month of the old city_housing table against listing + listing_observation
+every month relists the same listings, a share of them with a new price, plus a few new ones
+the last run ingests the final month a second time to show that it leaves the same rows
+
+usage (from the repo root):
+    python benchmarks/bench_delta_ingest.py --listings 50000 --months 12 --price-changes 0.1
+'''
+import argparse
+import glob
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from housing.ingest import columns, housing_columns, bulk_insert_city, frame_to_records
+
+
+SQL_DIR = os.path.join(ROOT, 'housing', 'sql')
+
+
+'''
+a database with the migrations up to last_migration (all of them with None), the city_housing table with its indexes and R*Tree before 008
+'''
+def new_db(path, last_migration):
+    db = sqlite3.connect(path)
+    files = [os.path.join(SQL_DIR, 'schema.sql'), os.path.join(SQL_DIR, 'initial_data.sql')]
+    files += [file for file in sorted(glob.glob(os.path.join(SQL_DIR, 'migrations', '*.sql')))
+              if last_migration is None or int(os.path.basename(file).split('_')[0]) <= last_migration]
+    for file in files:
+        with open(file) as f:
+            db.executescript(f.read())
+    return db
+
+
+'''
+the old single table is written directly, it has no listing table to upsert into
+'''
+def insert_table(db, df, city_idx):
+    with db:
+        db.executemany('INSERT INTO city_housing ({}) VALUES ({})'.format(', '.join(housing_columns), ', '.join('?' * len(housing_columns))),
+                       frame_to_records(df, city_idx))
+
+
+'''
+parsed crawl frames of every month, the way parse_crawled_frame returns them
+'''
+def make_months(listings, months, price_changes):
+    rng = random.Random(0)
+    current = [[i, rng.randint(150, 3000) * 1000, rng.randint(500, 5000), rng.choice([1, 2, 3]), rng.choice([1, 2, 3, 4]),
+                40 + rng.random(), -74 - rng.random()] for i in range(listings)]
+    frames = []
+    for m in range(months):
+        month = '{}-{:02d}'.format(2022 + m // 12, m % 12 + 1)
+        for listing in current:
+            if rng.random() < price_changes:
+                listing[1] = rng.randint(150, 3000) * 1000
+        frames.append((month, pd.DataFrame(
+            [(month, '{} Main St'.format(i), price, area, baths, beds, 30 * m, 'https://www.zillow.com/homedetails/{}_zpid/'.format(i), lat, lng)
+             for i, price, area, baths, beds, lat, lng in current], columns=columns)))
+        # a few listings are new every month
+        current += [[len(current) + i, rng.randint(150, 3000) * 1000, rng.randint(500, 5000), rng.choice([1, 2, 3]),
+                     rng.choice([1, 2, 3, 4]), 40 + rng.random(), -74 - rng.random()] for i in range(listings // 50)]
+    return frames
+
+
+def run(path, frames, last_migration):
+    db = new_db(path, last_migration)
+    insert = bulk_insert_city if last_migration is None else insert_table
+    start = time.perf_counter()
+    for month, df in frames:
+        insert(db, df, 1)
+    elapsed = time.perf_counter() - start
+    db.execute('VACUUM')
+    return db, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listings', type=int, default=50000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--price-changes', type=float, default=0.1, help='share of listings with a new price every month')
+    args = parser.parse_args()
+
+    frames = make_months(args.listings, args.months, args.price_changes)
+    rows = sum(len(df) for _, df in frames)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, last_migration in [('city_housing table', 7), ('listing + listing_observation', None)]:
+            path = os.path.join(tmp, name.replace(' ', '_') + '.sqlite')
+            db, elapsed = run(path, frames, last_migration)
+            print('{:<30s} {} rows in {:.2f}s, {:.1f} MB'.format(name, rows, elapsed, os.path.getsize(path) / 2 ** 20))
+
+        counts = lambda: [db.execute('select count(*) from {}'.format(table)).fetchone()[0] for table in ['listing', 'listing_observation']]
+        before = counts()
+        start = time.perf_counter()
+        bulk_insert_city(db, frames[-1][1], 1)
+        print('ingesting {} again: {:.2f}s, listings and observations {} -> {}'.format(frames[-1][0], time.perf_counter() - start, before, counts()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''
+run the Google Places fetcher of init-db against a local stub server
+the stub answers nearby searches with a few pages of fake places, adds latency,
+and fails some requests so the retries and the checkpoint get exercised
+the last runs fill the response cache and replay it with the server shut down
+
+usage (from the repo root):
+    python benchmarks/bench_gmap_fetch.py --latency 0.05 --workers 8
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing.utils.gmap import fetch_all_places, load_checkpoint
+from housing.utils.response_cache import ResponseCache
+
+
+cities = {'Princeton,NJ': (40.3573, -74.6672), 'West Windsor,NJ': (40.2983, -74.6186),
+          'Lawrence,NJ': (40.2778, -74.7294), 'Seattle,WA': (47.6062, -122.3321), 'NYC,NY': (40.7128, -74.0060)}
+layout_types = ['school', 'shopping_malls', 'supermarket', 'train_station', 'hospital']
+
+
+'''
+nearby search stub, every search has `pages` pages of 20 places
+page tokens are "<location>|<type>|<page>", the stub does not make them wait
+'''
+def make_handler(latency, pages, error_rate, broken_type=None):
+    class StubHandler(BaseHTTPRequestHandler):
+        requests_served = 0
+        lock = threading.Lock()
+
+        def do_GET(self):
+            with StubHandler.lock:
+                StubHandler.requests_served += 1
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            if 'pagetoken' in query:
+                location, nearby_type, page = query['pagetoken'].split('|')
+                page = int(page)
+            else:
+                location, nearby_type, page = query['location'], query['type'], 0
+            if nearby_type == broken_type:
+                self.send_response(500)
+                self.end_headers()
+                return
+            lat, lng = [float(v) for v in location.split(',')]
+            body = {'status': 'OK', 'results': [
+                {'name': '{} {} {} {}'.format(location, nearby_type, page, i),
+                 'geometry': {'location': {'lat': lat + i * 1e-3, 'lng': lng + page * 1e-3}},
+                 'rating': 4.0} for i in range(20)]}
+            if page + 1 < pages:
+                body['next_page_token'] = '{}|{}|{}'.format(location, nearby_type, page + 1)
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return StubHandler
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/nearbysearch/json'.format(server.server_address[1])
+
+
+def run(jobs, url, checkpoint, workers, rate, page_token_delay, cache=None):
+    start = time.perf_counter()
+    res = fetch_all_places(jobs, 'stub-key', checkpoint=checkpoint, workers=workers, rate=rate, url=url,
+                           page_token_delay=page_token_delay, backoff=0.05, cache=cache)
+    return res, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the stub waits per request')
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50, help='requests per second')
+    parser.add_argument('--page-token-delay', type=float, default=0.1)
+    args = parser.parse_args()
+
+    jobs = [(city, coords, layout) for city, coords in cities.items() for layout in layout_types]
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = make_handler(args.latency, args.pages, args.error_rate)
+        server, url = serve(handler)
+        expected = None
+        for workers in [1, args.workers]:
+            checkpoint = os.path.join(tmp, 'checkpoint-{}.jsonl'.format(workers))
+            handler.requests_served = 0
+            res, elapsed = run(jobs, url, checkpoint, workers, args.rate, args.page_token_delay)
+            expected = expected or res
+            assert res == expected
+            print('workers={:<3d} {} searches, {} places, {} requests in {:.2f}s'.format(
+                workers, len(jobs), len(res), handler.requests_served, elapsed))
+        server.shutdown()
+
+        # one layout type keeps failing: the run raises, the other searches are checkpointed
+        checkpoint = os.path.join(tmp, 'checkpoint-resume.jsonl')
+        server, url = serve(make_handler(args.latency, args.pages, 0, broken_type='hospital'))
+        try:
+            run(jobs, url, checkpoint, args.workers, args.rate, args.page_token_delay)
+        except RuntimeError as e:
+            print('first run failed as expected: {} of {} searches checkpointed'.format(len(load_checkpoint(checkpoint)), len(jobs)))
+        server.shutdown()
+
+        # the rerun only fetches the missing searches
+        handler = make_handler(args.latency, args.pages, 0)
+        server, url = serve(handler)
+        res, elapsed = run(jobs, url, checkpoint, args.workers, args.rate, args.page_token_delay)
+        assert res == expected
+        print('resumed run: {} requests in {:.2f}s, same {} places'.format(handler.requests_served, elapsed, len(res)))
+
+        # a run through the response cache fills it, a replay only run needs no server at all
+        cache_dir = os.path.join(tmp, 'cache')
+        handler.requests_served = 0
+        res, elapsed = run(jobs, url, None, args.workers, args.rate, args.page_token_delay, cache=ResponseCache(cache_dir))
+        assert res == expected
+        print('cached run: {} requests in {:.2f}s'.format(handler.requests_served, elapsed))
+        server.shutdown()
+        server.server_close()
+        cache = ResponseCache(cache_dir, replay_only=True)
+        res, elapsed = run(jobs, url, None, args.workers, args.rate, args.page_token_delay, cache=cache)
+        assert res == expected
+        print('replay only run: {} hits, {} misses in {:.2f}s, same {} places'.format(cache.hits, cache.misses, elapsed, len(res)))
+
+
+if __name__ == '__main__':
+    main()
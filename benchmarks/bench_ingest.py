@@ -0,0 +1,158 @@
+'''
+compare the bulk ingest path against the old row-by-row loop
+and the chunked ingest against the bulk path, with the peak memory traced by tracemalloc
+
+usage (from the repo root):
+    python benchmarks/bench_ingest.py --rows 50000 --cities 5 --workers 4 --chunksize 10000
+'''
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing import app
+from housing.db import migrate_db
+from housing.ingest import city2idx, columns, ingest_month
+
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'housing', 'sql')
+MONTH = '2022-11'
+
+
+def make_crawled_csv(path, city, rows):
+    rng = random.Random(city)
+    records = []
+    for i in range(rows):
+        if rng.random() < 0.7:
+            variable_data = "{'type': 'DAYS_ON', 'text': '%d days on Zillow'}" % rng.randint(0, 120)
+        else:
+            variable_data = "{'type': 'OPEN_HOUSE', 'text': 'Open: Sat 1-3pm'}"
+        records.append({
+            'crawled_month': MONTH,
+            'addressStreet': '{} Main St'.format(i),
+            'unformattedPrice': rng.randint(150, 3000) * 1000,
+            'area': rng.randint(500, 5000),
+            'baths': rng.choice([1, 1.5, 2, 2.5, 3]),
+            'beds': rng.choice([1, 2, 3, 4, 5]),
+            'detailUrl': 'https://www.zillow.com/homedetails/{}-{}_zpid/'.format(city, i),
+            'latLong': "{'latitude': %.6f, 'longitude': %.6f}" % (40 + rng.random(), -74 - rng.random()),
+            'variableData': variable_data,
+            # zillow exports carry many more columns than the ones we keep
+            'zpid': 10000000 + i,
+            'statusType': 'FOR_SALE',
+            'imgSrc': 'https://photos.zillowstatic.com/fp/{:032x}-p_e.jpg'.format(rng.getrandbits(128)),
+            'hdpData': "{'homeInfo': {'zpid': %d, 'homeType': 'SINGLE_FAMILY', 'homeStatus': 'FOR_SALE', 'isFeatured': False}}" % (10000000 + i),
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+'''
+a database set up like init-db does, with every migration, so the rows are written to listing and listing_observation
+legacy leaves out the migrations, city_housing is then the plain table the old loop wrote to
+'''
+def new_db(path, legacy=False):
+    for file in [path, path + '-wal', path + '-shm']:
+        if os.path.exists(file):
+            os.remove(file)
+    db = sqlite3.connect(path)
+    for file in ['schema.sql', 'initial_data.sql']:
+        with open(os.path.join(SQL_DIR, file)) as f:
+            db.executescript(f.read())
+    if legacy:
+        return db
+    db.close()
+    app.config['DATABASE'] = path
+    with app.app_context():
+        migrate_db()
+    return sqlite3.connect(path)
+
+
+'''
+the ingest loop as it was before the bulk path, kept here as the baseline
+'''
+def legacy_ingest(db, files, month):
+    for file in files:
+        city_name = os.path.basename(file).split(month)[0]
+        city_idx = city2idx[city_name]
+        df = pd.read_csv(file)
+        df['lat'] = [json.loads(string.replace("'", '"')).get('latitude') for string in df.latLong.tolist()]
+        df['lng'] = [json.loads(string.replace("'", '"')).get('longitude') for string in df.latLong.tolist()]
+        days = []
+        for string in df.variableData.tolist():
+            day = None
+            if "DAYS_ON" in string:
+                idx = string.index('text')
+                day = int(string[idx:].split()[1][1:])
+            days.append(day)
+        df['days'] = days
+        records = df[columns].to_numpy()
+        for record in records:
+            db.execute(
+            """
+            INSERT INTO city_housing (crawled_date, house_address, price, area, num_bathroom, num_bedroom, num_days_posted, zillow_url, house_lat, house_lng, city_id)
+            VALUES
+            (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (record[0], record[1], record[2], record[3], record[4], record[5], record[6], record[7], record[8], record[9], city_idx))
+    db.commit()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+'''
+peak traced memory of one ingest in this process, tracing slows it down so it is timed separately
+'''
+def traced(fn, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000, help='rows per city')
+    parser.add_argument('--cities', type=int, default=len(city2idx))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunksize', type=int, default=10000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for city in list(city2idx)[:args.cities]:
+            path = os.path.join(tmp, '{}{}.csv'.format(city, MONTH))
+            make_crawled_csv(path, city, args.rows)
+            files.append(path)
+        total = args.rows * len(files)
+
+        db_path = os.path.join(tmp, 'housing.sqlite')
+        legacy = timed(legacy_ingest, new_db(db_path, legacy=True), files, MONTH)
+        bulk = timed(ingest_month, new_db(db_path), files, MONTH, workers=args.workers)
+        chunked = timed(ingest_month, new_db(db_path), files, MONTH, chunksize=args.chunksize)
+        whole_memory = traced(ingest_month, new_db(db_path), files, MONTH)
+        chunked_memory = traced(ingest_month, new_db(db_path), files, MONTH, chunksize=args.chunksize)
+
+    print('rows: {}'.format(total))
+    print('legacy loop: {:.2f}s ({:.0f} rows/sec)'.format(legacy, total / legacy))
+    print('bulk ingest: {:.2f}s ({:.0f} rows/sec, workers={})'.format(bulk, total / bulk, args.workers))
+    print('speedup: {:.1f}x'.format(legacy / bulk))
+    print('chunked ingest: {:.2f}s ({:.0f} rows/sec, {} rows per chunk)'.format(chunked, total / chunked, args.chunksize))
+    print('peak memory: whole files {:.1f} MB, chunked {:.1f} MB'.format(whole_memory / 2 ** 20, chunked_memory / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+'''
+latency and throughput of the pages of the app on a synthetic database (see synthetic_data.py)
+drives /, /<location>, /<location>/graph (heatmap, scatter, clustering), /<location>/customize, /<location>/grid and /city-stats
+through the Flask test client, or over http against a local server started with the database:
+    testclient  every request in this process, one at a time
+    threaded    the flask development server with a thread per request
+    gunicorn    gunicorn --preload with --workers processes (needs gunicorn installed)
+reports p50/p95/p99 latency, throughput and peak RSS per page, --output writes them as json with the commit,
+--compare prints the change against the json of an earlier run
+
+usage (from the repo root):
+    python benchmarks/bench_load.py --listings 5000 --months 6 --requests 50 --output load-before.json
+    python benchmarks/bench_load.py --server gunicorn --workers 4 --concurrency 8 --compare load-before.json
+'''
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from synthetic_data import make_database
+from housing.locations import locations
+
+
+# (name, method, path, form), {location} is filled in by turns
+PAGES = [
+    ('GET /', 'GET', '/', None),
+    ('GET /<location>', 'GET', '/{location}', None),
+    ('POST /<location>/graph heatmap', 'POST', '/{location}/graph', {'graphing': 'heatmap'}),
+    ('POST /<location>/graph scatter', 'POST', '/{location}/graph', {'graphing': 'scatter'}),
+    ('POST /<location>/graph clustering', 'POST', '/{location}/graph', {'graphing': 'clustering'}),
+    ('POST /<location>/customize', 'POST', '/{location}/customize', 'filters'),
+    ('GET /<location>/grid', 'GET', '/{location}/grid?zoom=12&south=-90&west=-180&north=90&east=180', None),
+    # binned on the fly, the cells inside the viewport are a filtered frame
+    ('GET /<location>/grid filtered', 'GET', '/{location}/grid?zoom=12&south=-90&west=-180&north=90&east=180&bedroomFrom=2', None),
+    ('GET /city-stats', 'GET', '/city-stats', None),
+]
+# preference forms of /customize by turns, a few of them repeat so some requests hit the figure cache
+FILTERS = [
+    {'bedroomFrom': '2', 'maxPostedDays': '60'},
+    {'bathroomFrom': '2', 'aggregatedType': 'unitPrice'},
+    {'bedroomFrom': '3', 'bedroomTo': '4', 'maxDistanceToTrain': '3'},
+    {'maxPostedDays': '30'},
+]
+
+
+def page_requests(path, form, count):
+    names = list(locations)
+    return [(path.format(location=names[i % len(names)]), FILTERS[i % len(FILTERS)] if form == 'filters' else form)
+            for i in range(count)]
+
+
+def peak_rss_mb(who):
+    # kilobytes on linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+'''
+time every request of one page through the test client, one after the other
+'''
+def run_testclient(client, method, requests):
+    latencies = []
+    start = time.perf_counter()
+    for path, form in requests:
+        t = time.perf_counter()
+        response = client.open(path, method=method, data=form, follow_redirects=True)
+        latencies.append(time.perf_counter() - t)
+        if response.status_code != 200:
+            raise RuntimeError('{} {}: {}'.format(method, path, response.status_code))
+    return latencies, time.perf_counter() - start
+
+
+'''
+time every request of one page against the server, concurrency requests at a time
+'''
+def run_http(session, url, method, requests, concurrency):
+    def send(request):
+        path, form = request
+        t = time.perf_counter()
+        response = session.request(method, url + path, data=form)
+        if response.status_code != 200:
+            raise RuntimeError('{} {}: {}'.format(method, path, response.status_code))
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(send, requests))
+    return latencies, time.perf_counter() - start
+
+
+def start_server(kind, database, port, workers):
+    env = dict(os.environ, FLASK_DATABASE=database, MAPBOX_TOKEN=os.environ.get('MAPBOX_TOKEN', 'benchmark'))
+    if kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--preload', '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(port),
+                   '--log-level', 'warning', 'housing:preloaded_app()']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'housing', 'run', '--port', str(port), '--with-threads', '--no-reload']
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import requests
+    for _ in range(300):
+        try:
+            requests.get('http://127.0.0.1:{}/hello'.format(port), timeout=1)
+            return server
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                raise RuntimeError('the server exited with {}'.format(server.returncode))
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('the server did not start')
+
+
+def summary(latencies, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        'requests': len(ms),
+        'first_ms': float(ms[0]),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'throughput': len(ms) / elapsed,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_results(results, baseline=None):
+    if baseline is not None and (baseline['server'], baseline['workers'], baseline['concurrency']) != (results['server'], results['workers'], results['concurrency']):
+        print('the earlier run used {} with {} workers at concurrency {}, the numbers are not comparable one to one'.format(
+            baseline['server'], baseline['workers'], baseline['concurrency']))
+    print('{:<36} {:>9} {:>9} {:>9} {:>9} {:>9}'.format('page', 'first ms', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+    for name, stats in results['pages'].items():
+        print('{:<36} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            name, stats['first_ms'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['throughput']))
+        if baseline is not None and name in baseline['pages']:
+            before = baseline['pages'][name]
+            print('{:<36} {}'.format('  vs {}'.format(baseline['commit']), ' '.join(
+                '{:>+8.0f}%'.format((stats[key] / before[key] - 1) * 100) if before[key] else '{:>9}'.format('-')
+                for key in ['first_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput'])))
+    line = 'peak RSS: {:.0f} MB'.format(results['peak_rss_mb'])
+    if baseline is not None:
+        line += ' ({:+.0f}% vs {})'.format((results['peak_rss_mb'] / baseline['peak_rss_mb'] - 1) * 100, baseline['commit'])
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default=None, help='an existing database, otherwise a synthetic one is generated')
+    parser.add_argument('--listings', type=int, default=5000, help='listings per city of the synthetic database')
+    parser.add_argument('--months', type=int, default=6, help='months of the synthetic database')
+    parser.add_argument('--requests', type=int, default=50, help='requests per page')
+    parser.add_argument('--server', choices=['testclient', 'threaded', 'gunicorn'], default='testclient')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight against a server')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json file of an earlier run to compare with')
+    args = parser.parse_args()
+    if args.server == 'gunicorn' and importlib.util.find_spec('gunicorn') is None:
+        sys.exit('gunicorn is not installed')
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = args.database
+        if database is None:
+            database = os.path.join(tmp, 'housing.sqlite')
+            start = time.perf_counter()
+            make_database(database, args.listings, args.months)
+            print('synthetic database: {} listings per city over {} months in {:.1f}s'.format(args.listings, args.months, time.perf_counter() - start))
+        database = os.path.abspath(database)
+
+        pages = dict()
+        if args.server == 'testclient':
+            os.environ.setdefault('MAPBOX_TOKEN', 'benchmark')
+            from housing import app
+            app.config['DATABASE'] = database
+            for name, method, path, form in PAGES:
+                # customize keeps its filters in the session cookie, every page starts without one
+                client = app.test_client()
+                pages[name] = summary(*run_testclient(client, method, page_requests(path, form, args.requests)))
+            peak_rss = peak_rss_mb(resource.RUSAGE_SELF)
+        else:
+            import requests
+            port = free_port()
+            server = start_server(args.server, database, port, args.workers)
+            try:
+                for name, method, path, form in PAGES:
+                    session = requests.Session()
+                    pages[name] = summary(*run_http(session, 'http://127.0.0.1:{}'.format(port), method,
+                                                    page_requests(path, form, args.requests), args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            # the largest server process, the gunicorn master waits for its workers
+            peak_rss = peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+    results = {
+        'commit': git_commit(),
+        'server': args.server,
+        'workers': args.workers if args.server == 'gunicorn' else 1,
+        'concurrency': args.concurrency if args.server != 'testclient' else 1,
+        'database': args.database or 'synthetic {} listings x {} months'.format(args.listings, args.months),
+        'pages': pages,
+        'peak_rss_mb': peak_rss,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
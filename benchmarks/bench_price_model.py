@@ -0,0 +1,76 @@
+'''
+training time of the price models and scoring throughput of batches against one listing per call
+
+usage (from the repo root):
+    python benchmarks/bench_price_model.py --rows 100000 --batch 10000
+'''
+import argparse
+import glob
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from housing.ingest import write_housing
+from housing.price_model import train_price_models, predict_prices, read_training_frame, score_month
+
+
+SQL_DIR = os.path.join(ROOT, 'housing', 'sql')
+MONTH = '2022-11'
+
+
+def make_db(path, rows):
+    db = sqlite3.connect(path)
+    for file in [os.path.join(SQL_DIR, 'schema.sql'), os.path.join(SQL_DIR, 'initial_data.sql')] + sorted(glob.glob(os.path.join(SQL_DIR, 'migrations', '*.sql'))):
+        with open(file) as f:
+            db.executescript(f.read())
+    rng = random.Random(0)
+    records = []
+    for i in range(rows):
+        beds, baths, area = rng.choice([1, 2, 3, 4, 5]), rng.choice([1, 1.5, 2, 3]), rng.randint(500, 5000)
+        lat, lng = 40.3 + rng.random() * 0.1, -74.7 + rng.random() * 0.1
+        price = (150 * area + 40000 * beds + 2000000 * (lat - 40.3)) * rng.lognormvariate(0, 0.15)
+        records.append((MONTH, None, price, area, baths, beds, rng.randint(0, 120), 'https://www.zillow.com/homedetails/{}_zpid/'.format(i), lat, lng, 1))
+    with db:
+        write_housing(db, records)
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000, help='listings of the month the model is trained on')
+    parser.add_argument('--batch', type=int, default=10000, help='listings per scoring call')
+    parser.add_argument('--single', type=int, default=500, help='listings scored one per call')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = make_db(os.path.join(tmp, 'housing.sqlite'), args.rows)
+        start = time.perf_counter()
+        train_price_models(db, MONTH)
+        print('training on {} listings: {:.2f}s'.format(args.rows, time.perf_counter() - start))
+
+        df = read_training_frame(db, 1, MONTH)
+        # the first call loads the model from disk
+        predict_prices(db, [1], df.head(1), MONTH)
+        start = time.perf_counter()
+        for i in range(0, len(df), args.batch):
+            predict_prices(db, [1] * len(df[i:i + args.batch]), df[i:i + args.batch], MONTH)
+        batched = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(args.single):
+            predict_prices(db, [1], df[i:i + 1], MONTH)
+        single = time.perf_counter() - start
+        print('scoring in batches of {}: {:.0f} listings/sec'.format(args.batch, len(df) / batched))
+        print('scoring one listing per call: {:.0f} listings/sec'.format(args.single / single))
+
+        start = time.perf_counter()
+        scored = score_month(db, MONTH)
+        print('ingest hook (score_month): {} listings in {:.2f}s'.format(scored, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
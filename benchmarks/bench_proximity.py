@@ -0,0 +1,65 @@
+'''
+nearest landmark distance and counts within the radii of every listing,
+through the BallTrees of housing.proximity against all listing x landmark haversine distances
+
+usage (from the repo root):
+    python benchmarks/bench_proximity.py --listings 200000 --landmarks 2000
+'''
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing.proximity import proximity_radii, proximity_records, earth_radius
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * earth_radius * np.arcsin(np.sqrt(a))
+
+
+'''
+the distances of a block of listings to every landmark at once, the way it would be done without an index
+'''
+def brute_force(listings, landmarks, block=2000):
+    nearest, counts = [], []
+    for i in range(0, len(listings), block):
+        d = haversine(listings[i:i + block, :1], listings[i:i + block, 1:], landmarks[:, 0], landmarks[:, 1])
+        nearest.append(d.min(axis=1))
+        counts.append(np.column_stack([(d <= radius).sum(axis=1) for radius in proximity_radii.values()]))
+    return np.concatenate(nearest), np.concatenate(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listings', type=int, default=200000)
+    parser.add_argument('--landmarks', type=int, default=2000, help='landmarks of the one type')
+    args = parser.parse_args()
+
+    from sklearn.neighbors import BallTree
+    rng = np.random.default_rng(0)
+    # a city sized area around Princeton
+    listings = np.column_stack([40.3 + rng.random(args.listings) * 0.2, -74.8 + rng.random(args.listings) * 0.3])
+    landmarks = np.column_stack([40.3 + rng.random(args.landmarks) * 0.2, -74.8 + rng.random(args.landmarks) * 0.3])
+
+    start = time.perf_counter()
+    nearest, counts = brute_force(listings, landmarks)
+    brute = time.perf_counter() - start
+
+    start = time.perf_counter()
+    trees = {'train_station': BallTree(np.radians(landmarks), metric='haversine')}
+    records = proximity_records(trees, np.arange(args.listings), listings)
+    tree = time.perf_counter() - start
+
+    assert np.allclose([record[2] for record in records], nearest)
+    assert (np.array([record[3:] for record in records]) == counts).all()
+    print('{} listings x {} landmarks'.format(args.listings, args.landmarks))
+    print('all distances: {:.2f}s'.format(brute))
+    print('BallTree:      {:.2f}s ({:.1f}x), same distances and counts'.format(tree, brute / tree))
+
+
+if __name__ == '__main__':
+    main()
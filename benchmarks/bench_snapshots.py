@@ -0,0 +1,94 @@
+'''
+filtered analytics read from city_housing against the columnar snapshots
+builds a database with --months months of --rows listings each, writes the snapshots
+and times the map page panels (get_map_panels), the grid of the heatmap (get_grid) and the listings of the graphs
+(get_housing_from_db) with preference filters both ways
+
+usage (from the repo root):
+    python benchmarks/bench_snapshots.py --rows 50000 --months 12
+'''
+import argparse
+import glob
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from housing import snapshots
+from housing.ingest import write_housing
+from housing.monthly_stats import rebuild_monthly_stats
+from housing.queries import get_map_panels, get_housing_from_db
+from housing.spatial_grid import get_grid
+from housing.snapshots import rebuild_snapshots
+
+
+SQL_DIR = os.path.join(ROOT, 'housing', 'sql')
+CITIES = ['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ']
+KWARGS = [{'bedroom_from': 2, 'bathroom_from': 2}, {'max_posted_days': 30, 'aggregated_type': 'unitPrice'}]
+
+
+def make_db(path, rows, months):
+    db = sqlite3.connect(path)
+    for file in [os.path.join(SQL_DIR, 'schema.sql'), os.path.join(SQL_DIR, 'initial_data.sql')] + sorted(glob.glob(os.path.join(SQL_DIR, 'migrations', '*.sql'))):
+        with open(file) as f:
+            db.executescript(f.read())
+    rng = random.Random(0)
+    with db:
+        for m in range(months):
+            month = '{}-{:02d}'.format(2022 + m // 12, m % 12 + 1)
+            write_housing(db, [(month, '{} Main St'.format(i), rng.randint(150, 3000) * 1000, rng.randint(500, 5000), rng.choice([1, 1.5, 2, 3]),
+                                rng.choice([1, 2, 3, 4]), rng.randint(0, 120), 'https://www.zillow.com/homedetails/{}-{}_zpid/'.format(month, i),
+                                40 + rng.random(), -74 - rng.random(), rng.randint(1, 5)) for i in range(rows)])
+    rebuild_monthly_stats(db)
+    db.commit()
+    db.row_factory = sqlite3.Row
+    return db, month
+
+
+def timed(db, month, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = []
+        for kwargs in KWARGS:
+            summarize, month_prices, _ = get_map_panels(db, CITIES, month, kwargs)
+            # the url of a cell is one of the listings closest to its median, ties depend on the row order
+            grid = get_grid(db, 'princeton', month, kwargs=kwargs)[1].drop(columns='zillow_url')
+            listings = pd.DataFrame(dict(zip(['url', 'lng', 'lat', 'price'], get_housing_from_db(db, CITIES, month, kwargs)))).sort_values('url', ignore_index=True)
+            results.append((summarize, month_prices, grid, listings))
+    return results, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000, help='listings per month')
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if snapshots.load_pyarrow() is None:
+        sys.exit('pyarrow is not installed')
+    with tempfile.TemporaryDirectory() as tmp:
+        db, month = make_db(os.path.join(tmp, 'housing.sqlite'), args.rows, args.months)
+        expected, sqlite_elapsed = timed(db, month, args.repeat)
+
+        start = time.perf_counter()
+        rebuild_snapshots(db)
+        written = time.perf_counter() - start
+        res, snapshot_elapsed = timed(db, month, args.repeat)
+        for a, b in zip(expected, res):
+            for x, y in zip(a, b):
+                pd.testing.assert_frame_equal(x, y, check_dtype=False)
+
+        size = sum(os.path.getsize(file) for file in glob.glob(os.path.join(tmp, 'housing-snapshots', '*', '*.arrow')))
+        print('{} months x {} listings, snapshots written in {:.2f}s ({:.1f} MB)'.format(args.months, args.rows, written, size / 2 ** 20))
+        print('city_housing: {:.3f}s per round, snapshots: {:.3f}s per round ({:.1f}x), same results'.format(
+            sqlite_elapsed, snapshot_elapsed, sqlite_elapsed / snapshot_elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+time the cold start of the app: `import housing`, the import cost of each module,
+and the first requests of a fresh process with and without housing.preload()
+every measurement runs in a new python process
+
+usage (from the repo root):
+    python benchmarks/bench_startup.py --runs 5
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+IMPORT = '''
+import time
+start = time.perf_counter()
+import housing
+print(time.perf_counter() - start)
+'''
+
+FIRST_REQUESTS = '''
+import logging, time
+logging.disable(logging.CRITICAL)
+start = time.perf_counter()
+import housing
+if {preload}:
+    housing.preload()
+ready = time.perf_counter()
+client = housing.app.test_client()
+times = [ready - start]
+for path in {paths!r}:
+    request_start = time.perf_counter()
+    client.get(path)
+    times.append(time.perf_counter() - request_start)
+print(' '.join(str(t) for t in times))
+'''
+
+
+def run_python(code, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+'''
+cumulative import time in ms of each module imported by `import housing`, from python -X importtime
+'''
+def import_times():
+    _, stderr = run_python('import housing', '-X', 'importtime')
+    times = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative) / 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='number of modules listed by import cost')
+    parser.add_argument('--paths', nargs='+', default=['/hello', '/nyc', '/city-stats'])
+    args = parser.parse_args()
+
+    samples = [float(run_python(IMPORT)[0]) for _ in range(args.runs)]
+    print('import housing: median {:.3f}s over {} runs'.format(statistics.median(samples), args.runs))
+
+    times = import_times()
+    print('\nimport cost per module (cumulative ms):')
+    for module, ms in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print('  {:>8.1f}  {}'.format(ms, module))
+    heavy = ['numpy', 'pandas', 'plotly', 'sklearn', 'scipy', 'requests']
+    loaded = [module for module in heavy if module in times]
+    print('heavy modules loaded by `import housing`: {}'.format(', '.join(loaded) or 'none'))
+
+    for preload in [False, True]:
+        runs = []
+        for _ in range(args.runs):
+            stdout, _ = run_python(FIRST_REQUESTS.format(preload=preload, paths=args.paths))
+            runs.append([float(t) for t in stdout.split()])
+        medians = [statistics.median(column) for column in zip(*runs)]
+        print('\n{}: startup {:.3f}s'.format('with preload()' if preload else 'without preload', medians[0]))
+        for path, seconds in zip(args.paths, medians[1:]):
+            print('  first {:<12s} {:.3f}s'.format(path, seconds))
+
+
+if __name__ == '__main__':
+    main()
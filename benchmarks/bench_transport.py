@@ -0,0 +1,63 @@
+'''
+size and encoding time of the listings of a month as plain json lists with urls (like /<location>/viewport)
+against the typed arrays of /<location>/listings, uncompressed, gzipped and with brotli when it is installed
+
+usage (from the repo root):
+    python benchmarks/bench_transport.py --listings 100000
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing.transport import typed_array, encode_body, load_brotli
+
+
+def plain_body(ids, lats, lngs, prices):
+    return json.dumps({
+        'lat': lats.tolist(),
+        'lng': lngs.tolist(),
+        'price': prices.tolist(),
+        'zillow_url': ['https://www.zillow.com/homedetails/{}_zpid/'.format(i) for i in ids.tolist()],
+    }).encode()
+
+
+def typed_body(ids, lats, lngs, prices):
+    return json.dumps({
+        'count': len(ids),
+        'id': typed_array(ids, 'u4'),
+        'lat': typed_array(lats, 'f4'),
+        'lng': typed_array(lngs, 'f4'),
+        'price': typed_array(prices, 'f8'),
+    }).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listings', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, args.listings + 1)
+    lats = 40.3 + rng.random(args.listings) * 0.2
+    lngs = -74.8 + rng.random(args.listings) * 0.3
+    prices = rng.integers(150, 3000, args.listings) * 1000.0
+
+    encodings = ['identity', 'gzip'] + (['br'] if load_brotli() is not None else [])
+    print('{} listings'.format(args.listings))
+    for name, build in [('json lists + urls', plain_body), ('typed arrays', typed_body)]:
+        start = time.perf_counter()
+        body = build(ids, lats, lngs, prices)
+        built = time.perf_counter() - start
+        for encoding in encodings:
+            start = time.perf_counter()
+            encoded = encode_body(body, encoding)
+            elapsed = built + time.perf_counter() - start
+            print('{:<18} {:<8} {:>10.1f} KB {:>8.3f}s'.format(name, encoding, len(encoded) / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+'''
+first request of every view rendered from the DB against read from the artifacts of warm-cache
+works on a copy of an ingested database, so the artifacts of the real one are left alone
+
+usage (from the repo root):
+    python benchmarks/bench_warm_cache.py --database instance/housing.sqlite --workers 4
+'''
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from housing.artifacts import warm_artifacts, read_artifact, artifact_kinds
+from housing.db import get_data_revision
+from housing.figure_cache import figure_cache
+from housing.locations import locations
+from housing.perference import Perference
+from housing.views import render_city_map, render_graph, month
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', default='instance/housing.sqlite')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'housing.sqlite')
+        shutil.copy(args.database, database)
+        db = sqlite3.connect(database)
+        db.row_factory = sqlite3.Row
+        revision = get_data_revision(db)
+        figure_cache.check_revision(revision)
+        tasks = [(location, kind) for location in locations for kind in artifact_kinds]
+
+        rendered = 0
+        for location, kind in tasks:
+            start = time.perf_counter()
+            if kind == 'map':
+                render_city_map(db, location, Perference())
+            else:
+                render_graph(db, location, kind, Perference())
+            rendered += time.perf_counter() - start
+
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            warm_artifacts(db, workers=workers)
+            print('warm-cache with {} workers: {:.2f}s'.format(workers, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        for location, kind in tasks:
+            assert read_artifact(db, revision, month, location, kind) is not None
+        served = time.perf_counter() - start
+        print('{} views of {}'.format(len(tasks), month))
+        print('rendered from the DB: {:.3f}s'.format(rendered))
+        print('read from artifacts:  {:.3f}s ({:.0f}x)'.format(served, rendered / served))
+
+
+if __name__ == '__main__':
+    main()
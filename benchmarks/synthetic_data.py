@@ -0,0 +1,150 @@
+'''
+synthetic database for the benchmarks, no Google or Zillow token needed
+every city gets --listings listings around a few neighborhoods, re-listed over --months months up to --end-month,
+with prices by area, rooms, neighborhood and distance to the center, and landmarks of every type around the center
+the monthly stats, grid, proximity, census table and snapshots are computed the way update-db-monthly does
+
+usage (from the repo root):
+    python benchmarks/synthetic_data.py instance/synthetic.sqlite --listings 5000 --months 6
+    FLASK_DATABASE=instance/synthetic.sqlite MAPBOX_TOKEN=<token> flask --app housing run
+'''
+import argparse
+import glob
+import logging
+import os
+import sqlite3
+import sys
+from datetime import date
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from housing.census import sync_census
+from housing.db import citiesLoc, cities2idx, layout_types, bump_data_revision
+from housing.ingest import write_housing
+from housing.monthly_stats import refresh_monthly_stats
+from housing.proximity import refresh_proximity
+from housing.snapshots import write_month_snapshot
+from housing.spatial_grid import refresh_grid
+
+
+SQL_DIR = os.path.join(ROOT, 'housing', 'sql')
+# dollars per square foot in the center of the city
+CITY_PRICES = {'Princeton,NJ': 330, 'West Windsor,NJ': 290, 'Lawrence,NJ': 230, 'Seattle,WA': 520, 'NYC,NY': 850}
+# landmarks of each type per city, subway stations only in NYC
+LANDMARK_COUNTS = {'school': 40, 'shopping_malls': 6, 'supermarket': 25, 'train_station': 4, 'hospital': 5, 'subway_station': 0}
+NEIGHBORHOODS = 6
+# share of the listings of a city on the market in a given month
+PRESENCE = 0.6
+MONTHLY_TREND = 0.004
+
+
+def months_until(end_month, count):
+    year, month = [int(part) for part in end_month.split('-')]
+    index = year * 12 + month - 1
+    return ['{}-{:02d}'.format(i // 12, i % 12 + 1) for i in range(index - count + 1, index + 1)]
+
+
+def create_schema(path):
+    db = sqlite3.connect(path)
+    migrations = sorted(glob.glob(os.path.join(SQL_DIR, 'migrations', '*.sql')))
+    for file in [os.path.join(SQL_DIR, 'schema.sql'), os.path.join(SQL_DIR, 'initial_data.sql')] + migrations:
+        with open(file) as f:
+            db.executescript(f.read())
+    db.execute('PRAGMA user_version = {}'.format(int(os.path.basename(migrations[-1]).split('_')[0])))
+    return db
+
+
+def landmark_rows(rng, city, city_id):
+    lat, lng = citiesLoc[city]
+    rows = []
+    for landmark_type in layout_types:
+        count = LANDMARK_COUNTS[landmark_type] or (60 if city == 'NYC,NY' and landmark_type == 'subway_station' else 0)
+        lats, lngs = rng.normal(lat, 0.04, count), rng.normal(lng, 0.05, count)
+        rows += [('{} {}'.format(landmark_type, i), landmark_type, lats[i], lngs[i], round(rng.uniform(3, 5), 1), city_id) for i in range(count)]
+    return rows
+
+
+'''
+the listings of one city, fixed over the months: coordinates, area, rooms and the price in the first month
+'''
+def city_listings(rng, city, count):
+    lat, lng = citiesLoc[city]
+    centers = np.column_stack([rng.normal(lat, 0.03, NEIGHBORHOODS), rng.normal(lng, 0.04, NEIGHBORHOODS)])
+    premium = rng.lognormal(0, 0.25, NEIGHBORHOODS)
+    neighborhood = rng.integers(0, NEIGHBORHOODS, count)
+    lats = rng.normal(centers[neighborhood, 0], 0.01)
+    lngs = rng.normal(centers[neighborhood, 1], 0.012)
+    area = np.clip(rng.lognormal(np.log(1700), 0.35, count), 400, 8000).round()
+    beds = np.clip(np.round(area / 600 + rng.normal(0, 0.7, count)), 1, 6)
+    baths = np.clip(beds - rng.choice([0, 0.5, 1, 1.5], count), 1, 5)
+    distance_km = np.hypot((lats - lat) * 111, (lngs - lng) * 85)
+    price = CITY_PRICES[city] * area * premium[neighborhood] * np.exp(-distance_km / 15) * rng.lognormal(0, 0.15, count)
+    price = np.round(price * (1 + 0.03 * (baths - beds / 2)), -3)
+    # a few crawled rows miss the coordinates or the price
+    lats[rng.random(count) < 0.01] = np.nan
+    price[rng.random(count) < 0.01] = np.nan
+    return lats, lngs, area, beds, baths, price
+
+
+def nullable(values):
+    return [None if value != value else value for value in values.tolist()]
+
+
+'''
+write the synthetic database to path, which must not exist yet
+returns the crawled months
+'''
+def make_database(path, listings, months, end_month=None, seed=0):
+    rng = np.random.default_rng(seed)
+    months = months_until(end_month or date.today().strftime('%Y-%m'), months)
+    db = create_schema(path)
+    with db:
+        for city, city_id in cities2idx.items():
+            db.executemany("""
+                INSERT INTO city_layout (landmark_name, landmark_type, landmark_lat, landmark_lng, landmark_rating, city_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, landmark_rows(rng, city, city_id))
+
+            lats, lngs, area, beds, baths, price = city_listings(rng, city, listings)
+            urls = ['https://www.zillow.com/homedetails/{}-{}_zpid/'.format(city_id, i) for i in range(listings)]
+            addresses = ['{} Main St, {}'.format(i, city) for i in range(listings)]
+            for m, month in enumerate(months):
+                listed = np.flatnonzero(rng.random(listings) < PRESENCE)
+                month_price = np.round(price[listed] * (1 + MONTHLY_TREND) ** m * rng.lognormal(0, 0.02, len(listed)), -3)
+                days = rng.exponential(30, len(listed)).astype(int)
+                write_housing(db, zip([month] * len(listed), [addresses[i] for i in listed], nullable(month_price), area[listed].tolist(),
+                                  baths[listed].tolist(), beds[listed].tolist(), days.tolist(), [urls[i] for i in listed],
+                                  nullable(lats[listed]), lngs[listed].tolist(), [city_id] * len(listed)))
+
+    for month in months:
+        refresh_monthly_stats(db, month)
+        refresh_grid(db, month)
+    refresh_proximity(db)
+    sync_census(db, os.path.join(ROOT, 'housing', 'census_data'))
+    bump_data_revision(db)
+    db.commit()
+    for month in months:
+        write_month_snapshot(db, month)
+    db.close()
+    return months
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('database', help='path of the new database file')
+    parser.add_argument('--listings', type=int, default=5000, help='listings per city')
+    parser.add_argument('--months', type=int, default=6)
+    parser.add_argument('--end-month', default=None, help='last crawled month (year-month), this month by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        sys.exit('{} exists already, pick a new path'.format(args.database))
+    logging.disable(logging.CRITICAL)
+    months = make_database(args.database, args.listings, args.months, args.end_month, args.seed)
+    print('Wrote {} listings per city over {} to {}.'.format(args.listings, ', '.join(months), args.database))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import os
-from flask import Flask
-from . import db
+import threading
+from flask import Flask, abort, request
+from . import db, figure_cache
 from .views import views
 
 
@@ -8,8 +9,24 @@ app = Flask(__name__, instance_relative_config=True)
 app.config.from_mapping(
     SECRET_KEY='dev',
     DATABASE=os.path.join(app.instance_path, 'housing.sqlite'),
+    SQLITE_MMAP_SIZE=256 * 1024 * 1024,
+    SQLITE_CACHE_SIZE=64 * 1024 * 1024,
+    CHECK_QUERY_PLANS=True,
+    FIGURE_CACHE_MAX_ENTRIES=256,
+    FIGURE_CACHE_MAX_BYTES=64 * 1024 * 1024,
+    GMAP_URL='https://maps.googleapis.com/maps/api/place/nearbysearch/json',
+    GMAP_WORKERS=8,
+    GMAP_RATE=10,
+    GMAP_PAGE_TOKEN_DELAY=2.0,
+    GMAP_CACHE_DIR=os.path.join(app.instance_path, 'gmap_cache'),
+    GMAP_CACHE_TTL=30 * 24 * 3600,
+    GMAP_CACHE_MAX_BYTES=256 * 1024 * 1024,
+    GMAP_REPLAY_ONLY=False,
 )
+# any setting can be overridden by a FLASK_<NAME> environment variable, e.g. FLASK_DATABASE=/path/to/housing.sqlite
+app.config.from_prefixed_env()
 db.init_app(app)
+figure_cache.init_app(app)
 app.register_blueprint(views)
 
 
@@ -18,6 +35,62 @@ try:
 except OSError:
     pass
 
+query_plans_checked = threading.Event()
+
+
+'''
+warn once per process if the hot queries in housing.queries would scan whole tables
+runs before the first request of the views (the check imports pandas, the health check does not need it)
+'''
+def check_query_plans_once():
+    if query_plans_checked.is_set() or not app.config['CHECK_QUERY_PLANS'] or not os.path.exists(app.config['DATABASE']):
+        return
+    query_plans_checked.set()
+    from .query_plan import check_query_plans
+    check_query_plans(db.get_db())
+
+
+schema_checked = threading.Event()
+
+
+'''
+the views read tables of the latest migrations, on an older database every page would fail with a 500
+answer 503 with what to run instead, until the database is migrated
+'''
+def check_schema():
+    if schema_checked.is_set():
+        return
+    version, latest = db.schema_versions(db.get_db())
+    if version < latest:
+        abort(503, description='The database schema is at version {} of {}, run `flask --app housing migrate-db` '
+                               '(or init-db for a new database).'.format(version, latest))
+    schema_checked.set()
+
+
+@app.before_request
+def before_views_request():
+    if request.blueprint == 'views':
+        check_schema()
+        check_query_plans_once()
+
+
+'''
+import the heavy modules the views otherwise load on their first request and run the query plan check
+for forking WSGI servers, e.g. gunicorn --preload 'housing:preloaded_app()', so every worker starts warm
+'''
+def preload():
+    import numpy, pandas, plotly.express, plotly.graph_objects, plotly.utils, sklearn.cluster
+    from . import queries, spatial_grid, ml_models, query_plan
+    with app.app_context():
+        check_query_plans_once()
+    # a sqlite connection must not be shared with the forked workers, each of them opens its own
+    db.close_read_connections()
+
+
+def preloaded_app():
+    preload()
+    return app
+
 # a simple page that says hello
 @app.route('/hello')
 def hello():
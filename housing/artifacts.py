@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from housing.locations import locations
+from housing.snapshots import sidecar_dir
+
+
+# rendered views of the default filters, written by warm-cache: <database>-artifacts/<revision>/<month>/<location>-<kind>.json
+# 'map' holds the figures and summary table of the map page, the others the figure of /<location>/graph
+# a new data revision is a new folder, so the views never serve an artifact of older data
+graph_kinds = ['heatmap', 'scatter', 'clustering']
+artifact_kinds = ['map'] + graph_kinds
+
+
+def artifact_dir(db):
+    return sidecar_dir(db, '-artifacts')
+
+
+def artifact_file(directory, revision, month, location, kind):
+    return os.path.join(directory, str(revision), month, '{}-{}.json'.format(location, kind))
+
+
+'''
+the rendered view of location and kind for the default filters
+returns None when warm-cache has not written it for this revision and month
+'''
+def read_artifact(db, revision, month, location, kind):
+    directory = artifact_dir(db)
+    # kind comes from the request, only known names make it into a path
+    if directory is None or revision is None or location not in locations or kind not in artifact_kinds:
+        return None
+    try:
+        with open(artifact_file(directory, revision, month, location, kind)) as f:
+            value = json.load(f)
+    except FileNotFoundError:
+        return None
+    return tuple(value) if kind == 'map' else value
+
+
+'''
+written to a temporary file and renamed, so a reader never sees half an artifact
+'''
+def write_artifact(directory, revision, month, location, kind, value):
+    file = artifact_file(directory, revision, month, location, kind)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file + '.tmp', 'w') as f:
+        json.dump(value, f)
+    os.replace(file + '.tmp', file)
+    return os.path.getsize(file)
+
+
+def clear_artifacts(db):
+    directory = artifact_dir(db)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+'''
+remove the artifacts of every revision but the given one
+'''
+def prune_artifacts(db, revision):
+    directory = artifact_dir(db)
+    if directory is None or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name != str(revision):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+'''
+render one view of location from its own read connection, run in the processes of warm_artifacts
+the revision and the rendered data are read in one transaction, so they always belong together
+returns (location, kind, month, revision, bytes written, seconds)
+'''
+def warm_artifact(database, location, kind):
+    from housing.db import connect, get_data_revision
+    from housing.figure_cache import figure_cache
+    from housing.perference import Perference
+    from housing.views import render_city_map, render_graph, month
+    start = time.perf_counter()
+    db = connect(database, ['PRAGMA query_only = ON'])
+    try:
+        db.execute('BEGIN')
+        revision = get_data_revision(db)
+        # the layout and cluster caches of the render functions are keyed by the revision of the figure cache
+        figure_cache.check_revision(revision)
+        if kind == 'map':
+            value = list(render_city_map(db, location, Perference()))
+        else:
+            value = render_graph(db, location, kind, Perference())
+        db.rollback()
+        size = write_artifact(artifact_dir(db), revision, month, location, kind, value)
+    finally:
+        db.close()
+    return location, kind, month, revision, size, time.perf_counter() - start
+
+
+'''
+render every location and kind with the default filters in a pool of worker processes and store them
+artifacts of older revisions are removed afterwards
+returns the results of warm_artifact
+'''
+def warm_artifacts(db, workers=1):
+    from housing.db import get_data_revision
+    if artifact_dir(db) is None:
+        raise ValueError('artifacts are stored next to the database file, an in-memory database cannot hold them')
+    if get_data_revision(db) is None:
+        raise ValueError('the database has no data revision yet, run migrate-db first')
+    database = next(row[2] for row in db.execute('PRAGMA database_list') if row[1] == 'main')
+    tasks = [(location, kind) for location in locations for kind in artifact_kinds]
+    start = time.perf_counter()
+    if workers > 1:
+        # imported before the workers fork, so each of them does not import plotly and scikit-learn again
+        import plotly.express, plotly.graph_objects, plotly.utils, sklearn.cluster
+        from housing import views, queries, spatial_grid, ml_models
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(warm_artifact, [database] * len(tasks), *zip(*tasks)))
+    else:
+        results = [warm_artifact(database, location, kind) for location, kind in tasks]
+    for location, kind, month, revision, size, elapsed in results:
+        logging.critical('========= Warmed {} {} of {} (revision {}): {} bytes in {:.2f}s ========='.format(
+            location, kind, month, revision, size, elapsed))
+    prune_artifacts(db, get_data_revision(db))
+    logging.critical('========= {} artifacts warmed in {:.2f}s with {} workers ========='.format(len(results), time.perf_counter() - start, workers))
+    return results
@@ -0,0 +1,128 @@
+import csv
+import glob
+import html
+import logging
+import os
+from housing.figure_cache import FigureCache
+
+
+census_dir = './housing/census_data'
+# facts shown on the city stats page, in this order
+census_facts = [
+    "Population Estimates, July 1 2021, (V2021)",
+    "Foreign born persons, percent, 2016-2020",
+    "Owner-occupied housing unit rate, 2016-2020",
+    "Median value of owner-occupied housing units, 2016-2020",
+    "Median selected monthly owner costs -with a mortgage, 2016-2020",
+    "Median selected monthly owner costs -without a mortgage, 2016-2020",
+    "Bachelor's degree or higher, percent of persons age 25 years+, 2016-2020",
+    "Median household income (in 2020 dollars), 2016-2020"
+]
+# areas come first in this order, other imported cities follow by name and the country comes last
+census_areas = ["Princeton, New Jersey", "New York city, New York", "Seattle city, Washington"]
+country_area = "United States"
+
+# rendered table of the current data revision
+census_cache = FigureCache(max_entries=4)
+
+
+'''
+read one census.gov QuickFacts csv
+the header is Fact, Fact Note, then an area and its Value Note per area
+returns a list of (area, fact, position, value)
+'''
+def read_census_csv(file):
+    with open(file, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        areas = [(i, area) for i, area in enumerate(header) if i >= 2 and not area.startswith('Value Note')]
+        rows = []
+        for position, line in enumerate(reader):
+            if not line or not line[0]:
+                continue
+            for i, area in areas:
+                if i < len(line):
+                    rows.append((area, line[0], position, line[i]))
+    return rows
+
+
+def census_files(directory=census_dir):
+    return sorted(glob.glob(os.path.join(directory, '*.csv')))
+
+
+'''
+name and modification time of every census csv, changes whenever a file is added, removed or edited
+'''
+def census_signature(directory=census_dir):
+    return tuple((os.path.basename(file), os.path.getmtime(file)) for file in census_files(directory))
+
+
+'''
+bring census_stats in line with the csv files of directory, the caller commits
+files that are new or have a different mtime are (re)imported, rows of removed files are deleted
+returns the names of the imported files
+'''
+def sync_census(db, directory=census_dir):
+    imported = dict(db.execute('select file, mtime from census_files').fetchall())
+    signature = census_signature(directory)
+    changed = [(name, mtime) for name, mtime in signature if imported.get(name) != mtime]
+    removed = set(imported) - {name for name, _ in signature}
+    for name in removed:
+        db.execute('delete from census_stats where file = ?', (name, ))
+        db.execute('delete from census_files where file = ?', (name, ))
+    for name, mtime in changed:
+        rows = read_census_csv(os.path.join(directory, name))
+        db.execute('delete from census_stats where file = ?', (name, ))
+        db.executemany(
+            """
+            INSERT OR REPLACE INTO census_stats (file, area, fact, position, value)
+            VALUES
+            (?, ?, ?, ?, ?)
+            """, [(name, *row) for row in rows])
+        db.execute('INSERT OR REPLACE INTO census_files (file, mtime) VALUES (?, ?)', (name, mtime))
+        logging.critical('========= Census data imported: {} ({} values) ========='.format(name, len(rows)))
+    return [name for name, _ in changed]
+
+
+def ordered_areas(areas):
+    others = sorted(area for area in areas if area not in census_areas and area != country_area)
+    ordered = [area for area in census_areas if area in areas] + others
+    return ordered + [country_area] if country_area in areas else ordered
+
+
+'''
+the census facts as an html table, the same markup DataFrame.to_html(classes='data') produced
+'''
+def render_census_table(values):
+    areas = ordered_areas({area for area, _ in values})
+    lines = ['<table border="1" class="dataframe data">', '  <thead>', '    <tr style="text-align: right;">', '      <th></th>']
+    lines += ['      <th>{}</th>'.format(html.escape(area, quote=False)) for area in areas]
+    lines += ['    </tr>', '  </thead>', '  <tbody>']
+    for fact in census_facts:
+        lines += ['    <tr>', '      <th>{}</th>'.format(html.escape(fact, quote=False))]
+        lines += ['      <td>{}</td>'.format(html.escape(values.get((area, fact), "NaN"), quote=False)) for area in areas]
+        lines.append('    </tr>')
+    lines += ['  </tbody>', '</table>']
+    return '\n'.join(lines)
+
+
+'''
+value of every (area, fact), an area in several files takes its value from the last file by name
+'''
+def read_census_values(db):
+    rows = db.execute('select area, fact, value from census_stats where fact in ({}) order by file'.format(','.join('?' * len(census_facts))),
+                      census_facts).fetchall()
+    return {(row[0], row[1]): row[2] for row in rows}
+
+
+'''
+rendered census table, memoized until the data revision changes
+only reads census_stats, the csv files are imported by init-db, update-db-monthly and import-census
+'''
+def get_census_table(db, revision=None):
+    census_cache.check_revision(revision)
+    table = census_cache.get('table')
+    if table is None:
+        table = render_census_table(read_census_values(db))
+        census_cache.put('table', table, revision)
+    return table
@@ -1,72 +1,252 @@
 import sqlite3
+import threading
 import click
-import pandas as pd
-import numpy as np
-import json
 import os
 import glob
-from datetime import date
+import shutil
 from flask import current_app, g
-from housing.utils.gmap import fetch_gmap_data
-from housing.utils.zillow import zillow_request
+from housing.figure_cache import figure_cache
+from housing.layout import upsert_layout
+from housing.census import census_dir, sync_census
+from housing.snapshots import write_month_snapshot, rebuild_snapshots, clear_snapshots
+from housing.artifacts import warm_artifacts, clear_artifacts
 import logging
 
+# the data modules (ingest, monthly_stats, spatial_grid, query_plan, utils.gmap) pull in pandas and requests,
+# they are imported by the commands that use them so `import housing` stays light
 
+
+# read connections are kept open per thread and reused by every request the thread serves
+read_connections = threading.local()
+
+
+def connect(path, pragmas):
+    db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        db.execute(pragma)
+    return db
+
+
+def cache_pragmas():
+    return ['PRAGMA mmap_size = {}'.format(current_app.config['SQLITE_MMAP_SIZE']),
+            'PRAGMA cache_size = -{}'.format(current_app.config['SQLITE_CACHE_SIZE'] // 1024),
+            'PRAGMA temp_store = MEMORY']
+
+
+'''
+read-only connection of the current thread, opened on first use and kept for the next requests
+query_only makes any write through it fail, writes go through get_write_db
+'''
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        path = current_app.config['DATABASE']
+        pool = getattr(read_connections, 'pool', None)
+        if pool is None:
+            pool = read_connections.pool = dict()
+        if path not in pool:
+            pool[path] = connect(path, cache_pragmas() + ['PRAGMA query_only = ON'])
+        g.db = pool[path]
 
     return g.db
 
 
+'''
+writer connection of the current app context, used by the commands that change the DB
+in WAL mode the pooled readers keep serving the last committed data while it writes
+'''
+def get_write_db():
+    if 'write_db' not in g:
+        g.write_db = connect(current_app.config['DATABASE'], cache_pragmas() + [
+            'PRAGMA journal_mode = WAL',
+            'PRAGMA synchronous = NORMAL',
+            'PRAGMA busy_timeout = 5000',
+        ])
+
+    return g.write_db
+
+
 def close_db(e=None):
-    db = g.pop('db', None)
+    # the read connection goes back to the pool of its thread
+    g.pop('db', None)
+    db = g.pop('write_db', None)
 
     if db is not None:
         db.close()
 
 
-def init_db():
-    db = get_db()
-    layout_types = ['school', 'shopping_malls', 'supermarket', 'train_station', 'hospital', 'subway_station']
-    citiesLoc = {'Princeton,NJ': (40.3573, -74.6672), 'West Windsor,NJ': (40.2983, -74.6186), 
-                'Lawrence,NJ':(40.2778, -74.7294), 'Seattle,WA':(47.6062, -122.3321), 'NYC,NY':(40.7128, -74.0060)}
-    cities2idx = {'Princeton,NJ': 1, 'West Windsor,NJ': 2, 
-                  'Lawrence,NJ': 3, 'Seattle,WA': 4, 'NYC,NY':5}
-    with open('./housing/access_token/gmap.txt') as f:
-        gmap_token = f.read()
+'''
+close the read connections the current thread keeps, e.g. before the DB file is replaced
+'''
+def close_read_connections():
+    pool = getattr(read_connections, 'pool', dict())
+    for db in pool.values():
+        db.close()
+    pool.clear()
 
-    logging.critical('========= Initializing tables and city data =========')
-    with current_app.open_resource('./sql/schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
-    with current_app.open_resource('./sql/initial_data.sql') as f:
-        db.executescript(f.read().decode('utf8'))
+
+layout_types = ['school', 'shopping_malls', 'supermarket', 'train_station', 'hospital', 'subway_station']
+citiesLoc = {'Princeton,NJ': (40.3573, -74.6672), 'West Windsor,NJ': (40.2983, -74.6186), 
+            'Lawrence,NJ':(40.2778, -74.7294), 'Seattle,WA':(47.6062, -122.3321), 'NYC,NY':(40.7128, -74.0060)}
+cities2idx = {'Princeton,NJ': 1, 'West Windsor,NJ': 2, 
+              'Lawrence,NJ': 3, 'Seattle,WA': 4, 'NYC,NY':5}
+
+
+def gmap_checkpoint():
+    return os.path.join(current_app.instance_path, 'gmap_checkpoint.jsonl')
+
+
+'''
+fetch the landmarks of every city from the Places API
+returns {name: (type, lat, lng, rating, city name)}
+'''
+def fetch_layout(replay_only=False):
+    from housing.utils.gmap import fetch_all_places
+    from housing.utils.response_cache import ResponseCache
+    replay_only = replay_only or current_app.config['GMAP_REPLAY_ONLY']
+    gmap_token = ''
+    if not replay_only:
+        with open('./housing/access_token/gmap.txt') as f:
+            gmap_token = f.read()
 
     logging.critical('========= Starting API call to get layout data =========')
-    response = dict()
+    jobs = []
     for city, location in citiesLoc.items():
         for layout in layout_types:
             if layout == 'subway_station' and city in {'Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ'}:
                 continue
-            response = fetch_gmap_data(layout, location, response, gmap_token, city)
+            jobs.append((city, location, layout))
+    # landmarks barely change, responses are kept on disk and replayed by later runs
+    cache = ResponseCache(current_app.config['GMAP_CACHE_DIR'],
+                          ttl=current_app.config['GMAP_CACHE_TTL'],
+                          max_bytes=current_app.config['GMAP_CACHE_MAX_BYTES'],
+                          replay_only=replay_only)
+    # finished searches are checkpointed, a failed run only fetches the missing ones when rerun
+    response = fetch_all_places(jobs, gmap_token, checkpoint=gmap_checkpoint(),
+                                workers=current_app.config['GMAP_WORKERS'],
+                                rate=current_app.config['GMAP_RATE'],
+                                url=current_app.config['GMAP_URL'],
+                                page_token_delay=current_app.config['GMAP_PAGE_TOKEN_DELAY'],
+                                cache=cache)
+    stats = cache.stats()
+    logging.critical('========= Places response cache: {} hits, {} misses ========='.format(stats['hits'], stats['misses']))
+    return response
+
+
+def init_db(replay_only=False):
+    from housing.price_model import clear_price_models
+    db = get_write_db()
+    # fetched before the tables are dropped, so a failed fetch leaves the DB as it was
+    response = fetch_layout(replay_only=replay_only)
+
+    logging.critical('========= Initializing tables and city data =========')
+    clear_snapshots(db)
+    clear_price_models(db)
+    # the data revision starts over, artifacts of the old data would pass for the new one
+    clear_artifacts(db)
+    # schema.sql drops tables, city_housing is a view since migration 008 and has to be dropped as one
+    for name, in db.execute("select name from sqlite_master where type = 'view'").fetchall():
+        db.execute('DROP VIEW {}'.format(name))
+    with current_app.open_resource('./sql/schema.sql') as f:
+        db.executescript(f.read().decode('utf8'))
+    with current_app.open_resource('./sql/initial_data.sql') as f:
+        db.executescript(f.read().decode('utf8'))
+    db.execute('PRAGMA user_version = 0')
+    migrate_db()
 
     logging.critical('========= API call was done, storing data to DB =========')
-    for k,v in response.items():
-        db.execute(
-            """
-            INSERT INTO city_layout (landmark_name, landmark_type, landmark_lat, landmark_lng, landmark_rating, city_id)
-            VALUES
-            (?, ?, ?, ?, ?, ?)
-            """, (k, v[0], v[1], v[2], v[3], cities2idx[v[4]])
-        )
+    upsert_layout(db, response, cities2idx)
+    sync_census(db, census_dir)
+    bump_data_revision(db)
+    db.commit()
+    figure_cache.clear()
+    if os.path.exists(gmap_checkpoint()):
+        os.remove(gmap_checkpoint())
+
+
+'''
+refetch the landmarks and upsert them without touching the crawled housing data
+the landmarks, the proximity of the listings and the revision are committed together
+'''
+def refresh_layout(replay_only=False):
+    from housing.proximity import refresh_proximity
+    # the upsert needs the natural key index of the migrations
+    migrate_db()
+    db = get_write_db()
+    response = fetch_layout(replay_only=replay_only)
+    # nothing is committed when a step fails, closing the connection rolls it back
+    upserted, deleted = upsert_layout(db, response, cities2idx)
+    # the distances of every listing were measured to the old landmarks
+    refresh_proximity(db, rebuild=True)
+    # the migrations may have emptied census_stats
+    sync_census(db, census_dir)
+    bump_data_revision(db)
     db.commit()
+    figure_cache.clear()
+    if os.path.exists(gmap_checkpoint()):
+        os.remove(gmap_checkpoint())
+    return upserted, deleted
+
+
+'''
+revision of the data in the DB, bumped by every command that changes it
+caches of the app processes are dropped when it changes
+returns None when the DB has not been migrated yet
+'''
+def get_data_revision(db):
+    try:
+        row = db.execute("select value from app_meta where key = 'data_revision'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row is not None else None
+
+
+def bump_data_revision(db):
+    db.execute("update app_meta set value = value + 1 where key = 'data_revision'")
+
+
+'''
+the sql files in sql/migrations as (version, path), in the order they are applied
+'''
+def migration_files():
+    migration_dir = os.path.join(current_app.root_path, 'sql', 'migrations')
+    return [(int(os.path.basename(file).split('_')[0]), file) for file in sorted(glob.glob(migration_dir + '/*.sql'))]
 
 
-def update_db_monthly(month):
+'''
+(schema version of the db, version of the latest migration), the db is behind when the first is smaller
+'''
+def schema_versions(db):
+    return db.execute('PRAGMA user_version').fetchone()[0], migration_files()[-1][0]
+
+
+'''
+apply the sql files in sql/migrations that are newer than the db
+the number prefix of the file name is stored in PRAGMA user_version
+'''
+def migrate_db():
+    db = get_write_db()
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    for file_version, file in migration_files():
+        if file_version <= version:
+            continue
+        logging.critical('========= Applying migration: {} ========='.format(os.path.basename(file)))
+        with open(file) as f:
+            db.executescript(f.read())
+        db.execute('PRAGMA user_version = {}'.format(file_version))
+        version = file_version
+    db.commit()
+    return version
+
+
+def update_db_monthly(month, workers=1, chunksize=None):
+    from housing.ingest import ingest_month
+    from housing.monthly_stats import refresh_monthly_stats
+    from housing.spatial_grid import refresh_grid
+    from housing.proximity import refresh_proximity
+    from housing.price_model import score_month
+    # a database from before the latest migrations would take the month in and fail halfway through the refresh
+    migrate_db()
     data_dir = os.path.join('./housing/utils/crawled_data', month)
     if not os.path.exists(data_dir):
         msg = 'Data folder does not exits. Please create a directory and start crawling first \n'
@@ -78,60 +258,151 @@ def update_db_monthly(month):
         logging.exception(msg)
         return
 
-    db = get_db()
-    result = db.execute("""
-    select * from city_housing where crawled_date = ?
-    """, (month, ))
-    record_cnt = 0
-    for record in result: record_cnt += 1
-    if record_cnt > 0:
-        logging.exception('Entered month data already added')
-        return
+    db = get_write_db()
+    # rows are upserted by zillow_url, so a month that was ingested before (or only partly) can be ingested again
+    already_added = db.execute("""
+    select 1 from city_housing where crawled_date = ? limit 1
+    """, (month, )).fetchone()
+    if already_added is not None:
+        logging.critical('========= {} was ingested before, its listings are upserted ========='.format(month))
 
-    city2idx = {'princeton': 1, 'west-windsor-township-nj': 2, 
-            'lawrence-township-nj': 3, 'seattle': 4, 'nyc':5}
-    columns = ['crawled_month','addressStreet', 'unformattedPrice', 'area', 'baths','beds', 'days', 'detailUrl', 'lat', 'lng']
-    
-    for file in glob.glob(data_dir+'/*.csv'):
-        city_name = os.path.basename(file).split(month)[0]
-        city_idx = city2idx[city_name]
-        df = pd.read_csv(file)
-        df['lat'] = [json.loads(string.replace("'", '"')).get('latitude')  for string in df.latLong.tolist()]
-        df['lng'] = [json.loads(string.replace("'", '"')).get('longitude')  for string in df.latLong.tolist()]
-        days = []
-        for string in df.variableData.tolist():
-            day = None
-            if "DAYS_ON" in string:
-                idx = string.index('text')
-                day = int(string[idx:].split()[1][1:])
-            days.append(day)
-        df['days'] = days
-        df = df[columns]
-        records = df.to_numpy()
-        logging.critical('========= Start sync DB for city: {} ========='.format(city_name))
-        logging.critical('{} records crawled'.format(df.shape[0]))
-        for record in records:
-            db.execute(
-            """
-            INSERT INTO city_housing (crawled_date, house_address, price, area, num_bathroom, num_bedroom, num_days_posted, zillow_url, house_lat, house_lng, city_id)
-            VALUES
-            (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (record[0], record[1], record[2], record[3], record[4], record[5], record[6], record[7], record[8], record[9], city_idx))
-        logging.critical('========= DB sync is done for city: {} ========='.format(city_name))
+    # sorted, a listing found in two city files is kept for the first one, whatever the directory order
+    files = sorted(glob.glob(data_dir+'/*.csv'))
+    _, changed_months = ingest_month(db, files, month, workers=workers, chunksize=chunksize)
+    if changed_months:
+        # the listings of this month brought new attributes, which city_housing also shows for these months
+        logging.critical('========= Listings of {} changed, rebuilding {} ========='.format(month, ', '.join(changed_months)))
+    refresh_proximity(db)
+    for changed_month in changed_months + [month]:
+        refresh_monthly_stats(db, changed_month)
+        # scored by the latest model trained up to this month, train-model fits the models of the month itself
+        score_month(db, changed_month)
+        refresh_grid(db, changed_month)
+    # census files added or edited since the last import
+    sync_census(db, census_dir)
+    bump_data_revision(db)
     db.commit()
+    for changed_month in changed_months + [month]:
+        write_month_snapshot(db, changed_month)
+    figure_cache.clear()
 
 
 
 @click.command('init-db')
-def init_db_command():
+@click.option('--replay-only', is_flag=True, help='Only use cached Places responses, never call the API.')
+def init_db_command(replay_only):
     """Clear the existing data and create new tables."""
-    init_db()
+    init_db(replay_only=replay_only)
     click.echo('Initialized the database.')
 
+@click.command('refresh-layout')
+@click.option('--replay-only', is_flag=True, help='Only use cached Places responses, never call the API.')
+def refresh_layout_command(replay_only):
+    """Refetch the landmarks and upsert them, keeping the housing data."""
+    upserted, deleted = refresh_layout(replay_only=replay_only)
+    click.echo('Upserted {} landmarks, deleted {} stale ones.'.format(upserted, deleted))
+
+@click.command('import-census')
+@click.argument('files', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+def import_census_command(files):
+    """Copy census csv files into housing/census_data and import every new or changed one."""
+    for file in files:
+        target = os.path.join(census_dir, os.path.basename(file))
+        if os.path.abspath(file) != os.path.abspath(target):
+            shutil.copyfile(file, target)
+    db = get_write_db()
+    imported = sync_census(db, census_dir)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Imported {} census files.'.format(len(imported)))
+
+@click.command('migrate-db')
+def migrate_db_command():
+    """Apply pending schema migrations without dropping data."""
+    version = migrate_db()
+    # census_stats is empty on a database from before it was added, or after its key changed
+    db = get_write_db()
+    sync_census(db, census_dir)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Database is at schema version {}.'.format(version))
+
+@click.command('check-query-plans')
+def check_query_plans_command():
+    """Warn about hot queries that fall back to a full table scan."""
+    from housing.query_plan import check_query_plans
+    if check_query_plans(get_db()):
+        click.echo('All hot queries use an index.')
+
+@click.command('rebuild-monthly-stats')
+def rebuild_monthly_stats_command():
+    """Recompute the precomputed stats of every crawled month."""
+    from housing.monthly_stats import rebuild_monthly_stats
+    db = get_write_db()
+    months = rebuild_monthly_stats(db)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Rebuilt monthly stats for {} months.'.format(len(months)))
+
+@click.command('rebuild-grid')
+def rebuild_grid_command():
+    """Recompute the map grid of every crawled month."""
+    from housing.spatial_grid import rebuild_grid
+    db = get_write_db()
+    months = rebuild_grid(db)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Rebuilt map grid for {} months.'.format(len(months)))
+
+@click.command('rebuild-proximity')
+def rebuild_proximity_command():
+    """Recompute the distances of every listing to the landmarks."""
+    from housing.proximity import refresh_proximity
+    db = get_write_db()
+    listings = refresh_proximity(db, rebuild=True)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Computed the proximity of {} listings.'.format(listings))
+
+@click.command('train-model')
+@click.argument('month', required=False)
+def train_model_command(month):
+    """Fit a price model per city on MONTH (the latest crawled month by default) and score its listings."""
+    from housing.price_model import train_price_models, score_month
+    db = get_write_db()
+    month = month or db.execute('select max(crawled_date) from listing_observation').fetchone()[0]
+    if month is None:
+        raise click.ClickException('There are no crawled listings to train on.')
+    model_ids = train_price_models(db, month)
+    score_month(db, month)
+    bump_data_revision(db)
+    db.commit()
+    click.echo('Trained {} price models on {}.'.format(len(model_ids), month))
+
+@click.command('rebuild-snapshots')
+def rebuild_snapshots_command():
+    """Rewrite the columnar snapshots of every crawled month."""
+    rows = rebuild_snapshots(get_write_db())
+    figure_cache.clear()
+    click.echo('Wrote snapshots of {} listings.'.format(rows))
+
+@click.command('warm-cache')
+@click.option('--workers', default=os.cpu_count(), show_default=True, help='Number of processes rendering the views.')
+def warm_cache_command(workers):
+    """Render the views of every location with the default filters into the artifact store."""
+    try:
+        results = warm_artifacts(get_db(), workers=workers)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo('Warmed {} views of revision {}.'.format(len(results), results[0][3]))
+
 @click.command('update-db-monthly')
 @click.argument('month')
-def update_db_monthly_command(month):
-    update_db_monthly(month)
+@click.option('--workers', default=1, show_default=True, help='Number of processes used to parse the crawled csv files.')
+@click.option('--chunksize', type=int, default=None,
+              help='Stream the csv files this many rows at a time, deduping listings by url. Ignores --workers.')
+def update_db_monthly_command(month, workers, chunksize):
+    update_db_monthly(month, workers=workers, chunksize=chunksize)
     click.echo('Updated the database.')
 
 
@@ -139,4 +410,14 @@ def init_app(app):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
     app.cli.add_command(update_db_monthly_command)
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(rebuild_monthly_stats_command)
+    app.cli.add_command(rebuild_grid_command)
+    app.cli.add_command(rebuild_snapshots_command)
+    app.cli.add_command(rebuild_proximity_command)
+    app.cli.add_command(train_model_command)
+    app.cli.add_command(warm_cache_command)
+    app.cli.add_command(refresh_layout_command)
+    app.cli.add_command(import_census_command)
 
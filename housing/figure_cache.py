@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+
+# revision of put for values that do not depend on the data revision
+any_revision = object()
+
+
+'''
+in-process LRU cache for rendered figure json and tables
+bounded by number of entries and by the total length of the cached strings
+entries belong to one data revision of the DB, a new revision drops everything
+'''
+class FigureCache():
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.revision = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def configure(self, max_entries, max_bytes):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def check_revision(self, revision):
+        with self.lock:
+            if revision != self.revision:
+                self.entries.clear()
+                self.size = 0
+                self.revision = revision
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+
+    '''
+    revision is the data revision the value was built from, read before building it
+    a value built while another request moved the cache on to a newer revision is not kept
+    '''
+    def put(self, key, value, revision=any_revision):
+        size = entry_size(value)
+        with self.lock:
+            if size > self.max_bytes or (revision is not any_revision and revision != self.revision):
+                return
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'revision': self.revision,
+            }
+
+
+def entry_size(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(entry_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(entry_size(v) for v in value.values())
+    # numpy arrays
+    return getattr(value, 'nbytes', 0)
+
+
+figure_cache = FigureCache()
+
+
+def init_app(app):
+    figure_cache.configure(app.config['FIGURE_CACHE_MAX_ENTRIES'], app.config['FIGURE_CACHE_MAX_BYTES'])
@@ -0,0 +1,274 @@
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+
+
+city2idx = {'princeton': 1, 'west-windsor-township-nj': 2,
+            'lawrence-township-nj': 3, 'seattle': 4, 'nyc': 5}
+columns = ['crawled_month', 'addressStreet', 'unformattedPrice', 'area', 'baths', 'beds', 'days', 'detailUrl', 'lat', 'lng']
+# raw csv columns needed to build `columns`, everything else the crawler saved is skipped by read_csv
+raw_columns = ['crawled_month', 'addressStreet', 'unformattedPrice', 'area', 'baths', 'beds', 'detailUrl', 'latLong', 'variableData']
+# fixed dtypes for the chunked reader, so every chunk parses the same way instead of inferring per chunk
+raw_dtypes = {'crawled_month': str, 'addressStreet': str, 'unformattedPrice': 'float64', 'area': 'float64',
+              'baths': 'float64', 'beds': 'float64', 'detailUrl': str, 'latLong': str, 'variableData': str}
+
+# latLong looks like "{'latitude': 40.35, 'longitude': -74.66}"
+LAT_PATTERN = r"""['"]latitude['"]\s*:\s*(-?\d+(?:\.\d+)?(?:[eE]-?\d+)?)"""
+LNG_PATTERN = r"""['"]longitude['"]\s*:\s*(-?\d+(?:\.\d+)?(?:[eE]-?\d+)?)"""
+# variableData looks like "{'type': 'DAYS_ON', 'text': '3 days on Zillow'}"
+DAYS_PATTERN = r"""DAYS_ON.*?text\S*\s+\S(\d+)"""
+
+# crawled rows are written in this column order, like frame_to_records makes them
+housing_columns = ['crawled_date', 'house_address', 'price', 'area', 'num_bathroom', 'num_bedroom', 'num_days_posted',
+                   'zillow_url', 'house_lat', 'house_lng', 'city_id']
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE IF NOT EXISTS housing_staging (
+      crawled_date TEXT, house_address TEXT, price REAL, area REAL, num_bathroom REAL, num_bedroom REAL,
+      num_days_posted REAL, zillow_url TEXT, house_lat REAL, house_lng REAL, city_id INTEGER
+    )
+    """
+
+STAGE_HOUSING = """
+    INSERT INTO temp.housing_staging ({})
+    VALUES ({})
+    """.format(', '.join(housing_columns), ', '.join('?' * len(housing_columns)))
+
+# attributes of a staged row that are not older than the latest month its listing was observed in
+LATEST_ATTRIBUTES = """
+    NOT EXISTS (
+      SELECT 1 FROM listing JOIN listing_observation ON listing_observation.listing_id = listing.id
+      WHERE listing.zillow_url = housing_staging.zillow_url AND listing_observation.crawled_date > housing_staging.crawled_date
+    )
+    """
+
+ATTRIBUTES_CHANGED = """
+    (listing.house_address, listing.area, listing.num_bathroom, listing.num_bedroom, listing.house_lat, listing.house_lng)
+      IS NOT (housing_staging.house_address, housing_staging.area, housing_staging.num_bathroom, housing_staging.num_bedroom,
+              housing_staging.house_lat, housing_staging.house_lng)
+    """
+
+# earlier months whose city_housing rows change with the attributes the staged rows bring
+# cross join keeps the staging table first, sqlite has no stats on it and would scan every observation instead
+CHANGED_MONTHS = """
+    SELECT DISTINCT listing_observation.crawled_date
+    FROM temp.housing_staging
+    CROSS JOIN listing ON listing.zillow_url = housing_staging.zillow_url
+    CROSS JOIN listing_observation ON listing_observation.listing_id = listing.id
+    WHERE listing_observation.crawled_date < housing_staging.crawled_date AND {} AND {}
+    """.format(ATTRIBUTES_CHANGED, LATEST_ATTRIBUTES)
+
+# a listing is only rewritten when something besides price and days changed,
+# and not by a month older than one it was already observed in, e.g. a backfill
+UPSERT_LISTINGS = """
+    INSERT INTO listing (zillow_url, house_address, area, num_bathroom, num_bedroom, house_lat, house_lng)
+    SELECT zillow_url, house_address, area, num_bathroom, num_bedroom, house_lat, house_lng
+    FROM temp.housing_staging WHERE zillow_url IS NOT NULL AND {}
+    ON CONFLICT (zillow_url) DO UPDATE SET
+      house_address = excluded.house_address,
+      area = excluded.area,
+      num_bathroom = excluded.num_bathroom,
+      num_bedroom = excluded.num_bedroom,
+      house_lat = excluded.house_lat,
+      house_lng = excluded.house_lng
+    WHERE (house_address, area, num_bathroom, num_bedroom, house_lat, house_lng)
+      IS NOT (excluded.house_address, excluded.area, excluded.num_bathroom, excluded.num_bedroom, excluded.house_lat, excluded.house_lng)
+    """.format(LATEST_ATTRIBUTES)
+
+# `where true` keeps sqlite from reading ON CONFLICT as part of the join
+UPSERT_OBSERVATIONS = """
+    INSERT INTO listing_observation (city_id, crawled_date, listing_id, price, num_days_posted)
+    SELECT housing_staging.city_id, housing_staging.crawled_date, listing.id, housing_staging.price, housing_staging.num_days_posted
+    FROM temp.housing_staging CROSS JOIN listing ON listing.zillow_url = housing_staging.zillow_url WHERE true
+    ON CONFLICT (crawled_date, listing_id) DO UPDATE SET
+      city_id = excluded.city_id,
+      price = excluded.price,
+      num_days_posted = excluded.num_days_posted
+    """
+
+
+'''
+write crawled rows (tuples in the order of housing_columns) to listing and listing_observation
+the rows are loaded into a temp staging table, then the listings and their observations of the month are upserted
+with one statement each, so ingesting a month again leaves the same rows. rows without a zillow_url are skipped
+the caller commits
+returns the set of earlier months whose rows changed, their stats, grid and snapshots have to be rebuilt
+'''
+def write_housing(db, records):
+    db.execute(CREATE_STAGING)
+    db.executemany(STAGE_HOUSING, records)
+    changed = {row[0] for row in db.execute(CHANGED_MONTHS)}
+    db.execute(UPSERT_LISTINGS)
+    db.execute(UPSERT_OBSERVATIONS)
+    db.execute('DELETE FROM temp.housing_staging')
+    return changed
+
+
+def city_from_file(file, month):
+    return os.path.basename(file).split(month)[0]
+
+
+'''
+parse one crawled csv with vectorized string ops
+lat/lng come out of latLong, days come out of variableData when it has DAYS_ON
+returns a dataframe with the columns in `columns`
+'''
+def parse_crawled_frame(df):
+    lat_lng = df['latLong'].astype(str)
+    df['lat'] = pd.to_numeric(lat_lng.str.extract(LAT_PATTERN, expand=False))
+    df['lng'] = pd.to_numeric(lat_lng.str.extract(LNG_PATTERN, expand=False))
+    variable_data = df['variableData'].astype(str)
+    df['days'] = pd.to_numeric(variable_data.str.extract(DAYS_PATTERN, expand=False))
+    return df[columns]
+
+
+def parse_crawled_csv(file, month):
+    return city_from_file(file, month), parse_crawled_frame(pd.read_csv(file, usecols=raw_columns))
+
+
+'''
+parse one crawled csv chunksize rows at a time
+yields dataframes with the columns in `columns`, only one chunk is held in memory
+'''
+def parse_crawled_chunks(file, chunksize):
+    with pd.read_csv(file, usecols=raw_columns, dtype=raw_dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield parse_crawled_frame(chunk)
+
+
+'''
+drop the listings of a parsed chunk that have no url or no positive price,
+and the listings whose url was already seen in this chunk or an earlier one
+seen is an array of 64 bit hashes of the urls kept so far rather than the urls
+returns (kept listings, seen with the kept urls added, invalid count, duplicate count)
+'''
+def dedupe_listings(df, seen):
+    valid = df['detailUrl'].notna() & (df['unformattedPrice'] > 0)
+    invalid = int((~valid).sum())
+    unique = df[valid].drop_duplicates('detailUrl')
+    hashes = pd.util.hash_pandas_object(unique['detailUrl'], index=False).to_numpy()
+    new = ~np.isin(hashes, seen)
+    return unique[new], np.concatenate([seen, hashes[new]]), invalid, int(valid.sum()) - int(new.sum())
+
+
+def no_urls_seen():
+    return np.empty(0, dtype=np.uint64)
+
+
+'''
+parse every csv, optionally in a process pool
+returns a list of (city_name, dataframe) in the same order as files
+'''
+def parse_crawled_files(files, month, workers=1):
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(parse_crawled_csv, files, repeat(month)))
+    return [parse_crawled_csv(file, month) for file in files]
+
+
+'''
+turn a parsed frame into plain python tuples for executemany
+NaN becomes None so sqlite stores NULL
+'''
+def frame_to_records(df, city_idx):
+    df = df.astype(object).where(df.notna(), None)
+    df['city_id'] = city_idx
+    return list(df.itertuples(index=False, name=None))
+
+
+'''
+write all records of one city with write_housing in a single transaction
+listings are upserted by zillow_url, the ones without url are skipped
+returns the number of written rows and the earlier months whose rows changed
+'''
+def bulk_insert_city(db, df, city_idx):
+    missing = df['detailUrl'].isna()
+    if missing.any():
+        logging.critical('{} records without url skipped'.format(int(missing.sum())))
+        df = df[~missing]
+    records = frame_to_records(df, city_idx)
+    with db:
+        changed = write_housing(db, records)
+    return len(records), changed
+
+
+'''
+stream one crawled csv into listing and listing_observation in a single transaction, chunksize rows at a time
+every chunk goes through the staging table on its own, so memory stays bounded by one chunk whatever the file size
+returns (inserted, invalid, duplicate) counts, seen with the urls of the file added and the earlier months whose rows changed
+'''
+def stream_city(db, file, month, city_idx, chunksize, seen):
+    inserted, invalid_total, duplicate_total = 0, 0, 0
+    changed = set()
+    with db:
+        for df in parse_crawled_chunks(file, chunksize):
+            df, seen, invalid, duplicate = dedupe_listings(df, seen)
+            changed |= write_housing(db, frame_to_records(df, city_idx))
+            inserted += len(df)
+            invalid_total += invalid
+            duplicate_total += duplicate
+    return inserted, invalid_total, duplicate_total, seen, changed
+
+
+'''
+chunked ingest: the files are read one after another in chunks of chunksize rows,
+listings are validated and deduped by zillow_url across all chunks and files of the month
+returns like ingest_month
+'''
+def stream_month(db, files, month, chunksize):
+    start = time.perf_counter()
+    seen = no_urls_seen()
+    total = 0
+    changed = set()
+    for file in files:
+        city_name = city_from_file(file, month)
+        city_idx = city2idx[city_name]
+        logging.critical('========= Start streaming city: {} ({} rows per chunk) ========='.format(city_name, chunksize))
+        city_start = time.perf_counter()
+        inserted, invalid, duplicate, seen, city_changed = stream_city(db, file, month, city_idx, chunksize, seen)
+        changed |= city_changed
+        elapsed = time.perf_counter() - city_start
+        logging.critical('========= DB sync is done for city: {} ({} rows, {} invalid, {} duplicates skipped, {:.0f} rows/sec) ========='.format(
+            city_name, inserted, invalid, duplicate, inserted / elapsed if elapsed > 0 else float('inf')))
+        total += inserted
+
+    elapsed = time.perf_counter() - start
+    logging.critical('========= {} rows ingested in {:.2f}s ({:.0f} rows/sec) ========='.format(
+        total, elapsed, total / elapsed if elapsed > 0 else float('inf')))
+    return total, sorted(changed)
+
+
+'''
+If set chunksize, the files are streamed with stream_month instead of parsed whole
+both ways skip the same invalid and duplicate listings, so they write the same rows
+returns the number of ingested rows and the sorted earlier months whose rows changed with the listings of this month
+'''
+def ingest_month(db, files, month, workers=1, chunksize=None):
+    if chunksize:
+        return stream_month(db, files, month, chunksize)
+    start = time.perf_counter()
+    parsed = parse_crawled_files(files, month, workers=workers)
+    seen = no_urls_seen()
+    total = 0
+    changed = set()
+    for city_name, df in parsed:
+        city_idx = city2idx[city_name]
+        logging.critical('========= Start sync DB for city: {} ========='.format(city_name))
+        logging.critical('{} records crawled'.format(df.shape[0]))
+        city_start = time.perf_counter()
+        df, seen, invalid, duplicate = dedupe_listings(df, seen)
+        inserted, city_changed = bulk_insert_city(db, df, city_idx)
+        changed |= city_changed
+        elapsed = time.perf_counter() - city_start
+        logging.critical('========= DB sync is done for city: {} ({} rows, {} invalid, {} duplicates skipped, {:.0f} rows/sec) ========='.format(
+            city_name, inserted, invalid, duplicate, inserted / elapsed if elapsed > 0 else float('inf')))
+        total += inserted
+
+    elapsed = time.perf_counter() - start
+    logging.critical('========= {} rows ingested in {:.2f}s ({:.0f} rows/sec) ========='.format(
+        total, elapsed, total / elapsed if elapsed > 0 else float('inf')))
+    return total, sorted(changed)
@@ -0,0 +1,48 @@
+import logging
+
+
+# the natural key of city_layout, must match the expressions of city_layout_natural_key
+natural_key = 'city_id, landmark_name, round(landmark_lat, 4), round(landmark_lng, 4)'
+
+
+'''
+turn the fetched places {name: (type, lat, lng, rating, city name)} into rows for city_layout
+places of cities without an id are skipped
+'''
+def layout_records(places, cities2idx):
+    return [(name, place[0], place[1], place[2], place[3], cities2idx[place[4]])
+            for name, place in places.items() if place[4] in cities2idx]
+
+
+'''
+upsert the fetched places into city_layout on the natural key, the caller commits
+landmarks of the refreshed cities that were not fetched again are deleted
+returns (upserted rows, deleted rows)
+'''
+def upsert_layout(db, places, cities2idx):
+    records = layout_records(places, cities2idx)
+    city_ids = sorted({record[-1] for record in records})
+    db.execute('DROP TABLE IF EXISTS temp.refreshed_layout')
+    db.execute("""
+        CREATE TEMP TABLE refreshed_layout (
+          landmark_name TEXT, landmark_type TEXT, landmark_lat REAL, landmark_lng REAL, landmark_rating REAL, city_id INTEGER
+        )
+        """)
+    db.executemany('INSERT INTO temp.refreshed_layout VALUES (?, ?, ?, ?, ?, ?)', records)
+    # `where true` tells the parser the upsert clause does not belong to a join
+    db.execute("""
+        INSERT INTO city_layout (landmark_name, landmark_type, landmark_lat, landmark_lng, landmark_rating, city_id)
+        SELECT landmark_name, landmark_type, landmark_lat, landmark_lng, landmark_rating, city_id FROM temp.refreshed_layout WHERE true
+        ON CONFLICT ({}) DO UPDATE SET
+          landmark_type = excluded.landmark_type,
+          landmark_lat = excluded.landmark_lat,
+          landmark_lng = excluded.landmark_lng,
+          landmark_rating = excluded.landmark_rating
+        """.format(natural_key))
+    deleted = db.execute("""
+        DELETE FROM city_layout
+        WHERE city_id IN ({}) AND ({}) NOT IN (SELECT {} FROM temp.refreshed_layout)
+        """.format(','.join('?' * len(city_ids)), natural_key, natural_key), city_ids).rowcount
+    db.execute('DROP TABLE temp.refreshed_layout')
+    logging.critical('========= {} landmarks upserted, {} stale landmarks deleted ========='.format(len(records), deleted))
+    return len(records), deleted
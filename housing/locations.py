@@ -0,0 +1,21 @@
+from flask import abort
+
+# url location -> (city names in the city table, map center)
+locations = {
+    'princeton': (['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ'], (40.3573, -74.6672)),
+    'nyc': (['NYC,NY'], (40.7128, -74.0060)),
+    'seattle': (['Seattle,WA'], (47.6062, -122.3321)),
+}
+
+
+def get_location(location):
+    if location not in locations:
+        abort(404)
+    return locations[location]
+
+
+def find_location(cities):
+    for location, (location_cities, _) in locations.items():
+        if sorted(location_cities) == sorted(cities):
+            return location
+    return None
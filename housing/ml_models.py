@@ -1,60 +1,66 @@
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 import numpy as np
-import statistics
+import pandas as pd
+from housing.figure_cache import FigureCache
 
-'''
-remove null values
-takes a list of list [query1_result, query2_result, ...]
-returns a list of list with null value removed
-'''
-def remove_null_values(lst_lst):
-    transpose = np.array(lst_lst).T
-    filtered = []
-    for i in range(len(transpose)):
-        is_not_null = True
-        for j in range(len(transpose[0])):
-            if transpose[i][j] is None:
-                is_not_null = False
-                break
-        if is_not_null:
-            filtered.append(transpose[i])
-    return np.array(filtered).T.tolist()
+
+# clustering results per (location, month, filters), and the last centroids per location to warm start from
+cluster_cache = FigureCache(max_entries=64)
+centroid_cache = dict()
 
 
 '''
 takes coords and price, run kmeans (k is selected by rule of thumbs)
+mini batch kmeans, warm started from init_centers when they have the same k
 returns a dictionary
-{   
+{
     lats: [],          # filtered null value
     lngs: [],          # filted null value
     prices: [],        # filtered null value
     urls: [],          # filtered null value
-    labels: [],     
-    medium_prices: [] 
-
+    labels: [],
+    medium_prices: [],
+    centers: []
 }
 '''
-def run_KMeans (lats, lngs, price, urls, max_cluster_size = 10):
-    [lats, lngs, price, urls] = remove_null_values([lats, lngs, price, urls])
-    coords = np.array([lats, lngs]).T
-    best_k = int(np.sqrt(len(price)/2))
-    kmeans = KMeans(n_clusters=best_k, max_iter=1000, init ='k-means++').fit(coords, sample_weight=price)
+def run_KMeans (lats, lngs, price, urls, max_cluster_size = 10, init_centers=None):
+    # values from the db are floats or None, None becomes nan
+    lats = np.array(lats, dtype=float)
+    lngs = np.array(lngs, dtype=float)
+    price = np.array(price, dtype=float)
+    urls = np.array(urls, dtype=object)
+    is_not_null = np.isfinite(lats) & np.isfinite(lngs) & np.isfinite(price) & ~pd.isna(urls)
+    lats, lngs, price, urls = lats[is_not_null], lngs[is_not_null], price[is_not_null], urls[is_not_null]
+
+    if len(price) == 0:
+        empty = np.array([])
+        return {"lats": lats, "lngs": lngs, "price": price, "urls": urls, "labels": empty, "medium_prices": empty, "centers": None}
+
+    coords = np.column_stack([lats, lngs])
+    best_k = min(max(int(np.sqrt(len(price)/2)), 1), len(price))
+    # a couple of passes over the data from k-means++, a single pass is enough from the cached centroids
+    params = dict(n_clusters=best_k, n_init=1, batch_size=4096, max_no_improvement=3, random_state=0)
+    if init_centers is not None and len(init_centers) == best_k:
+        kmeans = MiniBatchKMeans(init=init_centers, max_iter=1, **params)
+    else:
+        kmeans = MiniBatchKMeans(init='k-means++', init_size=min(len(price), 8 * best_k), max_iter=2, **params)
+    kmeans.fit(coords, sample_weight=price)
     labels = kmeans.labels_
-    label_prices = dict()
-
-    for i in range(best_k):
-        group = []
-        for j,label in enumerate(labels):
-            if label == i:
-                group.append(price[j])
-        label_prices[i] = statistics.median(group)
-    
-    print(label_prices)
-    
-    medium_prices = []
-    for label in labels:
-        medium_prices.append(label_prices[label])
-    
-    return {"lats": lats, "lngs": lngs,  "price": price, "urls": urls, "labels": labels,  "medium_prices": medium_prices,}
+
+    medium_prices = pd.Series(price).groupby(labels).transform('median').to_numpy()
+
+    return {"lats": lats, "lngs": lngs,  "price": price, "urls": urls, "labels": labels,  "medium_prices": medium_prices, "centers": kmeans.cluster_centers_}
 
 
+'''
+run_KMeans with the result cached per cache_key, e.g. (location, month, filters)
+the last centroids of seed_key, e.g. the location, warm start the next run
+'''
+def cached_KMeans(cache_key, seed_key, lats, lngs, price, urls, revision=None):
+    cluster_cache.check_revision(revision)
+    result = cluster_cache.get(cache_key)
+    if result is None:
+        result = run_KMeans(lats, lngs, price, urls, init_centers=centroid_cache.get(seed_key))
+        centroid_cache[seed_key] = result['centers']
+        cluster_cache.put(cache_key, result, revision)
+    return result
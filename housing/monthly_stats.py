@@ -0,0 +1,124 @@
+import logging
+import numpy as np
+import pandas as pd
+from housing.locations import locations
+from housing.query_builder import housing_query
+
+
+aggregated_types = ['price', 'unitPrice']
+box_columns = ['listing_count', 'q1', 'median', 'q3', 'lower_fence', 'upper_fence']
+group_columns = ['listing_count', 'min', 'max', 'median']
+
+
+'''
+takes a dataframe with price and area columns
+returns the price series the aggregated type is about (price, or price per square feet)
+'''
+def aggregated_prices(df, aggregated_type):
+    if aggregated_type == 'unitPrice':
+        df = df[df['area'] > 0]
+        return df['price'] / df['area']
+    return df['price']
+
+
+'''
+box plot numbers of one month of prices
+If set remove_outliers to true,
+then use IQR (Inter Quartile Range) to remove outliers first
+whiskers go to the furthest price within 1.5 IQR of the quartiles, the way plotly draws them
+returns a dict with box_columns, None when there are no prices
+'''
+def box_stats(prices, remove_outliers=True):
+    prices = np.asarray(prices, dtype=float)
+    prices = prices[~np.isnan(prices)]
+    if remove_outliers and len(prices) > 0:
+        Q1, Q3 = np.percentile(prices, [25, 75], method='midpoint')
+        IQR = Q3 - Q1
+        prices = prices[(prices >= Q1-1.5*IQR) & (prices <= Q3+1.5*IQR)]
+    if len(prices) == 0:
+        return None
+
+    q1, median, q3 = np.percentile(prices, [25, 50, 75])
+    iqr = q3 - q1
+    return {
+        'listing_count': len(prices),
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lower_fence': prices[prices >= q1-1.5*iqr].min(),
+        'upper_fence': prices[prices <= q3+1.5*iqr].max(),
+    }
+
+
+'''
+takes a dataframe with month and price columns
+returns one row of box plot numbers per month, sorted by month
+'''
+def monthly_box_stats(df, remove_outliers=True):
+    rows = []
+    for month, prices in df.groupby('month')['price']:
+        stats = box_stats(prices, remove_outliers=remove_outliers)
+        if stats is not None:
+            rows.append(dict(month=month, **stats))
+    return pd.DataFrame(rows, columns=['month'] + box_columns)
+
+
+'''
+takes a dataframe with Bedrooms, Bathrooms and price columns
+returns count, min, max, medium price of each bedroom and bathroom group
+'''
+def group_stats(df):
+    groups = df.dropna()
+    groups = groups[(groups.Bathrooms > 0) & (groups.Bedrooms > 0)]
+    groups = groups.astype({'Bathrooms': int, 'Bedrooms': int, 'price': float})
+    groups = groups.groupby(['Bedrooms', 'Bathrooms'])['price'].agg(['count', 'min', 'max', 'median'])
+    return groups.rename(columns={'count': 'listing_count'})
+
+
+def read_month_listings(db, cities, month):
+    query = db.cursor()
+    query.row_factory = None
+    sql, params = housing_query(['price', 'area', 'num_bedroom', 'num_bathroom'], cities, month)
+    rows = query.execute(sql, params).fetchall()
+    df = pd.DataFrame.from_records(rows, columns=['price', 'area', 'Bedrooms', 'Bathrooms'])
+    return df.astype(float)
+
+
+'''
+recompute the precomputed stats rows of every location for one crawled month
+runs in a single transaction, rows of the month are replaced
+'''
+def refresh_monthly_stats(db, month):
+    with db:
+        for location, (cities, _) in locations.items():
+            listings = read_month_listings(db, cities, month)
+            db.execute('delete from city_housing_monthly_stats where location = ? and crawled_date = ?', (location, month))
+            db.execute('delete from city_housing_monthly_group_stats where location = ? and crawled_date = ?', (location, month))
+            for aggregated_type in aggregated_types:
+                prices = aggregated_prices(listings, aggregated_type)
+                stats = box_stats(prices)
+                if stats is None:
+                    continue
+                db.execute(
+                    """
+                    INSERT INTO city_housing_monthly_stats (location, crawled_date, aggregated_type, listing_count, q1, median, q3, lower_fence, upper_fence)
+                    VALUES
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (location, month, aggregated_type, *[float(stats[c]) for c in box_columns]))
+
+                groups = group_stats(listings.loc[prices.index].assign(price=prices))
+                db.executemany(
+                    """
+                    INSERT INTO city_housing_monthly_group_stats (location, crawled_date, aggregated_type, num_bedroom, num_bathroom, listing_count, min_price, max_price, median_price)
+                    VALUES
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [(location, month, aggregated_type, int(beds), int(baths), int(row.listing_count), row['min'], row['max'], row['median'])
+                          for (beds, baths), row in groups.iterrows()])
+    logging.critical('========= Monthly stats refreshed for: {} ========='.format(month))
+
+
+def rebuild_monthly_stats(db):
+    months = [row[0] for row in db.execute('select distinct crawled_date from city_housing order by crawled_date')]
+    for month in months:
+        refresh_monthly_stats(db, month)
+    return months
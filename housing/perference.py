@@ -1,8 +1,78 @@
+import math
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+
+# field name -> name of the input in the preference form of map.html
+form_fields = {
+    'bedroom_from': 'bedroomFrom',
+    'bedroom_to': 'bedroomTo',
+    'bathroom_from': 'bathroomFrom',
+    'bathroom_to': 'bathroomTo',
+    'aggregated_type': 'aggregatedType',
+    'max_posted_days': 'maxPostedDays',
+    'max_distance_to_train': 'maxDistanceToTrain',
+}
+aggregated_types = ('price', 'unitPrice')
+
+
+'''
+preference filters of one request
+immutable and hashable, so it can be part of a cache key
+'''
+@dataclass(frozen=True)
 class Perference():
-    def __init__(self, bedroom_from=None, bedroom_to=None, bathroom_from=None, bathroom_to=None, aggregated_type=None, max_posted_days=None):
-        self.bedroom_from = bedroom_from
-        self.bedroom_to = bedroom_to
-        self.bathroom_from = bathroom_from
-        self.bathroom_to = bathroom_to
-        self.aggregated_type = aggregated_type
-        self.max_posted_days = max_posted_days
\ No newline at end of file
+    bedroom_from: Optional[float] = None
+    bedroom_to: Optional[float] = None
+    bathroom_from: Optional[float] = None
+    bathroom_to: Optional[float] = None
+    aggregated_type: Optional[str] = None
+    max_posted_days: Optional[int] = None
+    max_distance_to_train: Optional[float] = None
+
+    '''
+    validate the values of a form, query string or json body
+    empty values mean no filter, raises ValueError on anything else that is not a valid filter
+    '''
+    @classmethod
+    def from_form(cls, form):
+        values = {}
+        for field, name in form_fields.items():
+            value = form.get(name)
+            if isinstance(value, str):
+                value = value.strip()
+            values[field] = None if value in (None, '') else value
+
+        for field in ['bedroom_from', 'bedroom_to', 'bathroom_from', 'bathroom_to', 'max_distance_to_train']:
+            values[field] = parse_number(field, values[field], float)
+        values['max_posted_days'] = parse_number('max_posted_days', values['max_posted_days'], int)
+
+        aggregated_type = values['aggregated_type']
+        if aggregated_type == 'price':
+            aggregated_type = None
+        if aggregated_type is not None and aggregated_type not in aggregated_types:
+            raise ValueError('aggregated_type must be one of {}'.format(', '.join(aggregated_types)))
+        values['aggregated_type'] = aggregated_type
+        return cls(**values)
+
+    def to_form(self):
+        return {name: getattr(self, field) for field, name in form_fields.items() if getattr(self, field) is not None}
+
+    def to_kwargs(self):
+        return asdict(self)
+
+
+def has_form_fields(form):
+    return any(name in form for name in form_fields.values())
+
+
+def parse_number(field, value, number_type):
+    if value is None:
+        return None
+    try:
+        number = number_type(float(value)) if number_type is int else number_type(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('{} must be a number'.format(field))
+    if not math.isfinite(number) or number < 0:
+        raise ValueError('{} must be a non-negative number'.format(field))
+    return number
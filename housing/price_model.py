@@ -0,0 +1,177 @@
+import datetime
+import logging
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from housing.figure_cache import FigureCache
+from housing.snapshots import sidecar_dir
+
+
+# columns of city_housing the price is predicted from, missing values are fine for the regressor
+model_features = ['num_bedroom', 'num_bathroom', 'area', 'house_lat', 'house_lng', 'num_days_posted']
+# a city needs this many priced listings in a month to get a model
+min_training_rows = 50
+# a listing is an outlier when its log price is this many residual deviations away from the prediction
+outlier_deviations = 3
+# listings are scored in batches so memory stays bounded on large months
+batch_size = 50000
+
+# fitted models loaded in this process, by (id, trained_at) since ids start over after init-db
+model_cache = FigureCache(max_entries=16)
+
+
+def model_dir(db):
+    return sidecar_dir(db, '-models')
+
+
+def clear_price_models(db):
+    directory = model_dir(db)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def read_training_frame(db, city_id, month):
+    query = db.cursor()
+    query.row_factory = None
+    rows = query.execute(
+        """
+        select {}, price from city_housing where city_id = ? and crawled_date = ? and price > 0
+        """.format(','.join(model_features)), (city_id, month)).fetchall()
+    return pd.DataFrame.from_records(rows, columns=model_features + ['price']).astype(float)
+
+
+'''
+gradient boosted trees on log(price), they take missing features as they are
+returns (model, standard deviation of the log residuals on the training listings)
+'''
+def fit_price_model(df):
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    features = df[model_features].to_numpy(dtype=float)
+    target = np.log(df['price'].to_numpy(dtype=float))
+    model = HistGradientBoostingRegressor(max_iter=200, random_state=0)
+    model.fit(features, target)
+    return model, float(np.std(target - model.predict(features)))
+
+
+'''
+fit one model per city on the listings of month and store each as a new version
+the model is written next to the database with its version stamp, features and scikit-learn version
+returns the ids of the new models
+'''
+def train_price_models(db, month):
+    import joblib
+    import sklearn
+    directory = model_dir(db)
+    if directory is None:
+        raise ValueError('price models are stored next to the database file, an in-memory database cannot hold them')
+    os.makedirs(directory, exist_ok=True)
+
+    model_ids = []
+    city_ids = [row[0] for row in db.execute('select distinct city_id from listing_observation where crawled_date = ?', (month, ))]
+    for city_id in city_ids:
+        df = read_training_frame(db, city_id, month)
+        if len(df) < min_training_rows:
+            logging.critical('========= No price model for city {} in {}: {} priced listings ========='.format(city_id, month, len(df)))
+            continue
+        start = time.perf_counter()
+        model, residual_std = fit_price_model(df)
+        trained_at = datetime.datetime.now().isoformat(timespec='seconds')
+        with db:
+            model_id = db.execute(
+                """
+                INSERT INTO price_model (city_id, crawled_date, file, trained_at, training_rows, residual_std)
+                VALUES (?, ?, '', ?, ?, ?)
+                """, (city_id, month, trained_at, len(df), residual_std)).lastrowid
+            file = '{}-{}-v{}.joblib'.format(month, city_id, model_id)
+            payload = {'version': model_id, 'city_id': city_id, 'crawled_date': month, 'trained_at': trained_at,
+                       'features': model_features, 'residual_std': residual_std, 'sklearn_version': sklearn.__version__, 'model': model}
+            joblib.dump(payload, os.path.join(directory, file + '.tmp'))
+            os.replace(os.path.join(directory, file + '.tmp'), os.path.join(directory, file))
+            db.execute('UPDATE price_model SET file = ? WHERE id = ?', (file, model_id))
+        logging.critical('========= Price model v{} for city {} in {}: {} listings in {:.2f}s ========='.format(
+            model_id, city_id, month, len(df), time.perf_counter() - start))
+        model_ids.append(model_id)
+    return model_ids
+
+
+'''
+the latest model of the city trained on month or an earlier month, loaded from disk on first use
+returns the stored payload, or None when the city has no model yet
+'''
+def latest_model(db, city_id, month):
+    row = db.execute(
+        """
+        select id, file, trained_at from price_model where city_id = ? and crawled_date <= ?
+        order by crawled_date desc, id desc limit 1
+        """, (city_id, month)).fetchone()
+    if row is None:
+        return None
+    key = (row[0], row[2])
+    payload = model_cache.get(key)
+    if payload is None:
+        import joblib
+        payload = joblib.load(os.path.join(model_dir(db), row[1]))
+        if payload['features'] != model_features:
+            raise ValueError('price model v{} was trained on {}, run train-model again'.format(row[0], payload['features']))
+        model_cache.put(key, payload)
+    return payload
+
+
+'''
+predicted prices of a batch of listings, each city through its latest model up to month
+df holds the model_features columns, and price for the residuals
+returns a dataframe with predicted_price, model_id, residual and outlier, nan where the city has no model
+'''
+def predict_prices(db, city_ids, df, month):
+    city_ids = np.asarray(city_ids)
+    predicted = np.full(len(df), np.nan)
+    model_ids = np.full(len(df), np.nan)
+    residual_std = np.full(len(df), np.nan)
+    features = df[model_features].to_numpy(dtype=float)
+    for city_id in np.unique(city_ids):
+        payload = latest_model(db, int(city_id), month)
+        if payload is None:
+            continue
+        rows = city_ids == city_id
+        predicted[rows] = np.exp(payload['model'].predict(features[rows]))
+        model_ids[rows] = payload['version']
+        residual_std[rows] = payload['residual_std']
+
+    prices = df['price'].to_numpy(dtype=float) if 'price' in df else np.full(len(df), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        outlier = np.abs(np.log(prices) - np.log(predicted)) > outlier_deviations * residual_std
+    return pd.DataFrame({'predicted_price': predicted, 'model_id': model_ids, 'residual': prices - predicted, 'outlier': outlier})
+
+
+'''
+write the predicted price and residual of every listing of month into listing_prediction
+listings of cities without a model are left out
+returns the number of scored listings
+'''
+def score_month(db, month):
+    start = time.perf_counter()
+    query = db.cursor()
+    query.row_factory = None
+    query.execute('select city_id, id, price, {} from city_housing where crawled_date = ?'.format(','.join(model_features)), (month, ))
+    total = 0
+    with db:
+        db.execute('delete from listing_prediction where crawled_date = ?', (month, ))
+        while True:
+            rows = query.fetchmany(batch_size)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=['city_id', 'id', 'price'] + model_features)
+            scores = predict_prices(db, df['city_id'].to_numpy(), df.astype({'price': float}), month)
+            scored = scores['model_id'].notna().to_numpy()
+            residual = scores['residual'].astype(object).where(scores['residual'].notna(), None)
+            db.executemany(
+                """
+                INSERT OR REPLACE INTO listing_prediction (crawled_date, listing_id, model_id, predicted_price, residual, outlier)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, zip([month] * int(scored.sum()), df['id'][scored].tolist(), scores['model_id'][scored].astype(int).tolist(),
+                         scores['predicted_price'][scored].tolist(), residual[scored].tolist(), scores['outlier'][scored].astype(int).tolist()))
+            total += int(scored.sum())
+    logging.critical('========= {} listings of {} scored in {:.2f}s ========='.format(total, month, time.perf_counter() - start))
+    return total
@@ -0,0 +1,73 @@
+import logging
+import time
+import numpy as np
+
+
+# landmarks counted around a listing within these radii in meters, the within_* columns of listing_proximity
+proximity_radii = {'within_500m': 500, 'within_1km': 1000, 'within_2km': 2000}
+# mean earth radius, the haversine distances of BallTree are in radians
+earth_radius = 6371008.8
+# listings are looked up in batches so memory stays bounded on large months
+batch_size = 50000
+
+
+'''
+one BallTree with the haversine metric per landmark type, over the landmarks of every city
+so a landmark just across a city line still counts as the nearest one
+returns {landmark_type: BallTree}
+'''
+def landmark_trees(db):
+    from sklearn.neighbors import BallTree
+    coords = dict()
+    for landmark_type, lat, lng in db.execute('select landmark_type, landmark_lat, landmark_lng from city_layout').fetchall():
+        coords.setdefault(landmark_type, []).append((lat, lng))
+    return {landmark_type: BallTree(np.radians(points), metric='haversine') for landmark_type, points in coords.items()}
+
+
+'''
+rows of listing_proximity for the listings with ids and coords ([[lat, lng], ...])
+'''
+def proximity_records(trees, ids, coords):
+    points = np.radians(np.asarray(coords, dtype=float))
+    ids = np.asarray(ids).tolist()
+    records = []
+    for landmark_type, tree in trees.items():
+        nearest = (tree.query(points, k=1)[0][:, 0] * earth_radius).tolist()
+        counts = [tree.query_radius(points, r=radius / earth_radius, count_only=True).tolist() for radius in proximity_radii.values()]
+        records += [(landmark_type, listing_id, distance, *within) for listing_id, distance, *within in zip(ids, nearest, *counts)]
+    return records
+
+
+'''
+compute the proximity of the listings that have coordinates but no proximity yet (new or moved listings)
+If set rebuild to true, every listing is computed again, for when the landmarks changed
+the caller commits, so the proximity can go in one transaction with the landmarks it was measured to
+returns the number of listings computed
+'''
+def refresh_proximity(db, rebuild=False):
+    start = time.perf_counter()
+    trees = landmark_trees(db)
+    if rebuild:
+        db.execute('delete from listing_proximity')
+    query = db.cursor()
+    query.row_factory = None
+    query.execute("""
+        select id, house_lat, house_lng from listing
+        where house_lat is not null and house_lng is not null
+        and id not in (select listing_id from listing_proximity)
+        """)
+    total = 0
+    while trees:
+        rows = query.fetchmany(batch_size)
+        if not rows:
+            break
+        ids, lats, lngs = zip(*rows)
+        db.executemany("""
+            INSERT OR REPLACE INTO listing_proximity (landmark_type, listing_id, nearest_m, {})
+            VALUES (?, ?, ?, {})
+            """.format(','.join(proximity_radii), ','.join('?' * len(proximity_radii))),
+            proximity_records(trees, ids, np.column_stack([lats, lngs])))
+        total += len(rows)
+    logging.critical('========= Proximity to {} landmark types computed for {} listings in {:.2f}s ========='.format(
+        len(trees), total, time.perf_counter() - start))
+    return total
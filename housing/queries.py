@@ -1,103 +1,59 @@
 import pandas as pd
-import numpy as np
-import glob
-import logging
-
-def get_census_data(file_path):
-    csv_files = glob.glob(file_path + '/*.csv')
-    dfs = []
-    for file in csv_files:
-        df = pd.read_csv(file).T
-        df.rename(columns={i:elem for i,elem in enumerate(df.iloc[0].to_numpy())}, inplace=True)
-        columns_shown = [
-            "Population Estimates, July 1 2021, (V2021)",
-            "Foreign born persons, percent, 2016-2020",
-            "Owner-occupied housing unit rate, 2016-2020",
-            "Median value of owner-occupied housing units, 2016-2020",
-            "Median selected monthly owner costs -with a mortgage, 2016-2020",
-            "Median selected monthly owner costs -without a mortgage, 2016-2020",
-            "Bachelor's degree or higher, percent of persons age 25 years+, 2016-2020",
-            "Median household income (in 2020 dollars), 2016-2020"
-        ]
-        df = df[columns_shown]
-        dfs.append(df)
-    
-    dfs = pd.concat(dfs).T[["Princeton, New Jersey",  "New York city, New York", "Seattle city, Washington", "United States",]]
-    return dfs
-
-
-def query_add_kwargs(query, kwargs):
-    bedroom_from = kwargs.get('bedroom_from')
-    bedroom_to = kwargs.get('bedroom_to')
-    bathroom_from = kwargs.get('bathroom_from')
-    bathroom_to = kwargs.get('bathroom_to')
-    aggregated_type = kwargs.get('aggregated_type')
-    max_posted_days = kwargs.get('max_posted_days')
-    if bedroom_from:
-        query += " and num_bedroom >= {}".format(bedroom_from)
-    if bedroom_to:
-        query += " and num_bedroom <= {}".format(bedroom_to)
-    if bathroom_from:
-        query += " and num_bathroom >= {}".format(bathroom_from)
-    if bathroom_to:
-        query += " and num_bathroom <= {}".format(bathroom_to)
-    if max_posted_days:
-        query += " and num_days_posted <= {}".format(max_posted_days)
-    if aggregated_type and aggregated_type == "unitPrice":
-        query = query.replace("select price,", "select (price/area) as price,")
-        query += " and area > 0"
-    return query
-
-
-def get_layout_from_db(cursor, landmark_type, cities):
-    if len(cities) not in {1, 3}:
-        logging.exception('Numbers of cities passed is not correct')
-        return
-    if len(cities) == 1:
-        query = cursor.execute(
-        """
-        select landmark_lng,landmark_lat,landmark_name from city_layout join city on city_layout.city_id = city.id
-        where landmark_type = ? and city.city_name = ?
-        """, (landmark_type, cities[0])).fetchall()
+from housing.locations import find_location
+from housing.query_builder import filter_shape, housing_query, all_layouts_query
+from housing.figure_cache import FigureCache
+from housing.monthly_stats import box_columns, group_columns, group_stats, monthly_box_stats
+from housing.snapshots import read_snapshot
 
-    else:
-        query = cursor.execute(
-        """
-        select landmark_lng,landmark_lat,landmark_name from city_layout join city on city_layout.city_id = city.id
-        where landmark_type = ? and city.city_name in (?, ?, ?)
-        """, (landmark_type, cities[0], cities[1], cities[2])).fetchall()
 
-    lons = []
-    lats = []
-    names = []
-    for item in query:
-        lons.append(item['landmark_lng'])
-        lats.append(item['landmark_lat'])
-        names.append(item['landmark_name'])
-    return lons, lats, names
-
-
-def get_housing_from_db(cursor, cities, month, kwargs={}):
-    if len(cities) not in {1, 3}:
-        logging.exception('Numbers of cities passed is not correct')
-        return
-    
-    if len(cities) == 1:
-        base_query = """
-                    select price,zillow_url,house_lat,house_lng from city_housing join city on city_housing.city_id = city.id
-                    where city.city_name = ? and crawled_date = ?
-                    """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], month, )).fetchall()
-
-    else:
-        base_query = """
-                    select price,zillow_url,house_lat,house_lng from city_housing join city on city_housing.city_id = city.id
-                    where city.city_name in (?, ?, ?) and crawled_date = ? 
-                    """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], cities[1], cities[2], month, )).fetchall()
-    
+# landmarks per city set, they only change with init-db and refresh-layout which bump the data revision
+layout_cache = FigureCache(max_entries=32)
+
+
+'''
+every landmark of the cities in one query, grouped by type into columns
+returns {landmark_type: {'lng': [], 'lat': [], 'name': []}}
+'''
+def get_layouts_from_db(cursor, cities, bbox=None):
+    sql, params = all_layouts_query(cities, bbox=bbox)
+    query = cursor.cursor()
+    query.row_factory = None
+    layouts = dict()
+    for landmark_type, lng, lat, name in query.execute(sql, params).fetchall():
+        layer = layouts.get(landmark_type)
+        if layer is None:
+            layer = layouts[landmark_type] = {'lng': [], 'lat': [], 'name': []}
+        layer['lng'].append(lng)
+        layer['lat'].append(lat)
+        layer['name'].append(name)
+    return layouts
+
+
+'''
+get_layouts_from_db cached per city set for the life of the process, until the data revision changes
+the returned dict is shared, callers must not modify it
+'''
+def get_cached_layouts(cursor, cities, revision=None):
+    layout_cache.check_revision(revision)
+    key = tuple(cities)
+    layouts = layout_cache.get(key)
+    if layouts is None:
+        layouts = get_layouts_from_db(cursor, cities)
+        layout_cache.put(key, layouts, revision)
+    return layouts
+
+
+def get_housing_from_db(cursor, cities, month, kwargs={}, bbox=None):
+    # the snapshots have no spatial index, a viewport is looked up in the rtree
+    snapshot = read_snapshot(cursor, cities, month, ['price', 'zillow_url', 'house_lat', 'house_lng'], kwargs) if bbox is None else None
+    if snapshot is not None:
+        # nan back to None like the values of the query
+        snapshot = snapshot.astype(object).where(snapshot.notna(), None)
+        return snapshot['zillow_url'].tolist(), snapshot['house_lng'].tolist(), snapshot['house_lat'].tolist(), snapshot['price'].tolist()
+
+    sql, params = housing_query(['price', 'zillow_url', 'house_lat', 'house_lng'], cities, month, kwargs, bbox=bbox)
+    query = cursor.execute(sql, params).fetchall()
+
     urls = []
     lons = []
     lats = []
@@ -107,7 +63,6 @@ def get_housing_from_db(cursor, cities, month, kwargs={}):
         lons.append(item['house_lng'])
         lats.append(item['house_lat'])
         price.append(item['price'])
-    print('line76 price list length',len(price))
     return urls, lons, lats, price
 
 
@@ -115,26 +70,19 @@ def get_housing_from_db(cursor, cities, month, kwargs={}):
 retrieve data from db
 use pandas to calculate min, max, medium
 return summary stats after grouping and price list
+without preference filters the numbers come from city_housing_monthly_group_stats
 '''
 def analysis_query(cursor, cities, month, kwargs={}):
-    if len(cities) not in {1, 3}:
-        logging.exception('Numbers of cities passed is not correct')
-        return
-    
-    if len(cities) == 1:
-        base_query = """
-                    select price,num_bathroom, num_bedroom from city_housing join city on city_housing.city_id = city.id
-                    where city.city_name = ? and crawled_date = ?
-                    """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], month, )).fetchall()
-    else:
-        base_query = """
-                    select price,num_bathroom, num_bedroom from city_housing join city on city_housing.city_id = city.id
-                    where city.city_name in (?,?,?) and crawled_date = ?
-                    """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], cities[1], cities[2], month)).fetchall()
+    location = precomputed_location(cursor, cities, month, kwargs)
+    if location is not None:
+        return format_group_stats(read_group_stats(cursor, location, month, kwargs.get('aggregated_type')))
+
+    snapshot = read_snapshot(cursor, cities, month, ['num_bathroom', 'num_bedroom', 'price'], kwargs)
+    if snapshot is not None:
+        return summarize_prices(snapshot.rename(columns={'num_bathroom': 'Bathrooms', 'num_bedroom': 'Bedrooms'}))
+
+    sql, params = housing_query(['price', 'num_bathroom', 'num_bedroom'], cities, month, kwargs)
+    query = cursor.execute(sql, params).fetchall()
 
     df_data = {'Bathrooms': [], 'Bedrooms':[], 'price':[]}
     for record in query:
@@ -142,66 +90,150 @@ def analysis_query(cursor, cities, month, kwargs={}):
         df_data['Bedrooms'].append(record['num_bedroom'])
         df_data['price'].append(record['price'])
 
-    summarize = pd.DataFrame(df_data).dropna()
-    summarize = summarize[(summarize.Bathrooms > 0) & (summarize.Bedrooms > 0)]
-    summarize.Bathrooms = summarize.Bathrooms.astype(int)
-    summarize.Bedrooms = summarize.Bedrooms.astype(int)
-    summarize = summarize.groupby(['Bedrooms', 'Bathrooms'])['price'].agg(['min', 'max', 'median'])
-    summarize['min'] = summarize['min'].apply(lambda x: "${:.1f}k".format((x/1000)))
-    summarize['max'] = summarize['max'].apply(lambda x: "${:.1f}k".format((x/1000)))
-    summarize['median'] = summarize['median'].apply(lambda x: "${:.1f}k".format((x/1000)))
-
-    return summarize
+    return summarize_prices(pd.DataFrame(df_data))
 
 
 '''
-return monthly price data from DB
+return monthly box plot numbers from DB
 If set remove_outliers to true,
 then use IQR (Inter Quartile Range) to remove outliers
+without preference filters the numbers come from city_housing_monthly_stats
 '''
 def get_monthly_price(cursor, cities, end_month, kwargs={}, remove_outliers=True):
-    if len(cities) not in {1, 3}:
-        logging.exception('Numbers of cities passed is not correct')
-        return
-    
-    if len(cities) == 1:
-        base_query = """
-                        select price,crawled_date from city_housing join city on city_housing.city_id = city.id
-                        where city.city_name = ? and crawled_date <= ?
-                    """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], end_month, )).fetchall()
-    else:
-        base_query = """
-                        select price,crawled_date from city_housing join city on city_housing.city_id = city.id
-                        where city.city_name in (?, ?, ?) and crawled_date <= ?
-                     """
-        base_query = query_add_kwargs(base_query, kwargs)
-        query = cursor.execute(base_query, (cities[0], cities[1], cities[2], end_month,)).fetchall()
-    
+    location = precomputed_location(cursor, cities, end_month, kwargs)
+    if location is not None and remove_outliers:
+        return read_monthly_stats(cursor, location, end_month, kwargs.get('aggregated_type'))
+
+    snapshot = read_snapshot(cursor, cities, end_month, ['crawled_date', 'price'], kwargs, month_operator='<=')
+    if snapshot is not None:
+        return monthly_box_stats(snapshot.rename(columns={'crawled_date': 'month'}), remove_outliers=remove_outliers)
+
+    sql, params = housing_query(['price', 'crawled_date'], cities, end_month, kwargs, month_operator='<=')
+    query = cursor.execute(sql, params).fetchall()
+
     df_data = {'month': [], 'price':[]}
     for record in query:
         df_data['month'].append(record['crawled_date'])
         df_data['price'].append(record['price'])
-    res = pd.DataFrame(df_data).dropna()
 
-    if remove_outliers:
-        Q1 = np.percentile(res['price'], 25,
-                   interpolation = 'midpoint')
- 
-        Q3 = np.percentile(res['price'], 75,
-                    interpolation = 'midpoint')
-        IQR = Q3 - Q1
-        upper = np.where(res['price'] >= (Q3+1.5*IQR))
-        lower = np.where(res['price'] <= (Q1-1.5*IQR))
-        res.drop(upper[0], inplace = True)
-        res.drop(lower[0], inplace = True)
+    return monthly_box_stats(pd.DataFrame(df_data), remove_outliers=remove_outliers)
+
+
+'''
+group prices by bedrooms and bathrooms
+takes a dataframe with Bedrooms, Bathrooms and price columns
+returns min, max, medium price of each group formatted as dollar strings
+'''
+def summarize_prices(df):
+    return format_group_stats(group_stats(df))
+
 
-    return res
+def format_group_stats(groups):
+    summarize = groups[['min', 'max', 'median']].copy()
+    summarize['min'] = summarize['min'].apply(lambda x: "${:.1f}k".format((x/1000)))
+    summarize['max'] = summarize['max'].apply(lambda x: "${:.1f}k".format((x/1000)))
+    summarize['median'] = summarize['median'].apply(lambda x: "${:.1f}k".format((x/1000)))
+    return summarize
+
+
+'''
+the precomputed monthly stats only hold the unfiltered listings
+returns the location the cities belong to when its stats can answer the query, otherwise None
+'''
+def precomputed_location(cursor, cities, month, kwargs={}):
+    if filter_shape(kwargs):
+        return None
+    if kwargs.get('aggregated_type') not in (None, '', 'price', 'unitPrice'):
+        return None
+    location = find_location(cities)
+    if location is None:
+        return None
+    stats = cursor.execute(
+        """
+        select 1 from city_housing_monthly_stats where location = ? and crawled_date = ? limit 1
+        """, (location, month)).fetchone()
+    return location if stats is not None else None
+
+
+def read_monthly_stats(cursor, location, end_month, aggregated_type=None):
+    query = cursor.execute(
+        """
+        select crawled_date,listing_count,q1,median,q3,lower_fence,upper_fence from city_housing_monthly_stats
+        where location = ? and crawled_date <= ? and aggregated_type = ?
+        order by crawled_date
+        """, (location, end_month, aggregated_type or 'price')).fetchall()
+    return pd.DataFrame.from_records([tuple(record) for record in query], columns=['month'] + box_columns)
+
+
+def read_group_stats(cursor, location, month, aggregated_type=None):
+    query = cursor.execute(
+        """
+        select num_bedroom,num_bathroom,listing_count,min_price,max_price,median_price from city_housing_monthly_group_stats
+        where location = ? and crawled_date = ? and aggregated_type = ?
+        order by num_bedroom, num_bathroom
+        """, (location, month, aggregated_type or 'price')).fetchall()
+    groups = pd.DataFrame.from_records([tuple(record) for record in query], columns=['Bedrooms', 'Bathrooms'] + group_columns)
+    return groups.set_index(['Bedrooms', 'Bathrooms'])
+
+
+housing_frame_columns = ['price', 'crawled_date', 'num_bathroom', 'num_bedroom', 'zillow_url', 'house_lat', 'house_lng']
+
+'''
+fetch every listing of the cities up to end_month with a single query, or from the snapshots when they hold every month
+url and coords are only needed for the listings of end_month, older months come back with nulls there
+If set history to false, only the listings of end_month are fetched
+returns a columnar dataframe that all panels of the map page are derived from
+'''
+def get_housing_frame(cursor, cities, end_month, kwargs={}, history=True):
+    types = {'price': float, 'num_bathroom': float, 'num_bedroom': float, 'house_lat': float, 'house_lng': float}
+    snapshot = read_snapshot(cursor, cities, end_month, housing_frame_columns, kwargs, month_operator='<=' if history else '=')
+    if snapshot is not None:
+        snapshot.loc[snapshot['crawled_date'] != end_month, ['zillow_url', 'house_lat', 'house_lng']] = None
+        return snapshot.astype(types)
+
+    columns = ['price', 'crawled_date', 'num_bathroom', 'num_bedroom',
+               'case when crawled_date = ? then zillow_url end',
+               'case when crawled_date = ? then house_lat end',
+               'case when crawled_date = ? then house_lng end']
+    sql, params = housing_query(columns, cities, end_month, kwargs,
+                                month_operator='<=' if history else '=', select_params=(end_month, end_month, end_month))
+    # plain tuples are cheaper to build than sqlite3.Row and go straight into the frame
+    query = cursor.cursor()
+    query.row_factory = None
+    rows = query.execute(sql, params).fetchall()
+    df = pd.DataFrame.from_records(rows, columns=housing_frame_columns)
+    return df.astype(types)
+
+
+'''
+the panels of the map page from one housing frame
+returns the summary table of month, the monthly box plot numbers, and the listings of month
+'''
+def summarize_housing_frame(df, month):
+    current = df[df.crawled_date == month]
+    summarize = summarize_prices(current.rename(columns={'num_bathroom': 'Bathrooms', 'num_bedroom': 'Bedrooms'})[['Bathrooms', 'Bedrooms', 'price']])
+    month_prices = monthly_box_stats(df[['crawled_date', 'price']].rename(columns={'crawled_date': 'month'}))
+    return summarize, month_prices, current
+
+
+'''
+everything the map page shows for the cities and month
+the table and the box plot come from the precomputed stats when there are no preference filters,
+otherwise they are derived from a single pass over the raw listings
+If set listings to false, the raw listings of month are not fetched when they are not needed anyway
+'''
+def get_map_panels(cursor, cities, month, kwargs={}, listings=True):
+    location = precomputed_location(cursor, cities, month, kwargs)
+    if location is None:
+        return summarize_housing_frame(get_housing_frame(cursor, cities, month, kwargs=kwargs), month)
+
+    aggregated_type = kwargs.get('aggregated_type')
+    summarize = format_group_stats(read_group_stats(cursor, location, month, aggregated_type))
+    month_prices = read_monthly_stats(cursor, location, month, aggregated_type)
+    current = get_housing_frame(cursor, cities, month, kwargs=kwargs, history=False) if listings else None
+    return summarize, month_prices, current
 
 
 def digit_to_dollar_string(lst):
-    res = []
-    for i in range(len(lst)):
-        res.append("${:,}".format(int(lst[i])))
-    return res
\ No newline at end of file
+    # by value, a filtered series keeps the labels of its rows
+    return ["${:,}".format(int(value)) for value in lst]
\ No newline at end of file
@@ -0,0 +1,104 @@
+from functools import lru_cache
+
+
+# preference filter -> condition on city_housing, values are always bound as parameters
+housing_filters = {
+    'bedroom_from': 'num_bedroom >= ?',
+    'bedroom_to': 'num_bedroom <= ?',
+    'bathroom_from': 'num_bathroom >= ?',
+    'bathroom_to': 'num_bathroom <= ?',
+    'max_posted_days': 'num_days_posted <= ?',
+    # km, served from the precomputed listing_proximity rows of the listing
+    'max_distance_to_train': ("exists (select 1 from listing_proximity where listing_proximity.listing_id = city_housing.id"
+                              " and landmark_type in ('train_station', 'subway_station') and nearest_m <= ? * 1000)"),
+}
+month_operators = ('=', '<=')
+# boxes of an R*Tree that overlap the bbox, bound as (south, north, west, east)
+bbox_conditions = '{prefix}max_lat >= ? and {prefix}min_lat <= ? and {prefix}max_lng >= ? and {prefix}min_lng <= ?'
+
+
+def placeholders(count):
+    return ','.join('?' * count)
+
+
+def bbox_params(bbox):
+    south, west, north, east = bbox
+    return (south, north, west, east)
+
+
+'''
+which filters of kwargs are set, in a fixed order
+two requests with the same shape share one compiled statement
+'''
+def filter_shape(kwargs):
+    return tuple(field for field in housing_filters if kwargs.get(field) not in (None, ''))
+
+
+'''
+SQL for listings of city_housing joined with city
+memoized by shape, so every distinct filter combination is one SQL string
+and sqlite3 can reuse its prepared statement across requests
+with bbox the listings are looked up in the R*Tree first, the rtree stores 32 bit floats
+so its boxes are slightly larger than the points and the exact coordinates are checked again
+'''
+@lru_cache(maxsize=512)
+def compile_housing_query(columns, city_count, month_operator, shape, unit_price, bbox=False):
+    if month_operator not in month_operators:
+        raise ValueError('month_operator must be one of {}'.format(month_operators))
+    select = ','.join('(price/area) as price' if unit_price and column == 'price' else column for column in columns)
+    source = 'city_housing join city on city_housing.city_id = city.id'
+    conditions = ['city.city_name in ({})'.format(placeholders(city_count)), 'crawled_date {} ?'.format(month_operator)]
+    conditions += [housing_filters[field] for field in shape]
+    if unit_price:
+        conditions.append('area > 0')
+    if bbox:
+        # cross join keeps the rtree as the outer loop
+        source = 'city_housing_rtree cross join ' + source
+        conditions += ['city_housing.id = city_housing_rtree.id', bbox_conditions.format(prefix='city_housing_rtree.'),
+                       'house_lat between ? and ? and house_lng between ? and ?']
+    return """
+    select {} from {}
+    where {}
+    """.format(select, source, ' and '.join(conditions))
+
+
+'''
+parameterized query for the listings of any number of cities and any set of preference filters
+columns are column names or expressions, a plain `price` column becomes price per area for unitPrice
+select_params are bound to placeholders used inside columns
+bbox is (south, west, north, east), only the listings inside it are selected
+returns (sql, parameters)
+'''
+def housing_query(columns, cities, month, kwargs={}, month_operator='=', select_params=(), bbox=None):
+    shape = filter_shape(kwargs)
+    unit_price = kwargs.get('aggregated_type') == 'unitPrice'
+    sql = compile_housing_query(tuple(columns), len(cities), month_operator, shape, unit_price, bbox is not None)
+    params = (*select_params, *cities, month, *[kwargs[field] for field in shape])
+    if bbox is not None:
+        params += bbox_params(bbox) * 2
+    return sql, params
+
+
+'''
+SQL for the landmarks of every type in city_layout joined with city, the type as first column
+with bbox the landmarks are looked up in the R*Tree first, like compile_housing_query
+'''
+@lru_cache(maxsize=64)
+def compile_layout_query(city_count, bbox=False):
+    source = 'city_layout join city on city_layout.city_id = city.id'
+    conditions = ['city.city_name in ({})'.format(placeholders(city_count))]
+    if bbox:
+        source = 'city_layout_rtree cross join ' + source
+        conditions += ['city_layout.id = city_layout_rtree.id', bbox_conditions.format(prefix='city_layout_rtree.'),
+                       'landmark_lat between ? and ? and landmark_lng between ? and ?']
+    return """
+    select landmark_type,landmark_lng,landmark_lat,landmark_name from {}
+    where {}
+    """.format(source, ' and '.join(conditions))
+
+
+def all_layouts_query(cities, bbox=None):
+    params = tuple(cities)
+    if bbox is not None:
+        params += bbox_params(bbox) * 2
+    return compile_layout_query(len(cities), bbox is not None), params
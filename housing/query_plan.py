@@ -0,0 +1,81 @@
+import logging
+from housing.queries import get_layouts_from_db, get_housing_from_db, analysis_query, get_monthly_price, get_housing_frame, get_map_panels
+
+
+'''
+stands in for the db connection passed to the functions in housing.queries
+every statement is run through EXPLAIN QUERY PLAN before it is executed
+'''
+class PlanRecorder():
+    def __init__(self, db):
+        self.db = db
+        self.plans = []
+
+    def execute(self, sql, parameters=()):
+        plan = self.db.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+        self.plans.append((sql, [row[3] for row in plan]))
+        return self.db.execute(sql, parameters)
+
+    def cursor(self):
+        recorder = PlanRecorder(self.db.cursor())
+        recorder.plans = self.plans
+        return recorder
+
+
+# the queries every page load runs, with and without preference filters, for one and three cities
+sample_cities = [['NYC,NY'], ['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ']]
+sample_month = '2022-11'
+sample_filters = [{}, {'bedroom_from': 2, 'bathroom_to': 3, 'max_posted_days': 30, 'aggregated_type': 'unitPrice'},
+                  {'max_distance_to_train': 1}]
+# (south, west, north, east) for the bbox lookups of the R*Tree indexes
+sample_bbox = (40.3, -74.7, 40.4, -74.6)
+hot_queries = [
+    lambda cursor, cities, kwargs: get_housing_from_db(cursor, cities, sample_month, kwargs=kwargs),
+    lambda cursor, cities, kwargs: analysis_query(cursor, cities, sample_month, kwargs=kwargs),
+    lambda cursor, cities, kwargs: get_monthly_price(cursor, cities, sample_month, kwargs=kwargs),
+    lambda cursor, cities, kwargs: get_housing_frame(cursor, cities, sample_month, kwargs=kwargs),
+    lambda cursor, cities, kwargs: get_map_panels(cursor, cities, sample_month, kwargs=kwargs),
+    lambda cursor, cities, kwargs: get_housing_from_db(cursor, cities, sample_month, kwargs=kwargs, bbox=sample_bbox),
+    lambda cursor, cities, kwargs: get_layouts_from_db(cursor, cities),
+    lambda cursor, cities, kwargs: get_layouts_from_db(cursor, cities, bbox=sample_bbox),
+]
+
+
+'''
+a SCAN of an R*Tree with constraints (INDEX 1 or 2) is an index lookup, INDEX 0 reads the whole tree
+a SCAN of a common table expression reads the rows the query produced itself, not a table
+'''
+def scanned_tables(plan_details):
+    subqueries = {detail.split()[1] for detail in plan_details if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    return [detail for detail in plan_details if detail.startswith('SCAN') and detail.split()[1] not in subqueries and
+            ('VIRTUAL TABLE INDEX' not in detail or 'VIRTUAL TABLE INDEX 0:' in detail)]
+
+
+'''
+run EXPLAIN QUERY PLAN on every hot query in housing.queries
+logs a warning for each query that falls back to a full table scan
+returns True when every query is served by an index
+'''
+def check_query_plans(db):
+    recorder = PlanRecorder(db)
+    for query in hot_queries:
+        for cities in sample_cities:
+            for kwargs in sample_filters:
+                try:
+                    query(recorder, cities, kwargs)
+                except Exception:
+                    # only the plan matters here, the sample month usually has no rows to post-process
+                    pass
+
+    all_indexed = True
+    checked = set()
+    for sql, details in recorder.plans:
+        if sql in checked:
+            continue
+        checked.add(sql)
+        scans = scanned_tables(details)
+        if scans:
+            all_indexed = False
+            logging.warning('Query falls back to a full scan ({}), run `flask migrate-db`:\n{}'.format(
+                ', '.join(scans), sql.strip()))
+    return all_indexed
@@ -0,0 +1,162 @@
+import logging
+import os
+import shutil
+from housing.query_builder import filter_shape
+
+
+# one Arrow IPC file per city and crawled month: <database>-snapshots/<month>/<city_id>.arrow
+# the files are written uncompressed so they can be memory-mapped and only the read columns are paged in
+# pyarrow is optional, without it or without a snapshot the analytics read city_housing instead
+snapshot_columns = ['crawled_date', 'house_address', 'price', 'area', 'num_bathroom', 'num_bedroom',
+                    'num_days_posted', 'zillow_url', 'house_lat', 'house_lng']
+# preference filter -> (column, pyarrow.compute function), the same conditions as query_builder.housing_filters
+snapshot_filters = {
+    'bedroom_from': ('num_bedroom', 'greater_equal'),
+    'bedroom_to': ('num_bedroom', 'less_equal'),
+    'bathroom_from': ('num_bathroom', 'greater_equal'),
+    'bathroom_to': ('num_bathroom', 'less_equal'),
+    'max_posted_days': ('num_days_posted', 'less_equal'),
+}
+
+
+def load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def snapshot_schema(pa):
+    return pa.schema([(column, pa.string() if column in ('crawled_date', 'house_address', 'zillow_url') else pa.float64())
+                      for column in snapshot_columns])
+
+
+'''
+a folder next to the database file, so a copy or a temporary database never reads the files of another one
+returns None for an in-memory database
+'''
+def sidecar_dir(db, suffix):
+    file = next((row[2] for row in db.execute('PRAGMA database_list') if row[1] == 'main'), '')
+    return os.path.splitext(file)[0] + suffix if file else None
+
+
+def snapshot_dir(db):
+    return sidecar_dir(db, '-snapshots')
+
+
+'''
+write the listings of month as one file per city
+the month is written into a temporary folder and renamed into place, so a month folder is always complete
+returns the number of written rows
+'''
+def write_month_snapshot(db, month):
+    pa = load_pyarrow()
+    directory = snapshot_dir(db)
+    if pa is None or directory is None:
+        logging.critical('========= No snapshot written for {}, pyarrow is not installed or the database is in memory ========='.format(month))
+        return 0
+
+    schema = snapshot_schema(pa)
+    target = os.path.join(directory, month)
+    tmp = target + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    total = 0
+    city_ids = [row[0] for row in db.execute('select distinct city_id from city_housing where crawled_date = ?', (month, ))]
+    for city_id in city_ids:
+        query = db.cursor()
+        query.row_factory = None
+        rows = query.execute('select {} from city_housing where crawled_date = ? and city_id = ? order by id'.format(
+            ','.join(snapshot_columns)), (month, city_id)).fetchall()
+        table = pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)], schema=schema)
+        with pa.OSFile(os.path.join(tmp, '{}.arrow'.format(city_id)), 'wb') as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+        total += len(rows)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logging.critical('========= Snapshot of {} written: {} rows of {} cities ========='.format(month, total, len(city_ids)))
+    return total
+
+
+'''
+rewrite the snapshots of every crawled month, months that are no longer in the database are removed
+'''
+def rebuild_snapshots(db):
+    clear_snapshots(db)
+    months = [row[0] for row in db.execute('select distinct crawled_date from city_housing order by crawled_date')]
+    return sum(write_month_snapshot(db, month) for month in months)
+
+
+def clear_snapshots(db):
+    directory = snapshot_dir(db)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+'''
+the crawled months up to month, one index seek per month instead of reading every observation
+'''
+def crawled_months(db, month):
+    rows = db.execute(
+        """
+        with recursive months(crawled_date) as (
+          select min(crawled_date) from listing_observation
+          union all
+          select (select min(crawled_date) from listing_observation where crawled_date > months.crawled_date)
+          from months where months.crawled_date < ?
+        )
+        select crawled_date from months where crawled_date <= ?
+        """, (month, month)).fetchall()
+    return [row[0] for row in rows]
+
+
+'''
+the columns of the listings of cities in month (or up to month with month_operator '<=')
+the same rows housing_query selects, a plain `price` column becomes price per area for unitPrice
+each file is memory-mapped and only the selected and filtered columns are read
+returns a dataframe, or None when pyarrow is missing or a month has no snapshot yet
+'''
+def read_snapshot(db, cities, month, columns, kwargs={}, month_operator='='):
+    pa = load_pyarrow()
+    directory = snapshot_dir(db)
+    if pa is None or directory is None or not os.path.isdir(directory):
+        return None
+
+    if month_operator == '=':
+        months = [month]
+    else:
+        # every crawled month has to be in the snapshot, otherwise the answer would miss listings
+        months = crawled_months(db, month)
+    if not all(os.path.isdir(os.path.join(directory, m)) for m in months):
+        return None
+
+    shape = filter_shape(kwargs)
+    if any(field not in snapshot_filters for field in shape):
+        # the proximity filter reads listing_proximity, which changes with the landmarks and is not in the snapshot
+        return None
+    unit_price = kwargs.get('aggregated_type') == 'unitPrice'
+    needed = list(dict.fromkeys(list(columns) + [snapshot_filters[field][0] for field in shape] + (['area'] if unit_price else [])))
+    city_ids = [row[0] for row in db.execute('select id from city where city_name in ({})'.format(','.join('?' * len(cities))), cities)]
+
+    tables = []
+    for m in months:
+        for city_id in city_ids:
+            file = os.path.join(directory, m, '{}.arrow'.format(city_id))
+            if os.path.exists(file):
+                # the table keeps the map open, its buffers point into the file
+                tables.append(pa.ipc.open_file(pa.memory_map(file)).read_all().select(needed))
+    table = pa.concat_tables(tables) if tables else snapshot_schema(pa).empty_table().select(needed)
+
+    pc = pa.compute
+    for field in shape:
+        column, function = snapshot_filters[field]
+        table = table.filter(getattr(pc, function)(table[column], float(kwargs[field])))
+    if unit_price:
+        table = table.filter(pc.greater(table['area'], 0))
+        table = table.set_column(table.schema.get_field_index('price'), 'price', pc.divide(table['price'], table['area']))
+    return table.select(list(columns)).to_pandas()
@@ -0,0 +1,132 @@
+import logging
+import numpy as np
+import pandas as pd
+from housing.locations import locations
+from housing.query_builder import filter_shape, housing_query
+from housing.snapshots import read_snapshot
+
+
+# listings are binned into a lat/lng grid per map zoom level, a cell is about 40px wide on screen
+zoom_levels = list(range(8, 16))
+default_zoom = 11
+max_cells = 5000
+grid_columns = ['lat', 'lng', 'listing_count', 'median_price', 'zillow_url']
+
+
+def cell_size(zoom):
+    return 22.5 / 2 ** zoom
+
+
+def clamp_zoom(zoom):
+    return min(max(int(zoom), zoom_levels[0]), zoom_levels[-1])
+
+
+'''
+bin listings of one zoom level
+takes a dataframe with price, house_lat, house_lng, zillow_url columns
+returns one row per non-empty cell with its listing count, median price, mean coords
+and the url of the listing priced closest to the median as the representative one
+'''
+def bin_listings(df, zoom):
+    df = df.dropna(subset=['price', 'house_lat', 'house_lng'])
+    if len(df) == 0:
+        return pd.DataFrame(columns=['cell_x', 'cell_y'] + grid_columns)
+    size = cell_size(zoom)
+    df = df.assign(cell_x=np.floor((df['house_lng'] + 180) / size).astype(np.int64),
+                   cell_y=np.floor((df['house_lat'] + 90) / size).astype(np.int64))
+    cells = df.groupby(['cell_x', 'cell_y'])
+    median = cells['price'].transform('median')
+    representative = (df['price'] - median).abs().groupby([df['cell_x'], df['cell_y']]).idxmin()
+    grid = cells.agg(lat=('house_lat', 'mean'), lng=('house_lng', 'mean'),
+                     listing_count=('price', 'size'), median_price=('price', 'median'))
+    grid['zillow_url'] = df.loc[representative.to_numpy(), 'zillow_url'].to_numpy()
+    return grid.reset_index()
+
+
+def read_listings(cursor, cities, month, kwargs={}):
+    query = cursor.cursor()
+    query.row_factory = None
+    sql, params = housing_query(['price', 'house_lat', 'house_lng', 'zillow_url'], cities, month, kwargs)
+    rows = query.execute(sql, params).fetchall()
+    df = pd.DataFrame.from_records(rows, columns=['price', 'house_lat', 'house_lng', 'zillow_url'])
+    return df.astype({'price': float, 'house_lat': float, 'house_lng': float})
+
+
+'''
+recompute the grid of every location and zoom level for one crawled month
+runs in a single transaction, cells of the month are replaced
+'''
+def refresh_grid(db, month):
+    with db:
+        for location, (cities, _) in locations.items():
+            listings = read_listings(db, cities, month)
+            db.execute('delete from city_housing_grid where location = ? and crawled_date = ?', (location, month))
+            for zoom in zoom_levels:
+                grid = bin_listings(listings, zoom)
+                db.executemany(
+                    """
+                    INSERT INTO city_housing_grid (location, crawled_date, zoom, cell_x, cell_y, lat, lng, listing_count, median_price, zillow_url)
+                    VALUES
+                    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, [(location, month, zoom, *row) for row in
+                          grid[['cell_x', 'cell_y'] + grid_columns].astype(object).itertuples(index=False, name=None)])
+    logging.critical('========= Map grid refreshed for: {} ========='.format(month))
+
+
+def rebuild_grid(db):
+    months = [row[0] for row in db.execute('select distinct crawled_date from city_housing order by crawled_date')]
+    for month in months:
+        refresh_grid(db, month)
+    return months
+
+
+def in_bbox(grid, bbox):
+    if bbox is None:
+        return grid
+    south, west, north, east = bbox
+    # numbered from 0 again like the precomputed grid, the views read the columns by position
+    return grid[(grid['lat'] >= south) & (grid['lat'] <= north) & (grid['lng'] >= west) & (grid['lng'] <= east)].reset_index(drop=True)
+
+
+def read_grid(cursor, location, month, zoom, bbox=None):
+    sql = """
+        select lat,lng,listing_count,median_price,zillow_url from city_housing_grid
+        where location = ? and crawled_date = ? and zoom = ?
+        """
+    params = (location, month, zoom)
+    if bbox is not None:
+        sql += " and lat between ? and ? and lng between ? and ?"
+        params += (bbox[0], bbox[2], bbox[1], bbox[3])
+    rows = cursor.execute(sql, params).fetchall()
+    return pd.DataFrame.from_records([tuple(row) for row in rows], columns=grid_columns)
+
+
+'''
+the cells of the location for the requested zoom and viewport (south, west, north, east)
+unfiltered requests read the precomputed grid, filtered ones are binned on the fly from the snapshot or the listings
+zooms out a level at a time until at most max_cells cells are left, so the payload stays bounded
+listings are the filtered listings of month when the caller has read them already (price, house_lat, house_lng, zillow_url)
+returns (zoom actually used, cells dataframe)
+'''
+def get_grid(cursor, location, month, zoom=default_zoom, bbox=None, kwargs={}, listings=None):
+    cities, _ = locations[location]
+    zoom = clamp_zoom(zoom)
+    precomputed = not filter_shape(kwargs) and kwargs.get('aggregated_type') != 'unitPrice'
+    if precomputed:
+        precomputed = cursor.execute(
+            'select 1 from city_housing_grid where location = ? and crawled_date = ? limit 1', (location, month)).fetchone() is not None
+    if precomputed:
+        listings = None
+    elif listings is None:
+        listings = read_snapshot(cursor, cities, month, ['price', 'house_lat', 'house_lng', 'zillow_url'], kwargs)
+        if listings is None:
+            listings = read_listings(cursor, cities, month, kwargs)
+
+    while True:
+        if precomputed:
+            grid = read_grid(cursor, location, month, zoom, bbox)
+        else:
+            grid = in_bbox(bin_listings(listings, zoom)[grid_columns], bbox)
+        if len(grid) <= max_cells or zoom == zoom_levels[0]:
+            return zoom, grid.head(max_cells)
+        zoom -= 1
@@ -0,0 +1,18 @@
+-- every page load filters city_housing by city and crawled month
+-- the housing index covers all columns read or filtered by housing.queries, so no table lookup is needed
+CREATE INDEX IF NOT EXISTS city_name_idx ON city (city_name);
+
+CREATE INDEX IF NOT EXISTS city_housing_city_month_idx ON city_housing (
+  city_id, crawled_date,
+  price, num_bedroom, num_bathroom, num_days_posted, area,
+  house_lat, house_lng, zillow_url
+);
+
+CREATE INDEX IF NOT EXISTS city_housing_month_idx ON city_housing (crawled_date);
+
+CREATE INDEX IF NOT EXISTS city_layout_city_type_idx ON city_layout (
+  city_id, landmark_type,
+  landmark_lat, landmark_lng, landmark_name
+);
+
+ANALYZE;
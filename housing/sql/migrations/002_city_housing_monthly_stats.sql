@@ -0,0 +1,28 @@
+-- box plot and summary table numbers of every location and crawled month
+-- filled by update-db-monthly, so page loads do not have to read the raw listings of every past month
+-- aggregated_type is 'price' or 'unitPrice' (price / area)
+CREATE TABLE IF NOT EXISTS city_housing_monthly_stats (
+  location TEXT NOT NULL,
+  crawled_date TEXT NOT NULL,
+  aggregated_type TEXT NOT NULL,
+  listing_count INTEGER NOT NULL,
+  q1 REAL NOT NULL,
+  median REAL NOT NULL,
+  q3 REAL NOT NULL,
+  lower_fence REAL NOT NULL,
+  upper_fence REAL NOT NULL,
+  PRIMARY KEY (location, crawled_date, aggregated_type)
+);
+
+CREATE TABLE IF NOT EXISTS city_housing_monthly_group_stats (
+  location TEXT NOT NULL,
+  crawled_date TEXT NOT NULL,
+  aggregated_type TEXT NOT NULL,
+  num_bedroom INTEGER NOT NULL,
+  num_bathroom INTEGER NOT NULL,
+  listing_count INTEGER NOT NULL,
+  min_price REAL NOT NULL,
+  max_price REAL NOT NULL,
+  median_price REAL NOT NULL,
+  PRIMARY KEY (location, crawled_date, aggregated_type, num_bedroom, num_bathroom)
+);
@@ -0,0 +1,9 @@
+-- data_revision is bumped whenever init-db or update-db-monthly commits,
+-- app processes compare it to drop their in-memory caches
+-- not dropped by schema.sql, so the revision keeps growing across init-db
+CREATE TABLE IF NOT EXISTS app_meta (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO app_meta (key, value) VALUES ('data_revision', '0');
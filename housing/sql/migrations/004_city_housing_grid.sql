@@ -0,0 +1,20 @@
+-- listings of every location and crawled month binned into a lat/lng grid per map zoom level
+-- filled by update-db-monthly, the map endpoints only send the cells in the viewport
+CREATE TABLE IF NOT EXISTS city_housing_grid (
+  location TEXT NOT NULL,
+  crawled_date TEXT NOT NULL,
+  zoom INTEGER NOT NULL,
+  cell_x INTEGER NOT NULL,
+  cell_y INTEGER NOT NULL,
+  lat REAL NOT NULL,
+  lng REAL NOT NULL,
+  listing_count INTEGER NOT NULL,
+  median_price REAL NOT NULL,
+  zillow_url TEXT,
+  PRIMARY KEY (location, crawled_date, zoom, cell_x, cell_y)
+);
+
+CREATE INDEX IF NOT EXISTS city_housing_grid_viewport_idx ON city_housing_grid (
+  location, crawled_date, zoom, lat, lng,
+  listing_count, median_price, zillow_url
+);
@@ -0,0 +1,56 @@
+-- R*Tree indexes over the coordinates of listings and landmarks, the id is the id of the indexed row
+-- a point is stored as a box of zero size, rows without coordinates are not indexed
+CREATE VIRTUAL TABLE IF NOT EXISTS city_housing_rtree USING rtree(
+  id,
+  min_lat, max_lat,
+  min_lng, max_lng
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS city_layout_rtree USING rtree(
+  id,
+  min_lat, max_lat,
+  min_lng, max_lng
+);
+
+INSERT OR REPLACE INTO city_housing_rtree
+SELECT id, house_lat, house_lat, house_lng, house_lng FROM city_housing
+WHERE house_lat IS NOT NULL AND house_lng IS NOT NULL;
+
+INSERT OR REPLACE INTO city_layout_rtree
+SELECT id, landmark_lat, landmark_lat, landmark_lng, landmark_lng FROM city_layout;
+
+-- the triggers keep the indexes in sync with every insert, update and delete
+CREATE TRIGGER IF NOT EXISTS city_housing_rtree_insert AFTER INSERT ON city_housing
+WHEN new.house_lat IS NOT NULL AND new.house_lng IS NOT NULL
+BEGIN
+  INSERT OR REPLACE INTO city_housing_rtree VALUES (new.id, new.house_lat, new.house_lat, new.house_lng, new.house_lng);
+END;
+
+CREATE TRIGGER IF NOT EXISTS city_housing_rtree_update AFTER UPDATE OF house_lat, house_lng ON city_housing
+BEGIN
+  DELETE FROM city_housing_rtree WHERE id = old.id;
+  INSERT INTO city_housing_rtree
+  SELECT new.id, new.house_lat, new.house_lat, new.house_lng, new.house_lng
+  WHERE new.house_lat IS NOT NULL AND new.house_lng IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS city_housing_rtree_delete AFTER DELETE ON city_housing
+BEGIN
+  DELETE FROM city_housing_rtree WHERE id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS city_layout_rtree_insert AFTER INSERT ON city_layout
+BEGIN
+  INSERT OR REPLACE INTO city_layout_rtree VALUES (new.id, new.landmark_lat, new.landmark_lat, new.landmark_lng, new.landmark_lng);
+END;
+
+CREATE TRIGGER IF NOT EXISTS city_layout_rtree_update AFTER UPDATE OF landmark_lat, landmark_lng ON city_layout
+BEGIN
+  DELETE FROM city_layout_rtree WHERE id = old.id;
+  INSERT INTO city_layout_rtree VALUES (new.id, new.landmark_lat, new.landmark_lat, new.landmark_lng, new.landmark_lng);
+END;
+
+CREATE TRIGGER IF NOT EXISTS city_layout_rtree_delete AFTER DELETE ON city_layout
+BEGIN
+  DELETE FROM city_layout_rtree WHERE id = old.id;
+END;
@@ -0,0 +1,10 @@
+-- a landmark is identified by its city, its name and its coordinates rounded to about 10 meters
+-- refresh-layout upserts on this key, duplicates left by earlier loads keep their latest row
+DELETE FROM city_layout WHERE id NOT IN (
+  SELECT max(id) FROM city_layout
+  GROUP BY city_id, landmark_name, round(landmark_lat, 4), round(landmark_lng, 4)
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS city_layout_natural_key ON city_layout (
+  city_id, landmark_name, round(landmark_lat, 4), round(landmark_lng, 4)
+);
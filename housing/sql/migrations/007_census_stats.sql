@@ -0,0 +1,15 @@
+-- census.gov QuickFacts values per area, imported from the csv files in housing/census_data
+-- census_files keeps the mtime each file had when it was imported, changed files are imported again
+CREATE TABLE IF NOT EXISTS census_stats (
+  file TEXT NOT NULL,
+  area TEXT NOT NULL,
+  fact TEXT NOT NULL,
+  position INTEGER NOT NULL,
+  value TEXT,
+  PRIMARY KEY (area, fact)
+);
+
+CREATE TABLE IF NOT EXISTS census_files (
+  file TEXT PRIMARY KEY,
+  mtime REAL NOT NULL
+);
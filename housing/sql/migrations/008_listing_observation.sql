@@ -0,0 +1,101 @@
+-- a listing is identified by its zillow url, its address, size and coordinates are stored once
+-- listing_observation holds what changes from month to month: the city it was crawled for, the price and the days on zillow
+-- city_housing becomes a view over both, queries keep reading it and inserts into it are upserts
+CREATE TABLE IF NOT EXISTS listing (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  zillow_url TEXT UNIQUE,
+  house_address TEXT,
+  area REAL,
+  num_bathroom REAL,
+  num_bedroom REAL,
+  house_lat REAL,
+  house_lng REAL
+);
+
+CREATE TABLE IF NOT EXISTS listing_observation (
+  city_id INTEGER NOT NULL,
+  crawled_date TEXT NOT NULL,
+  listing_id INTEGER NOT NULL,
+  price REAL,
+  num_days_posted REAL,
+  PRIMARY KEY (city_id, crawled_date, listing_id),
+  FOREIGN KEY (city_id) REFERENCES city (id),
+  FOREIGN KEY (listing_id) REFERENCES listing (id)
+) WITHOUT ROWID;
+
+-- a listing is observed once per month, the upsert of a new crawl conflicts on this
+CREATE UNIQUE INDEX IF NOT EXISTS listing_observation_month_idx ON listing_observation (crawled_date, listing_id);
+
+-- the latest row of every url becomes its listing, rows without url keep one listing each
+INSERT INTO listing (id, zillow_url, house_address, area, num_bathroom, num_bedroom, house_lat, house_lng)
+SELECT id, zillow_url, house_address, area, num_bathroom, num_bedroom, house_lat, house_lng FROM city_housing
+WHERE zillow_url IS NULL OR id IN (SELECT max(id) FROM city_housing WHERE zillow_url IS NOT NULL GROUP BY zillow_url);
+
+-- a url crawled twice in one month keeps its latest row
+INSERT OR REPLACE INTO listing_observation (city_id, crawled_date, listing_id, price, num_days_posted)
+SELECT city_housing.city_id, city_housing.crawled_date, coalesce(listing.id, city_housing.id), city_housing.price, city_housing.num_days_posted
+FROM city_housing LEFT JOIN listing ON listing.zillow_url = city_housing.zillow_url
+WHERE city_housing.city_id IS NOT NULL AND city_housing.crawled_date IS NOT NULL
+ORDER BY city_housing.id;
+
+-- drops the indexes of 001 and the R*Tree triggers of 005 with it
+DROP TABLE city_housing;
+
+CREATE VIEW IF NOT EXISTS city_housing AS
+SELECT listing.id AS id, listing_observation.crawled_date AS crawled_date, listing.house_address AS house_address,
+  listing_observation.price AS price, listing.area AS area, listing.num_bathroom AS num_bathroom, listing.num_bedroom AS num_bedroom,
+  listing_observation.num_days_posted AS num_days_posted, listing.zillow_url AS zillow_url,
+  listing.house_lat AS house_lat, listing.house_lng AS house_lng, listing_observation.city_id AS city_id
+FROM listing_observation JOIN listing ON listing.id = listing_observation.listing_id;
+
+-- inserting a crawled row upserts its listing, which is only rewritten when something besides price and days changed,
+-- and upserts its observation of the month, so ingesting a month again leaves the same rows
+CREATE TRIGGER IF NOT EXISTS city_housing_insert INSTEAD OF INSERT ON city_housing
+BEGIN
+  SELECT RAISE(ABORT, 'city_housing rows need a zillow_url') WHERE new.zillow_url IS NULL;
+  INSERT INTO listing (zillow_url, house_address, area, num_bathroom, num_bedroom, house_lat, house_lng)
+  VALUES (new.zillow_url, new.house_address, new.area, new.num_bathroom, new.num_bedroom, new.house_lat, new.house_lng)
+  ON CONFLICT (zillow_url) DO UPDATE SET
+    house_address = excluded.house_address,
+    area = excluded.area,
+    num_bathroom = excluded.num_bathroom,
+    num_bedroom = excluded.num_bedroom,
+    house_lat = excluded.house_lat,
+    house_lng = excluded.house_lng
+  WHERE (house_address, area, num_bathroom, num_bedroom, house_lat, house_lng)
+    IS NOT (excluded.house_address, excluded.area, excluded.num_bathroom, excluded.num_bedroom, excluded.house_lat, excluded.house_lng);
+  INSERT INTO listing_observation (city_id, crawled_date, listing_id, price, num_days_posted)
+  SELECT new.city_id, new.crawled_date, id, new.price, new.num_days_posted FROM listing WHERE zillow_url = new.zillow_url
+  ON CONFLICT (crawled_date, listing_id) DO UPDATE SET
+    city_id = excluded.city_id,
+    price = excluded.price,
+    num_days_posted = excluded.num_days_posted;
+END;
+
+-- the listing R*Tree now indexes listing ids, the ids the city_housing view exposes
+DELETE FROM city_housing_rtree;
+
+INSERT INTO city_housing_rtree
+SELECT id, house_lat, house_lat, house_lng, house_lng FROM listing
+WHERE house_lat IS NOT NULL AND house_lng IS NOT NULL;
+
+CREATE TRIGGER IF NOT EXISTS listing_rtree_insert AFTER INSERT ON listing
+WHEN new.house_lat IS NOT NULL AND new.house_lng IS NOT NULL
+BEGIN
+  INSERT OR REPLACE INTO city_housing_rtree VALUES (new.id, new.house_lat, new.house_lat, new.house_lng, new.house_lng);
+END;
+
+CREATE TRIGGER IF NOT EXISTS listing_rtree_update AFTER UPDATE OF house_lat, house_lng ON listing
+BEGIN
+  DELETE FROM city_housing_rtree WHERE id = old.id;
+  INSERT INTO city_housing_rtree
+  SELECT new.id, new.house_lat, new.house_lat, new.house_lng, new.house_lng
+  WHERE new.house_lat IS NOT NULL AND new.house_lng IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS listing_rtree_delete AFTER DELETE ON listing
+BEGIN
+  DELETE FROM city_housing_rtree WHERE id = old.id;
+END;
+
+ANALYZE;
@@ -0,0 +1,23 @@
+-- distance from every listing to the nearest landmark of each type, and the landmarks of the type around it
+-- filled by housing.proximity for new listings after an ingest, and for all listings when the landmarks change
+CREATE TABLE IF NOT EXISTS listing_proximity (
+  landmark_type TEXT NOT NULL,
+  listing_id INTEGER NOT NULL,
+  nearest_m REAL NOT NULL,
+  within_500m INTEGER NOT NULL,
+  within_1km INTEGER NOT NULL,
+  within_2km INTEGER NOT NULL,
+  PRIMARY KEY (landmark_type, listing_id),
+  FOREIGN KEY (listing_id) REFERENCES listing (id)
+) WITHOUT ROWID;
+
+-- a listing that moved is computed again by the next ingest
+CREATE TRIGGER IF NOT EXISTS listing_proximity_update AFTER UPDATE OF house_lat, house_lng ON listing
+BEGIN
+  DELETE FROM listing_proximity WHERE listing_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS listing_proximity_delete AFTER DELETE ON listing
+BEGIN
+  DELETE FROM listing_proximity WHERE listing_id = old.id;
+END;
@@ -0,0 +1,27 @@
+-- price models trained by train-model, one per city and crawled month, the id is the version stamp of the model
+-- the fitted model is a joblib file in the <database>-models folder
+CREATE TABLE IF NOT EXISTS price_model (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  city_id INTEGER NOT NULL,
+  crawled_date TEXT NOT NULL,
+  file TEXT NOT NULL,
+  trained_at TEXT NOT NULL,
+  training_rows INTEGER NOT NULL,
+  -- standard deviation of log(price) - log(predicted price) on the training listings
+  residual_std REAL NOT NULL,
+  FOREIGN KEY (city_id) REFERENCES city (id)
+);
+
+CREATE INDEX IF NOT EXISTS price_model_city_month_idx ON price_model (city_id, crawled_date, id);
+
+-- predicted price of every observed listing, by the latest model of its city up to the month
+CREATE TABLE IF NOT EXISTS listing_prediction (
+  crawled_date TEXT NOT NULL,
+  listing_id INTEGER NOT NULL,
+  model_id INTEGER NOT NULL,
+  predicted_price REAL NOT NULL,
+  residual REAL,
+  outlier INTEGER NOT NULL,
+  PRIMARY KEY (crawled_date, listing_id),
+  FOREIGN KEY (model_id) REFERENCES price_model (id)
+) WITHOUT ROWID;
@@ -0,0 +1,3 @@
+-- crawled rows are written to listing and listing_observation by housing.ingest.write_housing, set based through a staging table
+-- the trigger upserted them one row at a time, city_housing is only read from now on
+DROP TRIGGER IF EXISTS city_housing_insert;
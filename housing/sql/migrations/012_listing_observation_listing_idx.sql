@@ -0,0 +1,3 @@
+-- the months a listing was observed in, an ingest only rewrites the attributes of a listing from its latest month
+-- and looks up the earlier months whose rows change with them
+CREATE INDEX IF NOT EXISTS listing_observation_listing_idx ON listing_observation (listing_id, crawled_date);
@@ -0,0 +1,14 @@
+-- an area such as "United States" can come from several files, every file keeps its own rows
+-- so removing one file leaves the values the other files provide. the rows are imported again by the next census sync
+DROP TABLE IF EXISTS census_stats;
+
+CREATE TABLE census_stats (
+  file TEXT NOT NULL,
+  area TEXT NOT NULL,
+  fact TEXT NOT NULL,
+  position INTEGER NOT NULL,
+  value TEXT,
+  PRIMARY KEY (file, area, fact)
+);
+
+DELETE FROM census_files;
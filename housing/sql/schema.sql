@@ -1,6 +1,18 @@
 DROP TABLE IF EXISTS city;
 DROP TABLE IF EXISTS city_layout;
 DROP TABLE IF EXISTS city_housing;
+DROP TABLE IF EXISTS listing_observation;
+DROP TABLE IF EXISTS listing_proximity;
+DROP TABLE IF EXISTS listing_prediction;
+DROP TABLE IF EXISTS price_model;
+DROP TABLE IF EXISTS listing;
+DROP TABLE IF EXISTS city_housing_monthly_stats;
+DROP TABLE IF EXISTS city_housing_monthly_group_stats;
+DROP TABLE IF EXISTS city_housing_grid;
+DROP TABLE IF EXISTS city_housing_rtree;
+DROP TABLE IF EXISTS city_layout_rtree;
+DROP TABLE IF EXISTS census_stats;
+DROP TABLE IF EXISTS census_files;
 
 CREATE TABLE city (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
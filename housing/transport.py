@@ -0,0 +1,46 @@
+import base64
+import gzip
+import numpy as np
+
+
+# bodies smaller than this are sent as they are, compressing them saves less than the headers cost
+min_compress_size = 1024
+gzip_level = 6
+# brotli is optional, without it the responses are gzipped
+brotli_quality = 5
+
+
+def load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+'''
+values as one of plotly's typed arrays, {'dtype': 'f4', 'bdata': <base64 of the little-endian values>}
+a Float32Array or Float64Array on the page, without writing every float out as decimal text
+'''
+def typed_array(values, dtype):
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+'''
+the content encoding a client accepts, brotli before gzip
+'''
+def pick_encoding(accept_encodings):
+    if accept_encodings['br'] and load_brotli() is not None:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return 'identity'
+
+
+def encode_body(body, encoding):
+    if encoding == 'br':
+        return load_brotli().compress(body, quality=brotli_quality)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return body
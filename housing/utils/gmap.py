@@ -1,66 +1,213 @@
 import json
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import pandas as pd
-
-
-def fetch_gmap_data(nearby_type, coords, res, API_token, city_name, distance=5000,  maximun_page=5):
-    '''
-    fetch data from gmap about princeton nearby facilities
-    nearby_type = schools,shopping_mall
-    response may overlap, so the return type is dictionary with name as key
-    '''
-    
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={}%2C{}&radius={}&type={}&key={}".format(
-    coords[0],coords[1], distance, nearby_type, API_token)
-    response = requests.request("GET", url, headers={}, data={})
-    next_page = json.loads(response.text).get('next_page_token', None)
-    rsp_lst = json.loads(response.text).get("results")
-    for dic in rsp_lst:
-        res[dic['name']] = (nearby_type, dic['geometry']['location']['lat'], dic['geometry']['location']['lng'], dic.get('rating', 0.0), city_name)
-
-    page = 1
-    while page < maximun_page:
-        page += 1
+from requests.adapters import HTTPAdapter
+
+
+base_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+# statuses worth another try, INVALID_REQUEST is retried too when it answers a next_page_token that is not valid yet
+retry_statuses = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+
+'''
+token bucket shared by the fetcher threads
+at most `rate` requests per second on average, bursts of up to `capacity`
+'''
+class TokenBucket():
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+'''
+one page of nearby search, retried with exponential backoff on network errors,
+429/5xx responses and retryable statuses
+served from the response cache when it has the page, otherwise the request waits until not_before
+(a monotonic time) and the response is stored in the cache
+returns the parsed json
+'''
+def request_page(session, params, bucket=None, url=base_url, retries=4, backoff=1.0, timeout=30, cache=None, not_before=None):
+    if cache is not None:
+        body = cache.get(url, params)
+        if body is not None:
+            return body
+    if not_before is not None and not_before > time.monotonic():
+        time.sleep(not_before - time.monotonic())
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.HTTPError('HTTP {}'.format(response.status_code), response=response)
+            response.raise_for_status()
+            body = response.json()
+            status = body.get('status', 'OK')
+            if status in retry_statuses or (status == 'INVALID_REQUEST' and 'pagetoken' in params):
+                raise requests.RequestException('Places API status {}'.format(status))
+            if status not in ('OK', 'ZERO_RESULTS'):
+                # e.g. REQUEST_DENIED for a bad key, trying again will not help
+                raise RuntimeError('Places API status {}: {}'.format(status, body.get('error_message', '')))
+            if cache is not None:
+                cache.put(url, params, body)
+            return body
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            logging.warning('Places request failed ({}), retrying'.format(e))
+            time.sleep(backoff * 2 ** attempt)
+
+
+'''
+fetch data from gmap about nearby facilities of one city
+nearby_type = schools,shopping_mall
+response may overlap, so the return type is dictionary with name as key
+follows next_page_token, which only becomes valid a couple of seconds after it is returned
+'''
+def fetch_places(session, nearby_type, coords, API_token, city_name, distance=5000, maximun_page=5,
+                 bucket=None, url=base_url, page_token_delay=2.0, retries=4, backoff=1.0, cache=None):
+    res = dict()
+    params = {'location': '{},{}'.format(coords[0], coords[1]), 'radius': distance, 'type': nearby_type, 'key': API_token}
+    not_before = None
+    for page in range(maximun_page):
+        body = request_page(session, params, bucket=bucket, url=url, retries=retries, backoff=backoff,
+                            cache=cache, not_before=not_before)
+        for dic in body.get('results', []):
+            res[dic['name']] = (nearby_type, dic['geometry']['location']['lat'], dic['geometry']['location']['lng'], dic.get('rating', 0.0), city_name)
+        next_page = body.get('next_page_token')
         if next_page is None:
             break
-        else:
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={}%2C{}&radius={}&type={}&key={}&next_page_token={}".format(
-    coords[0], coords[1], distance, nearby_type, API_token, next_page)
-            response = requests.request("GET", url, headers={}, data={})
-            next_page = json.loads(response.text).get('next_page_token', None)
-            response_lst = json.loads(response.text)['results']
-            for dic in response_lst:
-                res[dic['name']] = (nearby_type, dic['geometry']['location']['lat'], dic['geometry']['location']['lng'], dic.get('rating', 0.0), city_name)
+        not_before = time.monotonic() + page_token_delay
+        # the token identifies the next page on its own, the search params are kept for the cache key
+        params = dict(params, pagetoken=next_page)
+    return res
+
+
+'''
+finished (city, type) pairs are appended to a json lines file together with their places
+a line cut short by a crash is ignored
+'''
+def load_checkpoint(path):
+    done = dict()
+    if path is None or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[(entry['city'], entry['type'])] = {name: tuple(place) for name, place in entry['places'].items()}
+    return done
+
+
+def save_checkpoint(path, lock, city_name, nearby_type, places):
+    if path is None:
+        return
+    line = json.dumps({'city': city_name, 'type': nearby_type, 'places': places})
+    with lock:
+        with open(path, 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+'''
+fetch every (city, coords, type) job with a pool of threads sharing one HTTP session and one rate limit
+pairs already in the checkpoint are not fetched again, so a rerun after a failure only fetches what is missing
+pages found in the response cache (a ResponseCache) are not requested at all
+returns the places of every job merged in job order, same format as fetch_places
+raises RuntimeError naming the failed pairs once all the other jobs are done
+'''
+def fetch_all_places(jobs, API_token, checkpoint=None, workers=8, rate=10, url=base_url,
+                     distance=5000, maximun_page=5, page_token_delay=2.0, retries=4, backoff=1.0, cache=None):
+    done = load_checkpoint(checkpoint)
+    missing = [(city_name, coords, nearby_type) for city_name, coords, nearby_type in jobs if (city_name, nearby_type) not in done]
+    logging.critical('========= {} place searches checkpointed, {} to fetch ========='.format(len(jobs) - len(missing), len(missing)))
+
+    bucket = TokenBucket(rate)
+    lock = threading.Lock()
+    failed = []
+
+    def fetch(job):
+        city_name, coords, nearby_type = job
+        try:
+            places = fetch_places(session, nearby_type, coords, API_token, city_name, distance, maximun_page,
+                                  bucket=bucket, url=url, page_token_delay=page_token_delay, retries=retries, backoff=backoff,
+                                  cache=cache)
+        except Exception as e:
+            logging.error('Place search failed for {} {}: {}'.format(city_name, nearby_type, e))
+            failed.append((city_name, nearby_type))
+            return
+        save_checkpoint(checkpoint, lock, city_name, nearby_type, places)
+        done[(city_name, nearby_type)] = places
+
+    with make_session(workers) as session:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, missing))
+
+    if failed:
+        raise RuntimeError('Place searches failed for {}, rerun to fetch only these'.format(failed))
+    res = dict()
+    for city_name, _, nearby_type in jobs:
+        res.update(done[(city_name, nearby_type)])
     return res
 
 
 if __name__ == "__main__":
+    import pandas as pd
     princeton_coordinates = (40.3573, -74.6672)
     ww_coordinates = (40.2983, -74.6186)
     lawrence_coordinates = (40.2778, -74.7294)
     gmap_token = open('gmap.txt').read()
-    res = dict()
-    res = fetch_gmap_data('school', princeton_coordinates, res, gmap_token)
-    res = fetch_gmap_data('school', ww_coordinates, res, gmap_token)
-    res = fetch_gmap_data('school', lawrence_coordinates, res, gmap_token)
-    res = fetch_gmap_data('shopping_mall', princeton_coordinates, res, gmap_token)
-    res = fetch_gmap_data('shopping_mall', ww_coordinates, res, gmap_token)
-    res = fetch_gmap_data('supermarket', lawrence_coordinates, res, gmap_token)
-    res = fetch_gmap_data('supermarket', princeton_coordinates, res, gmap_token)
-    res = fetch_gmap_data('supermarket', ww_coordinates, res, gmap_token)
-    res = fetch_gmap_data('supermarket', lawrence_coordinates, res, gmap_token)
-    res = fetch_gmap_data('train_station', princeton_coordinates, res, gmap_token)
-    res = fetch_gmap_data('train_station', ww_coordinates, res, gmap_token)
-    res = fetch_gmap_data('train_station', lawrence_coordinates, res, gmap_token)
-    res = fetch_gmap_data('hospital', princeton_coordinates, res, gmap_token)
-    res = fetch_gmap_data('hospital', ww_coordinates, res, gmap_token)
-    res = fetch_gmap_data('hospital', lawrence_coordinates, res, gmap_token)
-    
+    jobs = [
+        ('Princeton,NJ', princeton_coordinates, 'school'),
+        ('West Windsor,NJ', ww_coordinates, 'school'),
+        ('Lawrence,NJ', lawrence_coordinates, 'school'),
+        ('Princeton,NJ', princeton_coordinates, 'shopping_mall'),
+        ('West Windsor,NJ', ww_coordinates, 'shopping_mall'),
+        ('Lawrence,NJ', lawrence_coordinates, 'supermarket'),
+        ('Princeton,NJ', princeton_coordinates, 'supermarket'),
+        ('West Windsor,NJ', ww_coordinates, 'supermarket'),
+        ('Princeton,NJ', princeton_coordinates, 'train_station'),
+        ('West Windsor,NJ', ww_coordinates, 'train_station'),
+        ('Lawrence,NJ', lawrence_coordinates, 'train_station'),
+        ('Princeton,NJ', princeton_coordinates, 'hospital'),
+        ('West Windsor,NJ', ww_coordinates, 'hospital'),
+        ('Lawrence,NJ', lawrence_coordinates, 'hospital'),
+    ]
+    res = fetch_all_places(jobs, gmap_token)
+
     res_lst = []
     for k,v in res.items():
-        res_lst.append([k,v[0], v[1], v[2], v[3]])
+        res_lst.append([k, *v])
 
-    df = pd.DataFrame(res_lst, columns=['Name', 'Lat', 'Lng', 'Rating', 'Type'])
+    df = pd.DataFrame(res_lst, columns=['Name', 'Type', 'Lat', 'Lng', 'Rating', 'City'])
     df.to_csv('princeton_layout.csv')
-    
-
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+'''
+raised in replay only mode when a response is not in the cache
+'''
+class CacheMiss(RuntimeError):
+    pass
+
+
+'''
+on-disk cache of json responses, one file per request named after the sha256 of the request
+the request is identified by its params without the API key, e.g. (type, location, radius, pagetoken)
+entries older than ttl seconds are fetched again, the oldest files are deleted once the cache holds more than max_bytes
+in replay only mode nothing is fetched: every entry is used whatever its age and a miss raises CacheMiss
+'''
+class ResponseCache():
+    def __init__(self, directory, ttl=30 * 24 * 3600, max_bytes=256 * 1024 * 1024, replay_only=False, ignored_params=('key',)):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.ignored_params = set(ignored_params)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def request_key(self, url, params):
+        request = {k: str(v) for k, v in params.items() if k not in self.ignored_params}
+        canonical = json.dumps([url, request], sort_keys=True)
+        return hashlib.sha256(canonical.encode('utf8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, url, params):
+        path = self.path(self.request_key(url, params))
+        try:
+            age = time.time() - os.path.getmtime(path)
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and (self.replay_only or age <= self.ttl):
+            with self.lock:
+                self.hits += 1
+            return entry['body']
+        with self.lock:
+            self.misses += 1
+        if self.replay_only:
+            raise CacheMiss('No cached response for {} {}'.format(url, {k: v for k, v in params.items() if k not in self.ignored_params}))
+        return None
+
+    def put(self, url, params, body):
+        key = self.request_key(url, params)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file first so a reader never sees half an entry
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': url, 'params': {k: v for k, v in params.items() if k not in self.ignored_params}, 'body': body}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith('.json'):
+                    stat = os.stat(os.path.join(root, file))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+        return entries
+
+    def evict(self):
+        with self.lock:
+            entries = self.entries()
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                os.remove(path)
+                size -= entry_size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(entry[1] for entry in entries),
+        }
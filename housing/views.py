@@ -1,85 +1,126 @@
-from flask import Flask, render_template, request, Blueprint
-from housing.db import get_db
-import pandas as pd
-import numpy as np
+from flask import Flask, render_template, request, Blueprint, jsonify, session, abort, make_response
+from housing.db import get_db, get_data_revision
+from housing.figure_cache import figure_cache
+from housing.artifacts import read_artifact, graph_kinds
+import hashlib
 import json
-from housing.queries import get_layout_from_db, get_housing_from_db, analysis_query, get_census_data, get_monthly_price, digit_to_dollar_string
-from housing.ml_models import run_KMeans
-from housing.perference import Perference
-import plotly.express as px
-import plotly.graph_objects as go
-import plotly.utils as pu
+import math
+import os
+from functools import lru_cache
+from housing.locations import get_location
+from housing.census import get_census_table
+from housing.perference import Perference, has_form_fields
 from datetime import date
 
+# pandas, plotly, scikit-learn and the modules built on them (housing.queries, housing.spatial_grid,
+# housing.ml_models) are imported by the first request that needs them, housing.preload() imports them up front
+
 
 views = Blueprint('views', __name__)
-plotly_go_token = open('./housing/access_token/mapbox.txt').read()
+landmark_types = ['school', 'train_station', 'supermarket', 'shopping_malls', 'hospital', 'subway_station']
 today = date.today()
 month = today.strftime("%Y-%m")
-perference = Perference()
+
+
+@lru_cache(maxsize=1)
+def mapbox_token():
+    # the environment variable comes first, e.g. for a deploy or a benchmark without the token file
+    if os.environ.get('MAPBOX_TOKEN'):
+        return os.environ['MAPBOX_TOKEN']
+    with open('./housing/access_token/mapbox.txt') as f:
+        return f.read()
+
+
+'''
+preference filters of the current request
+taken from the query string or the json body when they carry any filter, otherwise from the session
+'''
+def request_perference():
+    body = request.get_json(silent=True)
+    try:
+        if has_form_fields(request.args):
+            return Perference.from_form(request.args)
+        if isinstance(body, dict) and has_form_fields(body):
+            return Perference.from_form(body)
+        return Perference.from_form(session.get('perference', {}))
+    except ValueError as e:
+        abort(400, description=str(e))
 
 
 @views.route('/<location>/customize', methods=['POST'])
 def update_custom_settings(location):
-    perference.bedroom_from = request.form.get('bedroomFrom')
-    perference.bedroom_to = request.form.get('bedroomTo')
-    perference.bathroom_from = request.form.get('bathroomFrom')
-    perference.bathroom_to = request.form.get('bathroomTo')
-    perference.aggregated_type = request.form.get('aggregatedType')
-    perference.max_posted_days = request.form.get('maxPostedDays')
+    try:
+        perference = Perference.from_form(request.form)
+    except ValueError as e:
+        abort(400, description=str(e))
+    session['perference'] = perference.to_form()
     return city_map(location)
 
 
 @views.route('/', defaults={'location': 'princeton'})
 @views.route('/<location>', methods=['GET'])
 def city_map(location):
-    city_name =  []
-    city_coords = tuple()
-
-    if location == 'nyc':
-        city_name = ['NYC,NY']
-        city_coords = (40.7128, -74.0060)
-    elif location == 'seattle':
-        city_name = ['Seattle,WA']
-        city_coords = (47.6062, -122.3321)
-    elif location == 'princeton':
-        city_name = ['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ']
-        city_coords = (40.3573, -74.6672)
-
-    additional_args = {
-        "bedroom_from": perference.bedroom_from, 
-        "bedroom_to": perference.bedroom_to,
-        "bathroom_from": perference.bathroom_from,
-        "bathroom_to": perference.bathroom_to,
-        "aggregated_type": perference.aggregated_type,
-        "max_posted_days": perference.max_posted_days
-    }
-   
+    get_location(location)
+
+    perference = request_perference()
+
     cursor = get_db()
-    summarize = analysis_query(cursor, city_name, month, kwargs=additional_args)
-    month_prices = get_monthly_price(cursor, city_name, month, kwargs=additional_args)
-    urls, lons, lats, price = get_housing_from_db(cursor, city_name, month, kwargs=additional_args)
-    
-    # table and graph on the right
-    prices = month_prices['price']
-    months = month_prices['month']
+    graphJSON_left, graphJSON_right, table = cached_view(cursor, location, 'map', perference,
+                                                         lambda: render_city_map(cursor, location, perference))
+
+    return render_template('map.html', graphJSON=[graphJSON_left, graphJSON_right], tables=[table])
+
+
+'''
+a rendered view from the figure cache, else from the artifacts of warm-cache when the filters are the defaults,
+else rendered by render and kept in the figure cache
+'''
+def cached_view(cursor, location, kind, perference, render):
+    revision = get_data_revision(cursor)
+    figure_cache.check_revision(revision)
+    cache_key = (kind, location, month, perference)
+    cached = figure_cache.get(cache_key)
+    if cached is None:
+        if perference == Perference():
+            cached = read_artifact(cursor, revision, month, location, kind)
+        if cached is None:
+            cached = render()
+        figure_cache.put(cache_key, cached, revision)
+    return cached
+
+
+'''
+build both figures and the summary table of the map page
+returns (left figure json, right figure json, table html)
+'''
+def render_city_map(cursor, location, perference):
+    import plotly.graph_objects as go
+    import plotly.utils as pu
+    from housing.queries import get_cached_layouts, get_map_panels
+    from housing.spatial_grid import get_grid
+    city_name, city_coords = get_location(location)
+    additional_args = perference.to_kwargs()
+    # with filters the listings of the month come with the panels, the grid is binned from them
+    summarize, month_prices, listings = get_map_panels(cursor, city_name, month, kwargs=additional_args, listings=False)
+
+    # table and graph on the right, the boxes are drawn from precomputed quartiles and whiskers
     fig_right = go.Figure()
-    fig_right.add_trace(go.Box(y=prices,x=months, boxpoints=False))
+    fig_right.add_trace(go.Box(x=month_prices['month'],
+                               q1=month_prices['q1'],
+                               median=month_prices['median'],
+                               q3=month_prices['q3'],
+                               lowerfence=month_prices['lower_fence'],
+                               upperfence=month_prices['upper_fence'],
+                               boxpoints=False))
     fig_right.update_layout(height=400, width=400)
     graphJSON_right = json.dumps(fig_right, cls=pu.PlotlyJSONEncoder)
 
-    # graph on the left
-    hovertemplate = 'Price: %{z} <br> More Info on: <a href="%{customdata}">Zillow Link</a>'
-    fig = go.Figure(go.Densitymapbox(lat=lats, 
-                                    lon=lons, 
-                                    z=price, 
-                                    customdata=urls,
-                                    hovertemplate=hovertemplate,
-                                    radius=30, 
-                                    opacity=1))
+    # graph on the left, binned on the server so the payload does not grow with the number of listings
+    _, grid = get_grid(cursor, location, month, kwargs=additional_args, listings=listings)
+    fig = go.Figure(grid_heatmap(grid))
 
     fig.update_layout(mapbox = {
-        'accesstoken': plotly_go_token,
+        'accesstoken': mapbox_token(),
         },
         mapbox_style="outdoors",
         mapbox_zoom=11,
@@ -88,13 +129,17 @@ def city_map(location):
         height=800, width=1000,
     )
 
-    lons, lats, names = get_layout_from_db(cursor, 'school', city_name)
+    # every landmark layer comes from one cached query
+    layouts = get_cached_layouts(cursor, city_name, revision=figure_cache.revision)
+    empty = {'lng': [], 'lat': [], 'name': []}
+
+    school = layouts.get('school', empty)
     fig.add_trace(go.Scattermapbox(
                 name='School',
                 mode = 'markers+text',
-                lon = lons,
-                lat = lats,
-                hovertext = names,
+                lon = school['lng'],
+                lat = school['lat'],
+                hovertext = school['name'],
                 marker=go.scattermapbox.Marker(
                     size=10,
                     opacity=1,
@@ -103,13 +148,13 @@ def city_map(location):
                 showlegend=True
             ))
 
-    lons, lats, names = get_layout_from_db(cursor, 'train_station', city_name)
+    train = layouts.get('train_station', empty)
     fig.add_trace(go.Scattermapbox(
                 name='Train',
                 mode = 'markers+text',
-                lon = lons, 
-                lat = lats,
-                hovertext = names,
+                lon = train['lng'],
+                lat = train['lat'],
+                hovertext = train['name'],
                 marker=go.scattermapbox.Marker(
                     size=20,
                     opacity=1,
@@ -118,17 +163,13 @@ def city_map(location):
                 showlegend=True
             ))
 
-    lons, lats, names = get_layout_from_db(cursor, 'supermarket', city_name)
-    lons2, lats2, names2 = get_layout_from_db(cursor, 'shopping_malls', city_name)
-    lons += lons2
-    lats += lats2
-    names += names2
+    supermarket, mall = layouts.get('supermarket', empty), layouts.get('shopping_malls', empty)
     fig.add_trace(go.Scattermapbox(
                 name='Shop',
                 mode = 'markers+text',
-                lon = lons, 
-                lat = lats,
-                hovertext = names,
+                lon = supermarket['lng'] + mall['lng'],
+                lat = supermarket['lat'] + mall['lat'],
+                hovertext = supermarket['name'] + mall['name'],
                 marker=go.scattermapbox.Marker(
                     size=10,
                     opacity=1,
@@ -138,13 +179,13 @@ def city_map(location):
             ))
 
 
-    lons, lats, names = get_layout_from_db(cursor, 'hospital', city_name)
+    hospital = layouts.get('hospital', empty)
     fig.add_trace(go.Scattermapbox(
                 name='Hospital',
                 mode = 'markers+text',
-                lon = lons, 
-                lat = lats,
-                hovertext = names,
+                lon = hospital['lng'],
+                lat = hospital['lat'],
+                hovertext = hospital['name'],
                 marker=go.scattermapbox.Marker(
                     size=10,
                     opacity=1,
@@ -155,42 +196,56 @@ def city_map(location):
     
     graphJSON_left = json.dumps(fig, cls=pu.PlotlyJSONEncoder)
 
-    return render_template('map.html', graphJSON=[graphJSON_left, graphJSON_right], tables=[summarize.to_html(classes='data', header="true")])
+    return graphJSON_left, graphJSON_right, summarize.to_html(classes='data', header="true")
 
 
 
 @views.route('/<location>/graph', methods=['POST'])
 def rerender_graph(location):
     graphing_type = request.form.get('graphing')
-    if location == 'nyc':
-        city_name = ['NYC,NY']
-        city_coords = (40.7128, -74.0060)
-    elif location == 'seattle':
-        city_name = ['Seattle,WA']
-        city_coords = (47.6062, -122.3321)
-    elif location == 'princeton':
-        city_name = ['Princeton,NJ', 'West Windsor,NJ', 'Lawrence,NJ']
-        city_coords = (40.3573, -74.6672)
-    
-    additional_args = {
-        "bedroom_from": perference.bedroom_from, 
-        "bedroom_to": perference.bedroom_to,
-        "bathroom_from": perference.bathroom_from,
-        "bathroom_to": perference.bathroom_to,
-        "aggregated_type": perference.aggregated_type,
-        "max_posted_days": perference.max_posted_days
-    }
+    get_location(location)
+    if graphing_type not in graph_kinds:
+        abort(400, description='graphing must be one of {}'.format(', '.join(graph_kinds)))
+
+    perference = request_perference()
     cursor = get_db()
-    urls, lons, lats, price = get_housing_from_db(cursor, city_name, month, kwargs=additional_args)
+    return cached_view(cursor, location, graphing_type, perference,
+                       lambda: render_graph(cursor, location, graphing_type, perference))
+
+
+def render_graph(cursor, location, graphing_type, perference):
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import plotly.utils as pu
+    from housing.queries import get_housing_from_db, digit_to_dollar_string
+    from housing.spatial_grid import get_grid, max_cells
+    city_name, city_coords = get_location(location)
+    # the heatmap only needs the grid cells, the other modes draw the listings
+    if graphing_type != "heatmap":
+        listings = get_housing_from_db(cursor, city_name, month, kwargs=perference.to_kwargs())
+        # a listing without a price has no marker size or price text
+        urls, lons, lats, price = [[value for value, price in zip(column, listings[3]) if price is not None] for column in listings]
+
     if graphing_type == "heatmap":
-        hovertemplate = 'Price: %{z} <br> More Info on: <a href="%{customdata}">Zillow Link</a>'
-        fig = go.Figure(go.Densitymapbox(lat=lats, 
-                                        lon=lons, 
-                                        z=price, 
-                                        customdata=urls,
-                                        hovertemplate=hovertemplate,
-                                        radius=30, 
-                                        opacity=1))
+        _, grid = get_grid(cursor, location, month, kwargs=perference.to_kwargs())
+        fig = go.Figure(grid_heatmap(grid))
+    elif graphing_type == "scatter" and len(price) > max_cells:
+        # too many points to send one by one, show one marker per grid cell instead
+        _, grid = get_grid(cursor, location, month, kwargs=perference.to_kwargs())
+        fig = go.Figure(px.scatter_mapbox(lat=grid['lat'],
+                        lon=grid['lng'],
+                        color=grid['median_price'],
+                        size=grid['listing_count'],
+                        opacity=0.6,
+                        custom_data=[digit_to_dollar_string(grid['median_price']), grid['listing_count'], grid['zillow_url']]
+                        ))
+        fig.update_traces(
+            hovertemplate="<br>".join([
+                "Median Price: %{customdata[0]}",
+                "Listings: %{customdata[1]}",
+                'URL: More Info on: <a href="%{customdata[2]}">Zillow Link</a>',
+            ])
+        )
     elif graphing_type == "scatter":
         fig = go.Figure(px.scatter_mapbox(lat=lats, 
                         lon=lons,
@@ -206,7 +261,9 @@ def rerender_graph(location):
             ])
         )
     elif graphing_type == "clustering":
-        kmeans_result = run_KMeans(lats, lons, price, urls)
+        # scikit-learn is only loaded once someone asks for the clustering
+        from housing.ml_models import cached_KMeans
+        kmeans_result = cached_KMeans((location, month, perference), location, lats, lons, price, urls, revision=figure_cache.revision)
         fig = go.Figure(px.scatter_mapbox(lat=kmeans_result["lats"], 
                                 lon=kmeans_result["lngs"], 
                                 color=kmeans_result["medium_prices"],
@@ -220,7 +277,7 @@ def rerender_graph(location):
             ])
         )
     fig.update_layout(mapbox = {
-        'accesstoken': plotly_go_token,
+        'accesstoken': mapbox_token(),
         },
         mapbox_style="outdoors",
         mapbox_zoom=11,
@@ -231,9 +288,234 @@ def rerender_graph(location):
     graphJSON = json.dumps(fig, cls=pu.PlotlyJSONEncoder)
     return graphJSON
 
+
+'''
+density trace from grid cells
+the weight of a cell is its median price times its listing count, like summing the prices of its listings
+'''
+def grid_heatmap(grid):
+    import numpy as np
+    import plotly.graph_objects as go
+    from housing.queries import digit_to_dollar_string
+    hovertemplate = 'Median Price: %{customdata[0]} <br> Listings: %{customdata[1]} <br> More Info on: <a href="%{customdata[2]}">Zillow Link</a>'
+    return go.Densitymapbox(lat=grid['lat'],
+                            lon=grid['lng'],
+                            z=grid['median_price'] * grid['listing_count'],
+                            customdata=np.column_stack([digit_to_dollar_string(grid['median_price']), grid['listing_count'], grid['zillow_url']]),
+                            hovertemplate=hovertemplate,
+                            radius=30,
+                            opacity=1)
+
+
+def request_bbox():
+    bounds = [request.args.get(name) for name in ['south', 'west', 'north', 'east']]
+    if all(bound is None for bound in bounds):
+        return None
+    try:
+        south, west, north, east = [float(bound) for bound in bounds]
+    except (TypeError, ValueError):
+        abort(400, description='south, west, north and east must all be numbers')
+    if not all(math.isfinite(bound) for bound in [south, west, north, east]) or south > north or west > east:
+        abort(400, description='south, west, north and east must be a finite box with south <= north and west <= east')
+    return south, west, north, east
+
+
+'''
+grid cells of the map for a zoom level and viewport
+columnar json, the heatmap re-requests it when the map is panned or zoomed
+'''
+@views.route('/<location>/grid', methods=['GET'])
+def map_grid(location):
+    from housing.queries import digit_to_dollar_string
+    from housing.spatial_grid import get_grid, default_zoom
+    get_location(location)
+    try:
+        zoom = int(float(request.args.get('zoom', default_zoom)))
+    except (ValueError, OverflowError):
+        abort(400, description='zoom must be a number')
+    bbox = request_bbox()
+    perference = request_perference()
+    zoom, grid = get_grid(get_db(), location, month, zoom=zoom, bbox=bbox, kwargs=perference.to_kwargs())
+    return jsonify({
+        'zoom': zoom,
+        'lat': grid['lat'].tolist(),
+        'lng': grid['lng'].tolist(),
+        'listing_count': grid['listing_count'].tolist(),
+        'median_price': grid['median_price'].tolist(),
+        'median_price_text': digit_to_dollar_string(grid['median_price']),
+        'zillow_url': grid['zillow_url'].tolist(),
+    })
+
+
+'''
+listings of this month and landmarks inside the viewport (south, west, north, east are required)
+looked up through the R*Tree indexes, columnar json
+'''
+@views.route('/<location>/viewport', methods=['GET'])
+def map_viewport(location):
+    from housing.queries import get_housing_from_db, get_layouts_from_db, digit_to_dollar_string
+    city_name, _ = get_location(location)
+    bbox = request_bbox()
+    if bbox is None:
+        abort(400, description='south, west, north and east are required')
+    perference = request_perference()
+    cursor = get_db()
+    listings = get_housing_from_db(cursor, city_name, month, kwargs=perference.to_kwargs(), bbox=bbox)
+    # the rtree only holds listings with coordinates, the price can still be missing
+    urls, lons, lats, price = [[value for value, price in zip(column, listings[3]) if price is not None] for column in listings]
+    landmarks = get_layouts_from_db(cursor, city_name, bbox=bbox)
+    for landmark_type in landmark_types:
+        landmarks.setdefault(landmark_type, {'lng': [], 'lat': [], 'name': []})
+    return jsonify({
+        'listings': {
+            'lat': lats,
+            'lng': lons,
+            'price': price,
+            'price_text': digit_to_dollar_string(price),
+            'zillow_url': urls,
+        },
+        'landmarks': landmarks,
+    })
+
+
+'''
+response with a weak ETag of key and the data revision, an If-None-Match with the same tag gets a 304 without building the body
+build returns the body as bytes, it is compressed for the Accept-Encoding of the client and kept in the figure cache
+'''
+def compact_response(cursor, key, build, mimetype='application/json'):
+    from housing.transport import pick_encoding, encode_body, min_compress_size
+    revision = get_data_revision(cursor)
+    figure_cache.check_revision(revision)
+    etag = hashlib.sha1(repr((key, revision)).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        encoding = pick_encoding(request.accept_encodings)
+        cache_key = key + (encoding, )
+        cached = figure_cache.get(cache_key)
+        if cached is None:
+            body = build()
+            if len(body) < min_compress_size:
+                encoding = 'identity'
+            cached = (encoding, encode_body(body, encoding))
+            figure_cache.put(cache_key, cached, revision)
+        encoding, body = cached
+        response = make_response(body)
+        response.mimetype = mimetype
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=True)
+    # the browser keeps the body and asks again with the tag every time
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+'''
+id, coordinates and price of the listings of this month, filtered like the map and by the viewport when one is given
+the columns are typed arrays (see housing.transport.typed_array) and the urls are left out, /listing-urls has them by id
+'''
+@views.route('/<location>/listings', methods=['GET'])
+def compact_listings(location):
+    def build():
+        import numpy as np
+        from housing.query_builder import housing_query
+        from housing.transport import typed_array
+        sql, params = housing_query(['city_housing.id', 'house_lat', 'house_lng', 'price'], city_name, month,
+                                    kwargs=perference.to_kwargs(), bbox=bbox)
+        query = cursor.cursor()
+        query.row_factory = None
+        rows = np.array(query.execute(sql, params).fetchall(), dtype=float).reshape(-1, 4)
+        # missing coordinates or prices come back as nan, the map cannot place them
+        rows = rows[np.isfinite(rows).all(axis=1)]
+        return json.dumps({
+            'count': len(rows),
+            'id': typed_array(rows[:, 0], 'u4'),
+            'lat': typed_array(rows[:, 1], 'f4'),
+            'lng': typed_array(rows[:, 2], 'f4'),
+            'price': typed_array(rows[:, 3], 'f8'),
+        }).encode()
+
+    city_name, _ = get_location(location)
+    bbox = request_bbox()
+    perference = request_perference()
+    cursor = get_db()
+    return compact_response(cursor, ('listings', location, month, perference, bbox), build)
+
+
+# ids per /listing-urls request, below the variable limit of sqlite
+max_url_ids = 1000
+
+
+'''
+zillow urls of listings by id, e.g. /listing-urls?ids=12,40,41 for the listings a user opens on the map
+'''
+@views.route('/listing-urls', methods=['GET'])
+def listing_urls():
+    try:
+        ids = tuple(sorted({int(value) for value in request.args.get('ids', '').split(',') if value.strip()}))
+    except ValueError:
+        abort(400, description='ids must be a comma separated list of listing ids')
+    if not ids or len(ids) > max_url_ids:
+        abort(400, description='between 1 and {} listing ids are required'.format(max_url_ids))
+    # sqlite integers are signed 64 bit, larger ids can not be bound
+    if ids[0] < -2 ** 63 or ids[-1] >= 2 ** 63:
+        abort(400, description='listing ids must be 64 bit integers')
+
+    def build():
+        rows = cursor.execute('select id, zillow_url from listing where id in ({})'.format(','.join('?' * len(ids))), ids).fetchall()
+        return json.dumps({'id': [row[0] for row in rows], 'zillow_url': [row[1] for row in rows]}).encode()
+
+    cursor = get_db()
+    return compact_response(cursor, ('listing-urls', ids), build)
+
+
+'''
+predicted prices of a batch of listings, columnar json in and out
+the body holds a list per feature in housing.price_model.model_features, `city` (a city name of the location)
+is required when the location has more than one city, and `price` adds the residuals and outlier flags
+?month= picks the latest models trained up to that month, this month by default
+'''
+@views.route('/<location>/predict', methods=['POST'])
+def predict(location):
+    import pandas as pd
+    from housing.price_model import model_features, predict_prices
+    city_names, _ = get_location(location)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, description='a json object with a list per feature is required')
+    columns = model_features + (['price'] if 'price' in body else [])
+    values = [body.get(column) for column in columns]
+    if not all(isinstance(value, list) for value in values) or len({len(value) for value in values}) != 1:
+        abort(400, description='{} must be lists of the same length'.format(', '.join(columns)))
+    try:
+        df = pd.DataFrame({column: pd.to_numeric(pd.Series(value, dtype=object), errors='raise') for column, value in zip(columns, values)})
+    except (TypeError, ValueError):
+        abort(400, description='feature values must be numbers or null')
+
+    cursor = get_db()
+    city_ids = dict(cursor.execute('select city_name, id from city where city_name in ({})'.format(','.join('?' * len(city_names))), city_names).fetchall())
+    cities = body.get('city', [city_names[0]] * len(df) if len(city_names) == 1 else None)
+    if not isinstance(cities, list) or len(cities) != len(df) or not all(isinstance(city, str) and city in city_ids for city in cities):
+        abort(400, description='city must be a list of {} with one city per listing'.format(', '.join(city_names)))
+
+    scores = predict_prices(cursor, [city_ids[city] for city in cities], df, request.args.get('month', month))
+    # nan is not valid json
+    response = {column: [None if value != value else value for value in scores[column].tolist()] for column in ['predicted_price', 'model_id']}
+    response['model_id'] = [None if value is None else int(value) for value in response['model_id']]
+    if 'price' in df:
+        response['residual'] = [None if value != value else value for value in scores['residual'].tolist()]
+        response['outlier'] = scores['outlier'].tolist()
+    return jsonify(response)
+
+
+@views.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(figure_cache.stats())
+
 @views.route('/city-stats', methods=['POST', 'GET'])
 def city_stats():
-    census = get_census_data('./housing/census_data')
-    return render_template('city-stats.html', tables=[census.to_html(classes='data', header="true")])
+    cursor = get_db()
+    return render_template('city-stats.html', tables=[get_census_table(cursor, get_data_revision(cursor))])
 
 